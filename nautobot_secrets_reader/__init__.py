@@ -1,5 +1,12 @@
 __version__ = "0.9.1"
 
-from .secread import SecretsReader
-
 __all__ = ["SecretsReader"]
+
+
+def __getattr__(name):
+    # Import the reader (and its dependencies) on first use, so that importing the package is fast
+    if name == "SecretsReader":
+        from .secread import SecretsReader  # pylint: disable=import-outside-toplevel
+
+        return SecretsReader
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
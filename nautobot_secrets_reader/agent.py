@@ -0,0 +1,457 @@
+"""Credential agent: a long-running process serving the credential queries of many short-lived processes.
+
+The agent keeps the Nautobot connection, the Secret Server access token and the caches of one
+`SecretsReader` in memory and answers the queries of local processes over a Unix domain socket.
+Only processes of the allowed users (default: the user running the agent) are served.
+
+Protocol: every message is a 4 byte big-endian length followed by a UTF-8 JSON object.
+A request `{"method": ..., "params": {...}}` is answered by `{"result": ...}` or
+`{"error": {"type": ..., "message": ...}}`. A connection can send any number of requests.
+Credentials are answered as dictionaries, with `"stale": true` for values served after they expired.
+"""
+import dataclasses
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import struct
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from .credentials import CredentialSet
+from .resilience import BackendUnavailableError, CircuitOpenError, DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+# Maximum size (bytes) of a message.
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+# Time (seconds) the client waits for the connection and the answer of the agent.
+DEFAULT_AGENT_TIMEOUT = 30.0
+# Time (seconds) the client waits for the agent to warm its caches (a whole fleet scope can take long).
+DEFAULT_WARM_TIMEOUT = 3600.0
+# Time (seconds) the client waits for the answer beyond the deadline of a query, for the transfer of the answer.
+DEADLINE_MARGIN = 1.0
+
+_HEADER = struct.Struct("!I")
+# Errors of an unavailable secrets provider answered by the agent, raised again by the client
+_BACKEND_ERRORS = {
+    error.__name__: error for error in (BackendUnavailableError, DeadlineExceededError, CircuitOpenError)
+}
+_PEERCRED = struct.Struct("3i")  # struct ucred: pid, uid, gid
+
+
+class AgentUnavailableError(ConnectionError):
+    """The agent can not be reached, the caller should read the credentials itself."""
+
+
+class AgentTimeoutError(AgentUnavailableError):
+    """The agent did not answer in time. It may still be working on the request."""
+
+
+class AgentError(RuntimeError):
+    """The agent failed to answer a request."""
+
+
+def send_message(sock: socket.socket, message: Any) -> None:
+    """Send a length-prefixed JSON message."""
+    data = json.dumps(message, separators=(",", ":")).encode()
+    if len(data) > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message too large ({len(data)} bytes)")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _receive_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    """Returns `size` bytes, None if the connection was closed before the first byte."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            if data:
+                raise ConnectionError("Connection closed within a message")
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def receive_message(sock: socket.socket) -> Any:
+    """Returns the next length-prefixed JSON message, None if the connection was closed."""
+    header = _receive_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ConnectionError(f"Message too large ({size} bytes)")
+    data = _receive_exactly(sock, size)
+    if data is None:
+        raise ConnectionError("Connection closed within a message")
+    return json.loads(data)
+
+
+def peer_uid(sock: socket.socket) -> Optional[int]:
+    """Returns the user id of the process connected to a Unix socket, None if not supported (non Linux)."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    _, uid, _ = _PEERCRED.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEERCRED.size))
+    return uid
+
+
+def _filter_param(value: Any) -> Any:
+    """Returns a credential filter (str or iterable of str) as JSON value."""
+    if value is None or isinstance(value, str):
+        return value
+    return list(value)
+
+
+class _AgentServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    agent: "CredentialAgent"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.connections: Set[socket.socket] = set()
+        self.connections_lock = threading.Lock()
+
+    def verify_request(self, request, client_address) -> bool:
+        return self.agent.verify_peer(request)
+
+    def close_connections(self) -> None:
+        """Close the open client connections, the clients notice that the agent is gone."""
+        with self.connections_lock:
+            connections, self.connections = self.connections, set()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class _AgentHandler(socketserver.BaseRequestHandler):
+    server: _AgentServer
+
+    def setup(self) -> None:
+        with self.server.connections_lock:
+            self.server.connections.add(self.request)
+
+    def finish(self) -> None:
+        with self.server.connections_lock:
+            self.server.connections.discard(self.request)
+
+    def handle(self) -> None:
+        while True:
+            try:
+                request = receive_message(self.request)
+            except (OSError, ValueError) as err:
+                logger.warning(f"Invalid request to the credential agent: {err!r}")
+                return
+            if request is None:
+                return
+            try:
+                send_message(self.request, self.server.agent.dispatch(request))
+            except OSError:
+                return  # The client is gone
+
+
+class CredentialAgent:
+    """Serve the credential queries of a `SecretsReader` on a Unix domain socket.
+
+    Args:
+        reader (SecretsReader): The reader answering the queries. Default: a new reader not using an agent.
+        socket_path (str): The socket. Default: setting `SECRETS_READER_AGENT_SOCKET`.
+        allowed_uids (Iterable[int]): User ids of the processes that are served. Default: the user of the agent.
+        refresh_ahead (float): Time (seconds) before a used secret expires from the cache, after which it is
+            read again in the background. `0` disables the refresher. Default: setting `SECRETS_READER_REFRESH_AHEAD`.
+
+    raises:
+        RuntimeError: If another agent is listening on the socket.
+    """
+
+    METHODS = ("ping", "get_credentials_for_device", "get_credentials_for_secrets_group_id", "cache_stats", "warm")
+
+    def __init__(
+        self,
+        reader: Any = None,
+        socket_path: Optional[str] = None,
+        allowed_uids: Optional[Iterable[int]] = None,
+        refresh_ahead: Optional[float] = None,
+    ) -> None:
+        # pylint: disable=import-outside-toplevel
+        from .secread import SecretsReader
+        from .settings import get_settings
+
+        self.reader = reader if reader is not None else SecretsReader(use_agent=False)
+        self.socket_path = socket_path or get_settings().secrets_reader_agent_socket
+        self.allowed_uids: Set[int] = set(allowed_uids) if allowed_uids is not None else {os.getuid()}
+        self.refresh_ahead = refresh_ahead if refresh_ahead is not None else get_settings().secrets_reader_refresh_ahead
+        if not hasattr(socket, "SO_PEERCRED"):
+            logger.warning("Peer credentials are not supported, the socket is protected by its permissions only.")
+        self._prepare_socket_path()
+        old_umask = os.umask(0o177)  # The socket is accessible by the owner only
+        try:
+            self._server = _AgentServer(self.socket_path, _AgentHandler)
+        finally:
+            os.umask(old_umask)
+        self._server.agent = self
+        self._thread: Optional[threading.Thread] = None
+
+    def _prepare_socket_path(self) -> None:
+        """Create the private socket directory and remove a stale socket."""
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            info = os.stat(directory)
+            if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o022:
+                raise RuntimeError(f"The socket directory {directory} must be owned by the user and private.")
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)  # Left by an agent that was not shut down
+            else:
+                raise RuntimeError(f"A credential agent is already listening on {self.socket_path}")
+            finally:
+                probe.close()
+
+    def verify_peer(self, sock: socket.socket) -> bool:
+        """Returns True if the process connected to the socket is served."""
+        uid = peer_uid(sock)
+        if uid is None or uid in self.allowed_uids:
+            return True
+        logger.warning(f"Connection of user id {uid} to the credential agent refused.")
+        return False
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the response to a request."""
+        method = request.get("method") if isinstance(request, dict) else None
+        if method not in self.METHODS:
+            return dict(error=dict(type="AgentError", message=f"Unknown method {method!r}"))
+        try:
+            if method == "ping":
+                return dict(result=dict(pid=os.getpid()))
+            func: Callable[..., Any] = getattr(self.reader, method)
+            result = func(**(request.get("params") or {}))
+            if method == "warm":
+                result = dataclasses.asdict(result)
+            elif isinstance(result, CredentialSet):
+                result = result.to_dicts(stale=True)
+            return dict(result=result)
+        except Exception as err:  # pylint: disable=broad-except
+            logger.error(f"Credential agent request {method!r} failed: {err!r}")
+            return dict(error=dict(type=type(err).__name__, message=str(err)))
+
+    def serve_forever(self) -> None:
+        """Serve the requests until `shutdown()` is called."""
+        logger.info(f"Credential agent listening on {self.socket_path}")
+        refresher = self.refresh_ahead > 0 and hasattr(self.reader, "start_refresher")
+        try:
+            if refresher:
+                try:
+                    self.reader.start_refresher(margin=self.refresh_ahead)
+                except Exception as err:  # pylint: disable=broad-except
+                    refresher = False
+                    logger.error(f"The cache refresher of the credential agent can not be started: {err!r}")
+            self._server.serve_forever()
+        finally:
+            if refresher:
+                self.reader.stop_refresher()
+
+    def start(self) -> "CredentialAgent":
+        """Serve the requests in a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="credential-agent", daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self) -> None:
+        """Stop serving requests, close the socket and remove the socket file."""
+        if self._thread is not None:
+            if self._thread.is_alive():  # shutdown() waits for a running serve_forever() only
+                self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        self._server.close_connections()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "CredentialAgent":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.shutdown()
+
+
+class AgentClient:
+    """Send credential queries to the agent. Every thread uses its own connection, kept open between calls.
+
+    Args:
+        socket_path (str): The socket of the agent.
+        timeout (float): Time (seconds) to wait for the connection and the answer of the agent.
+        server_uid (int): User id the agent must run as, checked with the peer credentials of the connection.
+            Default: not checked.
+    """
+
+    def __init__(
+        self, socket_path: str, timeout: float = DEFAULT_AGENT_TIMEOUT, server_uid: Optional[int] = None
+    ) -> None:
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.server_uid = server_uid
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as err:
+            sock.close()
+            raise AgentUnavailableError(f"Credential agent not reachable on {self.socket_path}: {err}") from err
+        uid = peer_uid(sock) if self.server_uid is not None else None
+        if uid is not None and uid != self.server_uid:
+            sock.close()
+            logger.warning(f"The credential agent on {self.socket_path} runs as user id {uid}, it is not used.")
+            raise AgentUnavailableError(f"Credential agent on {self.socket_path} runs as another user (id {uid})")
+        return sock
+
+    def close(self) -> None:
+        """Close the connection of the calling thread."""
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            self._local.sock = None
+            sock.close()
+
+    def call(
+        self, method: str, timeout: Optional[float] = None, params: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> Any:
+        """Returns the result of a request to the agent.
+
+        A broken connection (e.g. after the agent was restarted) is opened again once.
+
+        Args:
+            method (str): The method of the agent.
+            timeout (float): Time (seconds) to wait for the answer. Default: `timeout` of the client.
+            params (Dict[str, Any]): The parameters of the method, e.g. its own `timeout`.
+            kwargs: Further parameters of the method.
+
+        raises:
+            AgentUnavailableError: If the agent can not be reached.
+            AgentTimeoutError: If the agent did not answer in time.
+            ValueError: If the agent answered with a ValueError, e.g. for an unsupported secrets provider.
+            BackendUnavailableError: If the agent could not reach a secrets provider in time.
+            AgentError: If the agent answered with another error.
+        """
+        request = dict(method=method, params={**(params or {}), **kwargs})
+        for attempt in (1, 2):
+            sock = getattr(self._local, "sock", None)
+            reused = sock is not None
+            if sock is None:
+                sock = self._local.sock = self._connect()
+            try:
+                sock.settimeout(self.timeout if timeout is None else timeout)
+                send_message(sock, request)
+                response = receive_message(sock)
+                if response is None:
+                    raise ConnectionError("Connection closed by the credential agent")
+                break
+            except OSError as err:
+                self.close()
+                if isinstance(err, TimeoutError):  # Not sent again, the agent may still be working on it
+                    raise AgentTimeoutError(f"Credential agent request {method!r} timed out") from err
+                if not reused or attempt == 2:
+                    raise AgentUnavailableError(f"Credential agent request failed: {err}") from err
+        if "error" in response:
+            error = response["error"]
+            if error.get("type") == "ValueError":
+                raise ValueError(error.get("message"))
+            backend_error = _BACKEND_ERRORS.get(error.get("type"))
+            if backend_error is not None:
+                raise backend_error(error.get("message"))
+            raise AgentError(f"{error.get('type')}: {error.get('message')}")
+        return response["result"]
+
+    def get_credentials_for_device(
+        self, device_name: str, access_type: Any = None, secret_type: Any = None, timeout: Optional[float] = None
+    ) -> Any:
+        return self._query(
+            "get_credentials_for_device",
+            timeout,
+            device_name=device_name,
+            access_type=_filter_param(access_type),
+            secret_type=_filter_param(secret_type),
+        )
+
+    def get_credentials_for_secrets_group_id(
+        self, secrets_group_id: str, access_type: Any = None, secret_type: Any = None, timeout: Optional[float] = None
+    ) -> Any:
+        return self._query(
+            "get_credentials_for_secrets_group_id",
+            timeout,
+            secrets_group_id=secrets_group_id,
+            access_type=_filter_param(access_type),
+            secret_type=_filter_param(secret_type),
+        )
+
+    def _query(self, method: str, timeout: Optional[float], **params: Any) -> Any:
+        """Returns the result of a credential query with the deadline `timeout` (seconds), applied by the agent.
+
+        raises:
+            DeadlineExceededError: If the agent did not answer within the deadline.
+        """
+        if not timeout or timeout <= 0:
+            return self.call(method, params=params)
+        try:
+            return self.call(method, timeout=timeout + DEADLINE_MARGIN, params=dict(params, timeout=timeout))
+        except AgentTimeoutError as err:
+            raise DeadlineExceededError(f"The credential agent did not answer within {timeout}s.") from err
+
+    def warm(
+        self,
+        device_filter: Optional[Dict[str, Any]] = None,
+        device_names: Optional[Iterable[str]] = None,
+        access_type: Any = None,
+        secret_type: Any = None,
+    ) -> Dict[str, Any]:
+        return self.call(
+            "warm",
+            timeout=DEFAULT_WARM_TIMEOUT,
+            device_filter={name: _filter_param(value) for name, value in (device_filter or {}).items()} or None,
+            device_names=list(device_names or []),
+            access_type=_filter_param(access_type),
+            secret_type=_filter_param(secret_type),
+        )
+
+
+def agent_client(socket_path: Optional[str] = None) -> Optional[AgentClient]:
+    """Returns a client of the agent if its socket exists and can be trusted, else None.
+
+    The default socket path is predictable (see `settings.default_agent_socket()`), another local user could
+    create it first. A socket at the default path is only used if it and its directory are owned by the user,
+    the directory is private, and the agent runs as the user. A socket configured explicitly (setting
+    `SECRETS_READER_AGENT_SOCKET`) is trusted, e.g. the agent of another user started with `--allow-uid`.
+
+    Args:
+        socket_path (str): The socket of the agent. Default: setting `SECRETS_READER_AGENT_SOCKET`.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .settings import default_agent_socket, get_settings
+
+    if socket_path is None:
+        socket_path = get_settings().secrets_reader_agent_socket
+    try:
+        info = os.stat(socket_path)
+        if not stat.S_ISSOCK(info.st_mode):
+            return None
+        if socket_path != default_agent_socket(os.environ):
+            return AgentClient(socket_path)
+        directory = os.stat(os.path.dirname(socket_path))
+    except OSError:
+        return None
+    uid = os.getuid()
+    if info.st_uid != uid or directory.st_uid != uid or stat.S_IMODE(directory.st_mode) & 0o077:
+        logger.warning(f"The credential agent socket {socket_path} is not private to the user, it is not used.")
+        return None
+    return AgentClient(socket_path, server_uid=uid)
@@ -0,0 +1,320 @@
+"""Asyncio API: access secrets provided by Nautobot secrets providers without blocking the event loop.
+
+Requires the optional dependency `httpx` (`pip install nautobot-secrets-reader[async]`).
+"""
+import asyncio
+import json
+import logging
+import ssl
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+from . import metrics
+from .cache import SecretCache
+from .credentials import Credential, CredentialSet
+from .delinea import DEFAULT_TOKEN_REFRESH_MARGIN, ThycoticSecretServerSecretsReader, normalize_secret_path
+from .nbinfo import SecretGroupinfo
+from .secread import CredentialFilter, SecretsReader, filter_associations
+from .settings import DEFAULT_MAX_WORKERS, get_settings
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Default number of concurrent secret requests of a secrets group.
+DEFAULT_MAX_CONCURRENCY = DEFAULT_MAX_WORKERS
+
+
+def _ssl_context(ca_bundle_path: Optional[str]) -> Any:
+    """Returns the `verify` argument of httpx for the trusted certificates file."""
+    if ca_bundle_path:
+        return ssl.create_default_context(cafile=ca_bundle_path)
+    return True
+
+
+class AsyncSecretServerClient:
+    """Non-blocking client of the Thycotic/Delinea Secret Server REST API.
+
+    The OAuth access token is kept until `token_refresh_margin` seconds before it expires.
+
+    Args:
+        config (Dict[str, Any]): The `thycotic` configuration of `ThycoticSecretServerSecretsReader`.
+        transport (httpx.AsyncBaseTransport): (optional) The httpx transport, e.g. for tests.
+    """
+
+    TOKEN_PATH_URI = "/oauth2/token"
+    API_PATH_URI = "/api/v1"
+
+    def __init__(self, config: Dict[str, Any], transport: Optional[Any] = None) -> None:
+        self.config = config
+        if config["cloud_based"]:
+            self.base_url = f"https://{config['tenant']}.secretservercloud.com"
+        else:
+            self.base_url = str(config["base_url"]).rstrip("/")
+        self.client = httpx.AsyncClient(verify=_ssl_context(config["ca_bundle_path"]), transport=transport)
+        self._access_token: Optional[str] = None
+        self._expires = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def aclose(self) -> None:
+        """Close the HTTP connections."""
+        await self.client.aclose()
+
+    async def access_token(self) -> str:
+        """Returns the OAuth access token, requesting a new one if it is (nearly) expired."""
+        if not all([self.config["username"], self.config["password"]]):
+            return self.config["token"]
+        margin = self.config.get("token_refresh_margin", DEFAULT_TOKEN_REFRESH_MARGIN)
+        async with self._token_lock:
+            if self._access_token is None or time.monotonic() >= self._expires - margin:
+                grant_request = {
+                    "username": self.config["username"],
+                    "password": self.config["password"],
+                    "grant_type": "password",
+                }
+                if self.config["domain"]:
+                    grant_request["domain"] = self.config["domain"]
+                with metrics.timed("secret_server.oauth_grant"):
+                    response = await self.client.post(self.base_url + self.TOKEN_PATH_URI, data=grant_request)
+                grant = self._process(response)
+                self._access_token = grant["access_token"]
+                self._expires = time.monotonic() + grant["expires_in"]
+            return self._access_token  # type: ignore
+
+    @staticmethod
+    def _process(response: Any) -> Any:
+        """Returns the JSON content of the response, raising ValueError if the call was unsuccessful."""
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("message") or response.json().get("error")
+            except ValueError:
+                message = response.text
+            raise ValueError(f"Thycotic Secret Server error: {message or response.status_code}")
+        try:
+            return response.json()
+        except json.JSONDecodeError as err:  # TSS returns a 200 (OK) containing HTML for some error conditions
+            raise ValueError(f"Thycotic Secret Server error: {response.text}") from err
+
+    async def get_secret_fields(self, secret_id=None, secret_path=None) -> Dict[str, Any]:
+        """Returns the field values of a secret by field slug.
+
+        Args:
+            secret_id (str): The secret ID.
+            secret_path (str): The secret path (used if secret_id is None).
+        """
+        headers = {"Authorization": f"Bearer {await self.access_token()}"}
+        url = f"{self.base_url}{self.API_PATH_URI}/secrets/{secret_id if secret_id is not None else 0}"
+        params = {} if secret_id is not None else {"secretPath": normalize_secret_path(secret_path)}
+        with metrics.timed("secret_server.get"):
+            secret = self._process(await self.client.get(url, params=params, headers=headers))
+        fields = {}
+        for item in secret["items"]:
+            if item.get("fileAttachmentId"):
+                with metrics.timed("secret_server.get"):
+                    response = await self.client.get(f"{url}/fields/{item['slug']}", params=params, headers=headers)
+                if response.status_code >= 400:
+                    self._process(response)
+                item["itemValue"] = response.text
+            fields[item["slug"]] = item["itemValue"]
+        return fields
+
+
+class AsyncSecretsReader:
+    """Asyncio version of `SecretsReader`.
+
+    Nautobot and the Secret Server are accessed with non-blocking HTTP requests. The secrets of a group
+    are read concurrently (at most `max_concurrency` requests at a time), and concurrent requests for the
+    same secret share one in-flight request. Secrets of other providers than Thycotic are read in the
+    default executor.
+
+    Use as async context manager, or call `aclose()` when done:
+
+        async with AsyncSecretsReader() as reader:
+            credentials = await reader.get_credentials_for_device("ATKPTEST", access_type="SSH")
+
+    Args:
+        cache_ttl (float): Time (seconds) a secret is cached. Default: see `SecretsReader`.
+        cache_max_entries (int): Maximum number of cached secrets. Default: see `SecretsReader`.
+        max_concurrency (int): Maximum number of concurrent secret requests.
+            Default: environment variable `SECRETS_READER_MAX_WORKERS` or 8.
+        transport (httpx.AsyncBaseTransport): (optional) The httpx transport, e.g. for tests.
+    """
+
+    def __init__(
+        self,
+        cache_ttl: Optional[float] = None,
+        cache_max_entries: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        transport: Optional[Any] = None,
+    ) -> None:
+        if httpx is None:
+            raise ImportError(
+                "AsyncSecretsReader requires 'httpx'. Install it with: pip install nautobot-secrets-reader[async]"
+            )
+        # The synchronous reader provides the configuration, the credential format and the other providers
+        self._reader = SecretsReader(
+            cache_ttl=cache_ttl, cache_max_entries=cache_max_entries, max_workers=max_concurrency, use_agent=False
+        )
+        self.nbot: SecretGroupinfo = self._reader.nbot
+        self.cache: SecretCache = self._reader.cache
+        if max_concurrency is None:
+            max_concurrency = get_settings().secrets_reader_max_workers
+        self.max_concurrency = max_concurrency
+        self._transport = transport
+        self._nautobot: Optional[Any] = None
+        self._tss: Optional[AsyncSecretServerClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    async def __aenter__(self) -> "AsyncSecretsReader":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the HTTP connections."""
+        if self._nautobot is not None:
+            await self._nautobot.aclose()
+            self._nautobot = None
+        if self._tss is not None:
+            await self._tss.aclose()
+            self._tss = None
+
+    @property
+    def nautobot(self) -> Any:
+        """Returns the HTTP client for Nautobot (created on first use)."""
+        if self._nautobot is None:
+            self._nautobot = httpx.AsyncClient(
+                base_url=str(self.nbot.nautobot_api_endpoint).rstrip("/"),
+                headers={"Authorization": f"Token {self.nbot.nautobot_token}", "Accept": "application/json"},
+                transport=self._transport,
+            )
+        return self._nautobot
+
+    @property
+    def tss(self) -> AsyncSecretServerClient:
+        """Returns the Secret Server client (created on first use)."""
+        if self._tss is None:
+            self._tss = AsyncSecretServerClient(ThycoticSecretServerSecretsReader().config, transport=self._transport)
+        return self._tss
+
+    async def _graphql(self, query: str, variables: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Returns the data of a Nautobot GraphQL query or None on error."""
+        with metrics.timed("nautobot.graphql"):
+            response = await self.nautobot.post("/api/graphql/", json={"query": query, "variables": variables})
+        content = response.json() if response.status_code < 500 else {}
+        if response.status_code >= 400 or content.get("errors"):
+            logger.error(f"Error querying Nautobot: {content.get('errors') or response.status_code}")
+            return None
+        return content["data"]
+
+    async def _single_flight(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `fetch`, or wait for the running fetch of the same key."""
+        future = self._in_flight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            async with self._semaphore:
+                result = await fetch()
+        except BaseException as err:
+            future.set_exception(err)
+            future.exception()  # Mark as retrieved, if nobody else is waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    async def get_secret_fields(self, secret_id=None, secret_path=None) -> Dict[str, Any]:
+        """Returns the field values of a Thycotic secret, using the cache.
+
+        raises:
+            ValueError: If the secret can not be read from Secret Server.
+        """
+        key = ThycoticSecretServerSecretsReader.cache_key(secret_id=secret_id, secret_path=secret_path)
+        fields = self.cache.get(key)
+        if fields is not None:
+            return fields
+
+        async def fetch() -> Dict[str, Any]:
+            fields = await self.tss.get_secret_fields(secret_id=secret_id, secret_path=secret_path)
+            self.cache.set(key, fields)
+            return fields
+
+        return dict(await self._single_flight(key, fetch))
+
+    async def _read_secret(self, sec_info: Dict[str, Any]) -> Any:
+        """Read the secret value of a secrets group association."""
+        provider = sec_info["secret"]["provider"]
+        parameters = sec_info["secret"]["parameters"]
+        try:
+            if provider in ("thycotic-tss-id", "thycotic-tss-path"):
+                secret_id = parameters.get("secret_id")
+                secret_path = None if secret_id is not None else parameters["secret_path"]
+                fields = await self.get_secret_fields(secret_id=secret_id, secret_path=secret_path)
+                value: Any = fields.get(parameters["secret_selected_value"])
+                if value is None:
+                    value = KeyError(f"Secret field '{parameters['secret_selected_value']}' not found.")
+            else:
+                value = await asyncio.get_running_loop().run_in_executor(None, self._reader._read_secret, sec_info)
+        except ValueError as err:
+            value = err
+        return SecretsReader._secret_value(sec_info, value)
+
+    async def read_credentials(
+        self,
+        secrets_group_data: Dict[str, Any],
+        access_type: CredentialFilter = None,
+        secret_type: CredentialFilter = None,
+    ) -> CredentialSet:
+        """Read and Parse secrets_group_data and return a list of all credentials in secrets group.
+
+        See `SecretsReader.read_credentials()`.
+        """
+        if secrets_group_data is None:
+            return CredentialSet()
+        associations = filter_associations(
+            SecretsReader._associations(secrets_group_data), access_type=access_type, secret_type=secret_type
+        )
+        for sec_info in associations:
+            self._reader.get_provider(sec_info["secret"]["provider"])  # raises ValueError if not supported
+        values = await asyncio.gather(*(self._read_secret(sec_info) for sec_info in associations))
+        return CredentialSet(
+            Credential.from_association(sec_info, value) for sec_info, value in zip(associations, values)
+        )
+
+    async def get_credentials_for_device(
+        self, device_name: str, access_type: CredentialFilter = None, secret_type: CredentialFilter = None
+    ) -> CredentialSet:
+        """Get credentials for device. See `SecretsReader.get_credentials_for_device()`."""
+        data = await self._graphql(SecretGroupinfo.DEVICES_GRAPHQL_QUERY, {"device_names": [device_name]})
+        if data is None or len(data["devices"]) != 1:
+            return CredentialSet()
+        _, secrets_group = SecretGroupinfo._device_secrets_group(data["devices"][0])
+        if secrets_group is None:
+            return CredentialSet()
+        return await self.read_credentials(
+            {"secrets_group": secrets_group}, access_type=access_type, secret_type=secret_type
+        )
+
+    async def get_credentials_for_secrets_group_id(
+        self, secrets_group_id: str, access_type: CredentialFilter = None, secret_type: CredentialFilter = None
+    ) -> CredentialSet:
+        """Get credentials for secrets group id. See `SecretsReader.get_credentials_for_secrets_group_id()`."""
+        data = await self._graphql(SecretGroupinfo.GRAPHQL_QUERY, {"secrets_group_id": secrets_group_id})
+        if data is None:
+            return CredentialSet()
+        return await self.read_credentials(data, access_type=access_type, secret_type=secret_type)
+
+    def filter_access_type(self, credentials: Iterable[Dict[str, Any]], access_type: str) -> Dict[str, Any]:
+        """Filter credentials by access type. See `SecretsReader.filter_access_type()`."""
+        return self._reader.filter_access_type(credentials, access_type)
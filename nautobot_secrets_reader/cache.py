@@ -0,0 +1,453 @@
+"""Bounded in-memory cache for secret values."""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from . import metrics
+from .resilience import current_deadline
+from .settings import (  # noqa: F401
+    DEFAULT_CACHE_MAX_ENTRIES,
+    DEFAULT_CACHE_TTL,
+    DEFAULT_REFRESH_AHEAD,
+    DEFAULT_STALE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def wipe_secret(value: Any) -> None:
+    """Remove the secret values from a cached object.
+
+    Python strings are immutable, so the values can not be overwritten in memory. The references to
+    them are dropped, so that they are no longer reachable through the cache. Byte arrays are zeroed.
+
+    Args:
+        value (Any): The evicted cache value.
+    """
+    if isinstance(value, dict):
+        for key in value:
+            value[key] = None
+        value.clear()
+    elif isinstance(value, bytearray):
+        value[:] = bytes(len(value))
+
+
+class StaleValue(str):
+    """A secret value served from the cache after it expired, because the secrets provider was unavailable."""
+
+    __slots__ = ()
+
+
+def mark_stale(value: Any) -> Any:
+    """Returns the value with its strings (or the strings of a dictionary) marked as `StaleValue`."""
+    if isinstance(value, dict):
+        return {key: mark_stale(item) for key, item in value.items()}
+    if isinstance(value, str):
+        return StaleValue(value)
+    return value
+
+
+def is_stale(value: Any) -> bool:
+    """Returns True if the value was served from the cache after it expired (see `SecretCache.get_stale()`)."""
+    return isinstance(value, StaleValue)
+
+
+class _CacheEntry:
+    """A cached value, the time it expires, the function loading it and if it was read since it was loaded."""
+
+    __slots__ = ("value", "expires", "loader", "used")
+
+    def __init__(
+        self, value: Any, expires: float, loader: Optional[Callable[[], Any]] = None, used: bool = True
+    ) -> None:
+        self.value = value
+        self.expires = expires
+        self.loader = loader
+        self.used = used
+
+
+class _Call:
+    """A running `SingleFlight` call."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key.
+
+    While a call for a key is running, other threads calling `do()` with the same key wait for it and
+    receive its result (or exception) instead of calling the function again.
+    """
+
+    def __init__(self) -> None:
+        self.coalesced = 0  # Number of calls answered by a running call
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Call `func`, or wait for the running call of the same key.
+
+        Args:
+            key (Hashable): The key identifying the call.
+            func (Callable[[], Any]): The function to call.
+
+        Returns:
+            Any: The result of the call. Dictionaries are returned as copies to the waiting threads.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            # Within a deadline the running call is awaited at most the time left
+            current = current_deadline()
+            if not call.done.wait(None if current is None else current.remaining()):
+                current.check("The coalesced call")  # type: ignore
+            if call.error is not None:
+                raise call.error
+            return dict(call.value) if isinstance(call.value, dict) else call.value
+        try:
+            value = func()
+            call.value = dict(value) if isinstance(value, dict) else value
+            return value
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class SecretCache:
+    """Thread-safe TTL cache with least recently used (LRU) eviction.
+
+    Keys are tuples of the provider and the secret id or path, e.g. `("thycotic-tss-id", "1234")`.
+    Values are wiped with `wipe_secret()` when they expire, are evicted or invalidated. Cached
+    dictionaries are returned as copies, so that wiping does not affect values already handed out.
+
+    Args:
+        ttl (float): Time (seconds) an entry is valid. `0` disables the cache.
+        max_entries (int): Maximum number of entries before the least recently used entry is evicted.
+        stale_ttl (float): Time (seconds) an expired entry is kept for `get_stale()`. `0`: expired entries are dropped.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_CACHE_TTL,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+        stale_ttl: float = DEFAULT_STALE_TTL,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Entries refreshed even if they are not read, with their loader (see keep_warm())
+        self._keep_warm: Dict[Hashable, Callable[[], Any]] = {}
+        self._keeping_warm = 0
+        self._flights = SingleFlight()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[Any]:
+        """Returns the cached value or None if the key is not cached or expired.
+
+        Args:
+            key (Hashable): The cache key.
+            count (bool): Update the hit/miss counters.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and entry.expires <= now:
+                if entry.expires + self.stale_ttl <= now:
+                    self._discard(key)
+                entry = None
+            if entry is None:
+                value = None
+            else:
+                self._entries.move_to_end(key)
+                entry.used = True
+                if self._keeping_warm and entry.loader is not None:
+                    self._keep_warm[key] = entry.loader
+                value = dict(entry.value) if isinstance(entry.value, dict) else entry.value
+        if count:
+            self.count_lookup(value is not None)
+        return value
+
+    def get_stale(self, key: Hashable) -> Optional[Any]:
+        """Returns the value of an entry that is valid or expired less than `stale_ttl` seconds ago.
+
+        Call it if the value can not be read again from the secrets provider. Expired values are returned
+        marked with `mark_stale()`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is None or entry.expires + self.stale_ttl <= now:
+                return None
+            value = dict(entry.value) if isinstance(entry.value, dict) else entry.value
+            stale = entry.expires <= now
+        if not stale:
+            return value
+        metrics.count("cache_stale_served", cache="secrets")
+        return mark_stale(value)
+
+    def count_lookup(self, hit: bool) -> None:
+        """Count a cache hit or miss, e.g. of a secret whose entries were read with `get(key, count=False)`."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.count("cache_hits" if hit else "cache_misses", cache="secrets")
+
+    def set(
+        self, key: Hashable, value: Any, ttl: Optional[float] = None, loader: Optional[Callable[[], Any]] = None
+    ) -> None:
+        """Store a value in the cache.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value to cache.
+            ttl (float): Time (seconds) the entry is valid. Defaults to the cache TTL.
+            loader (Callable[[], Any]): (optional) Loads the value again, for the refresh ahead of its expiry.
+        """
+        self._store(key, value, ttl, loader=loader)
+
+    def _store(
+        self, key: Hashable, value: Any, ttl: Optional[float] = None, loader: Optional[Callable[[], Any]] = None
+    ) -> None:
+        """Store a value and the function loading it, for the refresh ahead of its expiry."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            if isinstance(value, dict):
+                value = dict(value)
+            self._entries[key] = _CacheEntry(value, time.monotonic() + ttl, loader)
+            if self._keeping_warm and loader is not None:
+                self._keep_warm[key] = loader
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self._keep_warm.pop(oldest, None)
+                evicted += 1
+            self.evictions += evicted
+        if evicted:
+            metrics.count("cache_evictions", evicted, cache="secrets")
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Returns the cached value, or loads and caches it.
+
+        Concurrent calls for the same uncached key call `loader` only once; the other threads wait
+        for its result.
+
+        Args:
+            key (Hashable): The cache key.
+            loader (Callable[[], Any]): Returns the value if it is not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def load() -> Any:
+            # A call that has just finished may have filled the cache
+            value = self.get(key, count=False)
+            if value is None:
+                value = loader()
+                self._store(key, value, loader=loader)
+            return value
+
+        return self._flights.do(key, load)
+
+    def coalesce(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Call `func`, or wait for the result of the running call with the same key (see `SingleFlight`).
+
+        Use keys that differ from the keys of the cache entries, those are used by `get_or_load()`.
+        """
+        return self._flights.do(key, func)
+
+    @contextmanager
+    def keep_warm(self) -> Iterator[None]:
+        """Keep the entries loaded or read within the context warm.
+
+        `refresh_ahead()` refreshes them even if they are not read, and loads them again if they were
+        invalidated or could not be refreshed in time. They are kept warm until they are evicted or the cache is cleared.
+        """
+        with self._lock:
+            self._keeping_warm += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._keeping_warm -= 1
+
+    def refresh_ahead(self, margin: float = DEFAULT_REFRESH_AHEAD) -> int:
+        """Load again the entries expiring within `margin` seconds, so that the readers do not wait for them.
+
+        Entries stored by `get_or_load()` are refreshed if they were read since they were loaded (or just
+        loaded), or if they are kept warm (see `keep_warm()`); other entries expire. An entry that can not
+        be loaded keeps its value until it expires.
+
+        Returns:
+            int: The number of refreshed entries.
+        """
+        now = time.monotonic()
+        with self._lock:
+            due: List[Tuple[Hashable, Callable[[], Any]]] = [
+                (key, entry.loader)
+                for key, entry in self._entries.items()
+                if entry.loader is not None
+                and (entry.used or key in self._keep_warm)
+                and now < entry.expires <= now + margin
+            ]
+            due.extend(
+                (key, loader)
+                for key, loader in self._keep_warm.items()
+                if key not in self._entries or self._entries[key].expires <= now
+            )
+        refreshed = 0
+        for key, loader in due:
+
+            def reload(key: Hashable = key, loader: Callable[[], Any] = loader) -> Any:
+                # Readers waiting for the same key join this call and receive its value
+                value = loader()
+                self._store(key, value, loader=loader)
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        entry.used = False
+                return value
+
+            try:
+                self._flights.do(key, reload)
+            except Exception as err:  # pylint: disable=broad-except
+                logger.warning(f"Error refreshing the cached secret {key}: {err!r}")
+                metrics.count_error("cache_refresh", err)
+            else:
+                refreshed += 1
+        if refreshed:
+            with self._lock:
+                self.refreshes += refreshed
+            metrics.count("cache_refreshes", refreshed, cache="secrets")
+        return refreshed
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Remove an entry from the cache.
+
+        Returns:
+            bool: True if the entry was cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._discard(key)
+            return True
+
+    def invalidate_prefix(self, prefix: Tuple[Hashable, ...]) -> int:
+        """Remove the entry of a key and the entries whose (tuple) key starts with it, e.g. the fields of a secret.
+
+        Returns:
+            int: The number of removed entries.
+        """
+        size = len(prefix)
+        with self._lock:
+            keys = [key for key in self._entries if isinstance(key, tuple) and key[:size] == prefix]
+            for key in keys:
+                self._discard(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+            self._keep_warm.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the cache statistics."""
+        return dict(
+            entries=len(self._entries),
+            max_entries=self.max_entries,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            coalesced=self._flights.coalesced,
+            refreshes=self.refreshes,
+        )
+
+    def _discard(self, key: Hashable) -> None:
+        """Remove and wipe an entry. The lock must be held by the caller."""
+        entry = self._entries.pop(key)
+        wipe_secret(entry.value)
+        entry.value = None
+
+
+class CacheRefresher:
+    """Background thread calling `SecretCache.refresh_ahead()` periodically.
+
+    Args:
+        cache (SecretCache): The cache to refresh.
+        margin (float): Time (seconds) before the expiry of an entry, after which it is refreshed.
+            Should be smaller than the TTL of the cache.
+        interval (float): Time (seconds) between the checks. Default: `margin / 2`, at most 30 seconds.
+    """
+
+    def __init__(
+        self, cache: SecretCache, margin: float = DEFAULT_REFRESH_AHEAD, interval: Optional[float] = None
+    ) -> None:
+        self.cache = cache
+        self.margin = margin
+        self.interval = interval if interval is not None else max(min(margin / 2, 30.0), 0.1)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "CacheRefresher":
+        """Start the refresher thread."""
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="secrets-cache-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the refresher thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.cache.refresh_ahead(self.margin)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Error refreshing the secrets cache")
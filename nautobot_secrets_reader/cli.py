@@ -0,0 +1,173 @@
+"""Command line interface: `nautobot-secrets-reader <command>`."""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+from typing import Any, Dict, List, Optional
+
+
+def _terminate(signum, frame) -> None:
+    raise SystemExit(0)
+
+
+def run_agent(args: argparse.Namespace) -> int:
+    """Run the credential agent until it is terminated."""
+    from .agent import CredentialAgent  # pylint: disable=import-outside-toplevel
+
+    allowed_uids = [os.getuid()] + args.allow_uid if args.allow_uid else None
+    agent = CredentialAgent(socket_path=args.socket, allowed_uids=allowed_uids)
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.shutdown()
+    return 0
+
+
+def device_filter_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    """Returns the Nautobot device filter of the `--site`, `--role`, `--tag` and `--filter` arguments."""
+    device_filter: Dict[str, Any] = {}
+    for name in ("site", "role", "tag"):
+        if getattr(args, name):
+            device_filter[name] = getattr(args, name)
+    for item in args.filter or []:
+        name, separator, value = item.partition("=")
+        if not separator:
+            raise SystemExit(f"Invalid filter {item!r}, expected NAME=VALUE")
+        device_filter.setdefault(name, []).append(value)
+    return device_filter
+
+
+def run_warm(args: argparse.Namespace) -> int:
+    """Read the credentials of the devices matching the filter into the caches of the agent."""
+    from .agent import agent_client  # pylint: disable=import-outside-toplevel
+
+    device_filter = device_filter_from_args(args)
+    if not device_filter and not args.device:
+        raise SystemExit("Select the devices with --site, --role, --tag, --filter or --device.")
+    client = agent_client()
+    if client is None:
+        # The caches of this process are gone when it exits
+        raise SystemExit("The credential agent is not running, start it with: nautobot-secrets-reader agent")
+    result = client.warm(device_filter or None, args.device, access_type=args.access_type, secret_type=args.secret_type)
+    print(json.dumps(result, indent=2))
+    return 1 if result["errors"] else 0
+
+
+def run_export(args: argparse.Namespace) -> int:
+    """Write the credentials of the devices matching the filter to a file or stdout."""
+    # pylint: disable=import-outside-toplevel
+    from .export import export_credentials
+    from .secread import SecretsReader
+
+    device_filter = device_filter_from_args(args)
+    if not device_filter and not args.device:
+        raise SystemExit("Select the devices with --site, --role, --tag, --filter or --device.")
+    if args.output in (None, "-"):
+        fp = sys.stdout
+    else:
+        # The file contains secrets: readable by the owner only
+        fp = os.fdopen(os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w")
+    try:
+        result = export_credentials(
+            SecretsReader(),
+            fp,
+            export_format=args.format,
+            device_filter=device_filter or None,
+            device_names=args.device,
+            access_type=args.access_type,
+            secret_type=args.secret_type,
+            order=args.order,
+            max_in_flight=args.max_in_flight,
+            page_size=args.page_size,
+        )
+    except ValueError as err:
+        raise SystemExit(str(err)) from err
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+    print(json.dumps(dict(devices=result.devices, errors=result.errors), indent=2), file=sys.stderr)
+    return 1 if result.errors else 0
+
+
+def _add_device_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments selecting the devices and their credentials."""
+    parser.add_argument("--site", action="append", help="Devices of this site (slug)")
+    parser.add_argument("--role", action="append", help="Devices of this role (slug)")
+    parser.add_argument("--tag", action="append", help="Devices with this tag (slug)")
+    parser.add_argument(
+        "--filter", action="append", metavar="NAME=VALUE", help="Further filter of the GraphQL devices query"
+    )
+    parser.add_argument("--device", action="append", metavar="NAME", help="The device")
+    parser.add_argument("--access-type", action="append", help="Only read the credentials of this access type")
+    parser.add_argument("--secret-type", action="append", help="Only read the credentials of this secret type")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="nautobot-secrets-reader", description="Read the secrets of Nautobot secrets groups."
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log debug messages")
+    commands = parser.add_subparsers(dest="command", required=True)
+    agent = commands.add_parser(
+        "agent", help="Run the credential agent, serving the credential queries of local processes"
+    )
+    agent.add_argument("--socket", help="Unix socket of the agent (default: setting SECRETS_READER_AGENT_SOCKET)")
+    agent.add_argument(
+        "--allow-uid",
+        type=int,
+        action="append",
+        metavar="UID",
+        help="Serve the processes of this user id too (default: only the user running the agent)",
+    )
+    agent.set_defaults(func=run_agent)
+    warm = commands.add_parser(
+        "warm", help="Read the credentials of the devices matching a Nautobot filter into the caches of the agent"
+    )
+    _add_device_arguments(warm)
+    warm.set_defaults(func=run_warm)
+    export = commands.add_parser(
+        "export", help="Write the credentials of the devices matching a Nautobot filter as JSONL or inventory"
+    )
+    _add_device_arguments(export)
+    export.add_argument(
+        "--format",
+        choices=("jsonl", "nornir", "ansible"),
+        default="jsonl",
+        help="JSON Lines, Nornir SimpleInventory hosts file or Ansible dynamic inventory (default: jsonl)",
+    )
+    export.add_argument("-o", "--output", metavar="FILE", help="Output file, created readable by the owner only")
+    export.add_argument(
+        "--order",
+        choices=("input", "completion"),
+        default="input",
+        help="Write the devices in the order they are listed or as soon as they are read (default: input)",
+    )
+    export.add_argument(
+        "--max-in-flight",
+        type=int,
+        metavar="N",
+        help="Devices read concurrently (default: setting SECRETS_READER_MAX_WORKERS)",
+    )
+    export.add_argument(
+        "--page-size", type=int, metavar="N", help="Devices per Nautobot request (default: NAUTOBOT_GRAPHQL_PAGE_SIZE)"
+    )
+    export.set_defaults(func=run_export)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""Compact credential records and indexed sets of credentials."""
+import logging
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union, overload
+
+from .cache import is_stale, mark_stale
+
+logger = logging.getLogger(__name__)
+
+# Keys of a credential, in the order of the dictionaries returned by `to_dict()`
+CREDENTIAL_FIELDS = (
+    "access_type",
+    "secret_type",
+    "secret_name",
+    "secret_slug",
+    "secret_id",
+    "secret_provider",
+    "secret_description",
+    "value",
+)
+
+
+def _intern(value: Any) -> Any:
+    """Returns the interned string, so that equal metadata of many devices is stored once."""
+    return sys.intern(value) if type(value) is str else value  # pylint: disable=unidiomatic-typecheck
+
+
+class Credential:
+    """A credential of a secrets group: the association, the secret metadata and the secret value.
+
+    The credential is read like the dictionaries returned before (`cred["value"]`, `cred.get("value")`,
+    `dict(cred)`) and by attribute (`cred.value`). It is read-only, because the credentials of a secrets
+    group are shared by all devices using the group. The metadata strings are interned.
+    """
+
+    __slots__ = CREDENTIAL_FIELDS
+
+    access_type: str
+    secret_type: str
+    secret_name: str
+    secret_slug: str
+    secret_id: str
+    secret_provider: str
+    secret_description: str
+    value: Any
+
+    def __init__(
+        self,
+        access_type: str,
+        secret_type: str,
+        secret_name: str = "",
+        secret_slug: str = "",
+        secret_id: str = "",
+        secret_provider: str = "",
+        secret_description: str = "",
+        value: Any = "",
+    ) -> None:
+        setter = object.__setattr__
+        setter(self, "access_type", _intern(access_type))
+        setter(self, "secret_type", _intern(secret_type))
+        setter(self, "secret_name", _intern(secret_name))
+        setter(self, "secret_slug", _intern(secret_slug))
+        setter(self, "secret_id", _intern(secret_id))
+        setter(self, "secret_provider", _intern(secret_provider))
+        setter(self, "secret_description", _intern(secret_description))
+        setter(self, "value", value)
+
+    @classmethod
+    def from_association(cls, sec_info: Dict[str, Any], value: Any = "") -> "Credential":
+        """Returns the credential of a secrets group association and its secret value."""
+        secret = sec_info["secret"]
+        return cls(
+            sec_info["access_type"],  #     e.g.: 'SSH'
+            sec_info["secret_type"],  #           'PASSWORD'
+            secret["name"],  #                    'Checkpoint FWDC - USR'
+            secret["slug"],  #                    'checkpoint_fwdc-usr'
+            secret["id"],  #                      '7d195c23-2e2c-4ced-b496-b7e524205a62'
+            secret["provider"],  #                'thycotic-tss-id'
+            secret["description"],  #             'Datacenter Firewall Cluster'
+            value,
+        )
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "Credential":
+        """Returns the credential of a dictionary as returned by `to_dict()`.
+
+        With `"stale": true` (see `to_dict(stale=True)`), the value is marked as stale.
+        """
+        credential = cls(**{name: data[name] for name in CREDENTIAL_FIELDS if name in data})
+        if data.get("stale"):
+            object.__setattr__(credential, "value", mark_stale(credential.value))
+        return credential
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"Credential is read-only, can not set {name!r}")
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in CREDENTIAL_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in CREDENTIAL_FIELDS else default
+
+    def keys(self) -> Tuple[str, ...]:
+        return CREDENTIAL_FIELDS
+
+    def __contains__(self, key: object) -> bool:
+        return key in CREDENTIAL_FIELDS
+
+    def to_dict(self, stale: bool = False) -> Dict[str, Any]:
+        """Returns the credential as dictionary.
+
+        Args:
+            stale (bool): Add `"stale": true` if the value is stale, e.g. for the credential agent protocol,
+                where the `StaleValue` marker is lost in JSON.
+        """
+        result = {name: getattr(self, name) for name in CREDENTIAL_FIELDS}
+        if stale and self.stale:
+            result["stale"] = True
+        return result
+
+    @property
+    def stale(self) -> bool:
+        """Returns True if the value is the last known value, served because the secrets provider was unavailable."""
+        return is_stale(self.value)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Credential):
+            return all(getattr(self, name) == getattr(other, name) for name in CREDENTIAL_FIELDS)
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        # The secret value is not shown
+        return (
+            f"Credential(access_type={self.access_type!r}, secret_type={self.secret_type!r}, "
+            f"secret_name={self.secret_name!r}, secret_provider={self.secret_provider!r})"
+        )
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, name) for name in CREDENTIAL_FIELDS))
+
+
+class CredentialSet(Sequence[Any]):
+    """The credentials of a secrets group, indexed by access type and secret type (case insensitive).
+
+    The set is a read-only sequence of `Credential`s (or `LazyCredential`s), so that code iterating
+    over the list of dictionaries returned before keeps working. `to_dicts()` returns that list.
+
+    Args:
+        credentials (Iterable): The credentials.
+    """
+
+    __slots__ = ("_credentials", "_by_access_type", "_by_secret_type", "_by_types")
+
+    def __init__(self, credentials: Iterable[Any] = ()) -> None:
+        self._credentials: Tuple[Any, ...] = tuple(credentials)
+        self._by_access_type: Dict[str, List[Any]] = {}
+        self._by_secret_type: Dict[str, List[Any]] = {}
+        self._by_types: Dict[Tuple[str, str], Any] = {}
+        for cred in self._credentials:
+            access_type = cred["access_type"].lower()
+            secret_type = cred["secret_type"].lower()
+            self._by_access_type.setdefault(access_type, []).append(cred)
+            self._by_secret_type.setdefault(secret_type, []).append(cred)
+            self._by_types[(access_type, secret_type)] = cred
+
+    @classmethod
+    def from_dicts(cls, credentials: Iterable[Mapping[str, Any]]) -> "CredentialSet":
+        """Returns the set of the credential dictionaries, e.g. as answered by the credential agent.
+
+        Values flagged with `"stale": true` are marked as stale (see `Credential.stale`).
+        """
+        return cls(Credential.from_dict(cred) for cred in credentials)
+
+    @classmethod
+    def of(cls, credentials: Union["CredentialSet", Iterable[Any]]) -> "CredentialSet":
+        """Returns `credentials` if it is a `CredentialSet`, else the set of the credentials."""
+        if isinstance(credentials, CredentialSet):
+            return credentials
+        return cls(credentials)
+
+    @overload
+    def __getitem__(self, index: int) -> Any: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "CredentialSet": ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CredentialSet(self._credentials[index])
+        return self._credentials[index]
+
+    def __len__(self) -> int:
+        return len(self._credentials)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._credentials)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (CredentialSet, list, tuple)):
+            return list(self._credentials) == list(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"CredentialSet({list(self._credentials)!r})"
+
+    @property
+    def stale(self) -> bool:
+        """Returns True if a value is the last known value (see `Credential.stale`). Lazy credentials are not read."""
+        return any(isinstance(cred, Credential) and cred.stale for cred in self._credentials)
+
+    def by_access_type(self, access_type: str) -> List[Any]:
+        """Returns the credentials of an access type, e.g. 'SSH'."""
+        return list(self._by_access_type.get(access_type.lower(), ()))
+
+    def by_secret_type(self, secret_type: str) -> List[Any]:
+        """Returns the credentials of a secret type, e.g. 'PASSWORD'."""
+        return list(self._by_secret_type.get(secret_type.lower(), ()))
+
+    def find(self, access_type: str, secret_type: str) -> Optional[Any]:
+        """Returns the (last) credential of an access type and secret type, None if there is none."""
+        return self._by_types.get((access_type.lower(), secret_type.lower()))
+
+    def filter_access_type(self, access_type: str) -> Dict[str, Any]:
+        """Returns the secret values of an access type by secret type (lower case), e.g. `{'password': ...}`.
+
+        If several credentials have the same secret type, the last is returned (as before) and a warning
+        is logged.
+        """
+        access_type = access_type.lower()
+        result: Dict[str, Any] = {}
+        for cred in self._by_access_type.get(access_type, ()):
+            secret_type = cred["secret_type"].lower()
+            selected = self._by_types[(access_type, secret_type)]
+            if cred is not selected:
+                logger.warning(
+                    f"Several {cred['access_type']} credentials of secret type {cred['secret_type']}, "
+                    f"ignoring secret {cred['secret_name']!r}."
+                )
+                continue
+            result[secret_type] = cred["value"]
+        return result
+
+    def to_dicts(self, stale: bool = False) -> List[Dict[str, Any]]:
+        """Returns the credentials as list of dictionaries (see `Credential.to_dict()`)."""
+        return [cred.to_dict(stale=stale) for cred in self._credentials]
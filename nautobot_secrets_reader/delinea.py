@@ -1,39 +1,468 @@
 """Secrets Provider for Thycotic Secret Server."""
+import json
+import logging
 import os
+import re
+import tempfile
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, Optional
-from dotenv import load_dotenv
+from typing import Any, Dict, Hashable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import requests
 
 from delinea.secrets.server import (
     AccessTokenAuthorizer,
+    Authorizer,
     PasswordGrantAuthorizer,
-    DomainPasswordGrantAuthorizer,
     SecretServerCloud,
     SecretServer,
     ServerSecret,
+    SecretServerClientError,
     SecretServerError,
+    SecretServerServiceError,
+)
+
+
+from . import metrics
+from .cache import SecretCache
+from .providers import SecretsProvider
+from .resilience import (
+    DEFAULT_CIRCUIT_FAILURES,
+    DEFAULT_CIRCUIT_MAX_RESET,
+    DEFAULT_CIRCUIT_RESET,
+    BackendUnavailableError,
+    CircuitBreaker,
+    DeadlineExceededError,
+    current_deadline,
 )
+from .sessions import PooledSession, get_session
+from .settings import DEFAULT_TOKEN_REFRESH_MARGIN, Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+# Number of secrets per request when listing the secrets of a folder tree.
+FOLDER_LISTING_PAGE_SIZE = 500
+
+
+class SecretNotFoundError(SecretServerClientError):
+    """Secret Server answered 404 (Not Found), e.g. the secret was deleted."""
+
+
+class RefreshingPasswordGrantAuthorizer(PasswordGrantAuthorizer):
+    """Password grant authorizer that keeps the OAuth access token until it is about to expire.
+
+    The SDK authorizer adds its drift to the token lifetime, so an expired token is still used for
+    up to five minutes. This authorizer requests a new token `refresh_margin` seconds *before* the
+    token expires and serializes the refresh, so that threads sharing the client trigger only one
+    password grant. The grant is requested through `session` (default: a new `PooledSession`) with
+    the TLS verification `verify`.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        domain: Optional[str] = None,
+        refresh_margin: int = DEFAULT_TOKEN_REFRESH_MARGIN,
+        session: Optional[requests.Session] = None,
+        verify: Union[bool, str] = True,
+    ) -> None:
+        super().__init__(base_url=base_url, username=username, password=password)
+        if domain is not None:
+            self.grant_request["domain"] = domain
+        self.refresh_margin = refresh_margin
+        self.session = session if session is not None else PooledSession()
+        self.verify = verify
+        self._lock = threading.Lock()
+
+    def get_access_grant(self, token_url, grant_request):  # pylint: disable=arguments-differ
+        """Gets an OAuth2 access grant from the Secret Server token endpoint.
+
+        raises:
+            SecretServerError: If the server does not return a valid access grant.
+        """
+        with metrics.timed("secret_server.oauth_grant"):
+            response = self.session.post(token_url, grant_request, verify=self.verify)
+        try:  # TSS returns a 200 (OK) containing HTML for some error conditions
+            return json.loads(SecretServer.process(response).content)
+        except json.JSONDecodeError as err:
+            raise SecretServerError(response) from err
+
+    def _token_is_valid(self) -> bool:
+        """Returns True if the current access token does not expire within the refresh margin."""
+        if not hasattr(self, "access_grant"):
+            return False
+        expires_at = self.access_grant_refreshed + timedelta(seconds=self.access_grant["expires_in"])
+        return datetime.now() < expires_at - timedelta(seconds=self.refresh_margin)
+
+    def _refresh(self, seconds_of_drift=300):
+        """Requests a new OAuth access grant if the current token is (nearly) expired. The lock must be held."""
+        if not self._token_is_valid():
+            self.access_grant = self.get_access_grant(self.token_url, self.grant_request)
+            self.access_grant_refreshed = datetime.now()
+
+    def get_access_token(self) -> str:
+        """Returns the access token, requesting a new access grant if it is (nearly) expired."""
+        with self._lock:
+            self._refresh()
+            return self.access_grant["access_token"]
+
+    def invalidate(self, rejected_token: Optional[str] = None) -> None:
+        """Forget an access token rejected by Secret Server, so that the next request performs a new password grant.
+
+        Args:
+            rejected_token (str): The rejected token. If another thread has already replaced it, the current
+                token is kept. None: forget the current token.
+        """
+        with self._lock:
+            if hasattr(self, "access_grant") and rejected_token in (None, self.access_grant["access_token"]):
+                del self.access_grant
+
+
+class SessionSecretServer(SecretServer):
+    """Secret Server client that sends its requests through a `requests.Session`.
+
+    The trusted certificates are passed with every request (`verify`), instead of through the
+    process-wide environment variable `REQUESTS_CA_BUNDLE`, so that clients are safe to use from
+    many threads.
+
+    Args:
+        base_url (str): The base URL, e.g. `https://pw.example.local/SecretServer`.
+        authorizer (Authorizer): The authorization method.
+        session (requests.Session): (optional) The HTTP session. Default: a new `PooledSession`.
+        verify (Union[bool, str]): TLS verification: True, False or the path of the trusted certificates file.
+        breaker (CircuitBreaker): (optional) Suspends the requests while Secret Server is unavailable.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        authorizer: Authorizer,
+        session: Optional[requests.Session] = None,
+        verify: Union[bool, str] = True,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        super().__init__(base_url=base_url, authorizer=authorizer)
+        self.session = session if session is not None else PooledSession()
+        self.verify = verify
+        self.breaker = breaker if breaker is not None else CircuitBreaker("Thycotic Secret Server", failures=0)
+
+    def _get(self, endpoint_url: str, query_params: Optional[Dict[str, Any]] = None) -> requests.Response:
+        """GET a REST API endpoint, raising SecretServerError if the call was unsuccessful.
+
+        If Secret Server rejects the access token (401, e.g. revoked or expired early), the token of a
+        `RefreshingPasswordGrantAuthorizer` is invalidated and the request is retried once with a new token.
+
+        Connection errors, timeouts and server errors (5xx) are recorded by the circuit `breaker`, requests
+        cut short by the deadline of the caller (see `resilience.deadline()`) are not.
+
+        raises:
+            BackendUnavailableError: If Secret Server can not be reached, does not answer in time, answers
+                with a server error or its circuit is open.
+        """
+        with metrics.timed("secret_server.get"):
+            self.breaker.before_call()
+            success: Optional[bool] = False
+            try:
+                token = self.authorizer.get_access_token()  # Requests the OAuth access grant if necessary
+                headers = self.authorizer.add_bearer_token_authorization_header(token)
+                response = self.session.get(endpoint_url, params=query_params, headers=headers, verify=self.verify)
+                if response.status_code == 401 and isinstance(self.authorizer, RefreshingPasswordGrantAuthorizer):
+                    metrics.count("secret_server_token_rejections")
+                    # Concurrent requests rejected with the same token request one new grant
+                    self.authorizer.invalidate(token)
+                    headers = self.headers()
+                    response = self.session.get(endpoint_url, params=query_params, headers=headers, verify=self.verify)
+                success = response.status_code < 500
+                if response.status_code == 404:
+                    try:
+                        self.process(response)
+                    except SecretServerClientError as err:
+                        raise SecretNotFoundError(err.message) from err
+                return self.process(response)
+            except SecretServerClientError:
+                success = True  # Secret Server answered, e.g. the OAuth grant was rejected
+                raise
+            except SecretServerServiceError as err:
+                raise BackendUnavailableError(f"Thycotic Secret Server error: {err.message}") from err
+            except requests.RequestException as err:
+                current = current_deadline()
+                if current is not None and current.expired:
+                    success = None
+                    current.check("The Secret Server request")
+                raise BackendUnavailableError(f"Thycotic Secret Server is unavailable: {err!r}") from err
+            except DeadlineExceededError:
+                success = None
+                raise
+            finally:
+                self.breaker.record(success)
+
+    def get_secret_json(self, id, query_params=None):  # pylint: disable=redefined-builtin
+        return self._get(f"{self.api_url}/secrets/{id}", query_params).text
+
+    def get_folder_json(self, id, query_params=None, get_all_children=True):  # pylint: disable=redefined-builtin
+        query_params = dict(query_params or {})
+        if get_all_children:
+            query_params["getAllChildren"] = "true"
+        return self._get(f"{self.api_url}/folders/{id}", query_params).text
+
+    def search_secrets(self, query_params=None):
+        return self._get(f"{self.api_url}/secrets", query_params).text
+
+    def get_secret_field(self, id, slug: str) -> str:  # pylint: disable=redefined-builtin
+        """Returns the value of one field of a secret, the content of a file attachment field.
+
+        Args:
+            id (int): The secret id.
+            slug (str): The field slug, e.g. 'password'.
+
+        raises:
+            SecretNotFoundError: If the secret or the field does not exist.
+            SecretServerError: If the REST API call fails for any other reason.
+        """
+        response = self._get(f"{self.api_url}/secrets/{id}/fields/{slug}")
+        if "json" in response.headers.get("Content-Type", ""):
+            # Text fields are returned as JSON string
+            try:
+                return json.loads(response.text)
+            except json.JSONDecodeError as err:
+                raise SecretServerError(response.text) from err
+        return response.text
+
+    def get_secret(self, id, fetch_file_attachments=True, query_params=None):  # pylint: disable=redefined-builtin
+        response = self.get_secret_json(id, query_params=query_params)
+        try:
+            secret = json.loads(response)
+        except json.JSONDecodeError as err:
+            raise SecretServerError(response) from err
+        if fetch_file_attachments:
+            for item in secret["items"]:
+                if item["fileAttachmentId"]:
+                    item["itemValue"] = self._get(
+                        f"{self.api_url}/secrets/{id}/fields/{item['slug']}", query_params
+                    ).text
+        return secret
+
 
+def normalize_secret_path(secret_path: str) -> str:
+    """Returns the path as sent to Secret Server by the SDK (`get_secret_by_path()`): single backslashes,
+    one leading and no trailing one.
+    """
+    return "\\" + re.sub(r"[\\/]+", r"\\", str(secret_path)).strip("\\")
 
-from .helpers import is_truthy
+
+class PathIndexEntry(NamedTuple):
+    """Secret of a path in the `SecretPathIndex`, with the location used to detect a moved secret."""
+
+    secret_id: int
+    folder_id: Optional[int]
+    name: str
+
+    @classmethod
+    def of(cls, secret: Dict[str, Any]) -> "PathIndexEntry":
+        """Returns the entry of a secret as returned by the REST API (`id`, `folderId` and `name`)."""
+        return cls(int(secret["id"]), secret.get("folderId"), secret["name"])
+
+    def matches(self, secret: Dict[str, Any]) -> bool:
+        """Returns True if the secret read by id is still at the indexed location (not moved or renamed)."""
+        return secret.get("folderId") == self.folder_id and secret.get("name") == self.name
+
+
+class SecretPathIndex:
+    """Index of the Secret Server secret ids by secret path.
+
+    Reading a secret by id is faster than the lookup by path, so the path of a secret is resolved once
+    (or the paths of a whole folder tree are listed with `ThycoticSecretServerSecretsReader.index_folder()`)
+    and the secret is read by id afterwards. An entry is dropped when the id is not found anymore or the
+    secret was moved or renamed.
+
+    Args:
+        file (str): (optional) JSON file the index is kept in across processes, readable by the owner only.
+            The file contains secret ids and paths, no secret values.
+        base_url (str): The Secret Server of the index. A file of another Secret Server is not used.
+    """
+
+    def __init__(self, file: Optional[str] = None, base_url: str = "") -> None:
+        self.file = os.path.expanduser(file) if file else None
+        self.base_url = base_url
+        self._entries: Dict[str, PathIndexEntry] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    normalize = staticmethod(normalize_secret_path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, secret_path: str) -> Optional[PathIndexEntry]:
+        """Returns the indexed secret of a path, None if the path is not indexed."""
+        return self._entries.get(self.normalize(secret_path))
+
+    def set(self, secret_path: str, entry: PathIndexEntry) -> None:
+        """Index the secret of a path."""
+        self.update({secret_path: entry})
+
+    def update(self, entries: Dict[str, PathIndexEntry]) -> None:
+        """Index the secrets of many paths (the file is written once)."""
+        with self._lock:
+            for secret_path, entry in entries.items():
+                self._entries[self.normalize(secret_path)] = entry
+            self._save()
+
+    def invalidate(self, secret_path: str) -> bool:
+        """Remove the entry of a path. Returns True if the path was indexed."""
+        with self._lock:
+            if self._entries.pop(self.normalize(secret_path), None) is None:
+                return False
+            self._save()
+            return True
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+    def _load(self) -> None:
+        """Read the index file, if it exists and belongs to the Secret Server."""
+        if not self.file:
+            return
+        try:
+            with open(self.file, encoding="utf-8") as fp:
+                data = json.load(fp)
+            if data.get("base_url") == self.base_url:
+                self._entries = {path: PathIndexEntry(*entry) for path, entry in data["paths"].items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as err:
+            logger.warning(f"The secret path index {self.file} can not be read, it is rebuilt: {err!r}")
+
+    def _save(self) -> None:
+        """Replace the index file (atomically), if the index is kept in a file. Call with the lock held."""
+        if not self.file:
+            return
+        directory = os.path.dirname(os.path.abspath(self.file))
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".path-index-")  # Created with mode 0600
+            with os.fdopen(handle, "w", encoding="utf-8") as fp:
+                json.dump(dict(base_url=self.base_url, paths=self._entries), fp)
+            os.replace(temp_path, self.file)
+        except OSError as err:
+            logger.warning(f"The secret path index {self.file} can not be written: {err!r}")
+
+
+# Process-wide Secret Server clients, keyed by the connection parameters.
+_clients: Dict[Tuple[Any, ...], SessionSecretServer] = {}
+_clients_lock = threading.Lock()
+
+
+def get_secret_server_client(config: Dict[str, Any]) -> SessionSecretServer:
+    """Returns the shared, authenticated Secret Server client for the given configuration.
+
+    The client (and with it the OAuth access token) is created once per process and reused by all
+    `ThycoticSecretServerSecretsReader` instances with the same connection parameters.
+
+    Args:
+        config (Dict[str, Any]): The `thycotic` configuration of `ThycoticSecretServerSecretsReader`.
+
+    Returns:
+        SessionSecretServer: The Secret Server client.
+    """
+    key = tuple(
+        config[name]
+        for name in ("base_url", "cloud_based", "tenant", "username", "password", "token", "domain", "ca_bundle_path")
+    )
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _create_secret_server_client(config)
+            _clients[key] = client
+        return client
+
+
+def reset_secret_server_clients() -> None:
+    """Drop all shared Secret Server clients (e.g. after the credentials have changed)."""
+    with _clients_lock:
+        _clients.clear()
+
+
+def _create_secret_server_client(config: Dict[str, Any]) -> SessionSecretServer:
+    """Create a new Secret Server client from the configuration."""
+    if config["cloud_based"]:
+        base_url = SecretServerCloud.URL_TEMPLATE.format(config["tenant"], SecretServerCloud.DEFAULT_TLD)
+    else:
+        base_url = config["base_url"]
+    username = config["username"]
+    password = config["password"]
+    domain = config["domain"]
+    session = get_session("SECRET_SERVER")
+    verify = config["ca_bundle_path"] or True
+    # Setup thycotic authorizer
+    # Username | Password | Token | Domain | Authorizer
+    #   def    |   def    |   *   |   -    | PasswordGrantAuthorizer
+    #   def    |   def    |   *   |  def   | DomainPasswordGrantAuthorizer
+    #    -     |    -     |  def  |   *    | AccessTokenAuthorizer
+    #   def    |    -     |  def  |   *    | AccessTokenAuthorizer
+    #    -     |   def    |  def  |   *    | AccessTokenAuthorizer
+    thy_authorizer: Authorizer
+    if all([username, password]):
+        thy_authorizer = RefreshingPasswordGrantAuthorizer(
+            base_url=base_url,
+            username=username,
+            password=password,
+            domain=domain or None,
+            refresh_margin=config.get("token_refresh_margin", DEFAULT_TOKEN_REFRESH_MARGIN),
+            session=session,
+            verify=verify,
+        )
+    else:
+        thy_authorizer = AccessTokenAuthorizer(config["token"])
+
+    breaker = CircuitBreaker(
+        "Thycotic Secret Server",
+        failures=config.get("circuit_failures", DEFAULT_CIRCUIT_FAILURES),
+        reset_timeout=config.get("circuit_reset", DEFAULT_CIRCUIT_RESET),
+        max_reset_timeout=config.get("circuit_max_reset", DEFAULT_CIRCUIT_MAX_RESET),
+    )
+    # Get the client.
+    return SessionSecretServer(
+        base_url=base_url, authorizer=thy_authorizer, session=session, verify=verify, breaker=breaker
+    )
 
 
 class ThycoticSecretServerSecretsReader:
-    """Class to read secrets from Thycotic/Delinea Secret Server."""
+    """Class to read secrets from Thycotic/Delinea Secret Server.
+
+    The reader is thread-safe: the Secret Server client is shared, concurrent requests for the same
+    uncached secret are answered by one Secret Server request (see `SecretCache.get_or_load()`), and
+    the last secret used by `get()` is kept per thread.
+
+    Secrets configured by path are read by id once their path is in the `path_index`.
+    `get_secret_field_values()` reads only the requested fields of a secret (see `field_fetch_max`).
+
+    Args:
+        cache (SecretCache): Cache for the secret fields returned by `get_secret_fields()`.
+            A private cache is created if not specified.
+        settings (Settings): The configuration. Default: `get_settings()`.
+    """
 
     CONFIG: Dict[str, Any] = {}  # Configuration values are read from environment variables.
-    _secret: Optional[ServerSecret] = None  # Cashed result of get_secret()
-    _param_secret_id: Optional[str] = None  # Parameter used to retireve the cached secret.
-    _param_secret_path: Optional[str] = None  # Parameter used to retireve the cached secret.
 
-    def __init__(self) -> None:
-        load_dotenv()  # Load environment variables from .env file.
+    def __init__(self, cache: Optional[SecretCache] = None, settings: Optional[Settings] = None) -> None:
+        self.cache = cache if cache is not None else SecretCache()
+        # Result of the last query_thycotic_secret_server() of the thread (_secret) and its parameters
+        self._last = threading.local()
+        if settings is None:
+            settings = get_settings()
         self.CONFIG = {
             "thycotic": {  # https://github.com/thycotic/python-tss-sdk
-                "base_url": os.getenv("SECRET_SERVER_BASE_URL"),
-                "cloud_based": is_truthy(os.getenv("SECRET_SERVER_IS_CLOUD_BASED", "False")),
+                "base_url": settings.secret_server_base_url,
+                "cloud_based": settings.secret_server_is_cloud_based,
                 # tenant: required when cloud_based == True
-                "tenant": os.getenv("SECRET_SERVER_TENANT", ""),
+                "tenant": settings.secret_server_tenant,
                 # Setup thycotic authorizer
                 # Username | Password | Token | Domain | Authorizer
                 #   def    |   def    |   *   |   -    | PasswordGrantAuthorizer
@@ -41,22 +470,60 @@ class ThycoticSecretServerSecretsReader:
                 #    -     |    -     |  def  |   *    | AccessTokenAuthorizer
                 #   def    |    -     |  def  |   *    | AccessTokenAuthorizer
                 #    -     |   def    |  def  |   *    | AccessTokenAuthorizer
-                "username": os.getenv("SECRET_SERVER_USERNAME", ""),
-                "password": os.getenv("SECRET_SERVER_PASSWORD", ""),
-                "token": os.getenv("SECRET_SERVER_TOKEN", ""),
-                "domain": os.getenv("SECRET_SERVER_DOMAIN", ""),
+                "username": settings.secret_server_username,
+                "password": settings.secret_server_password,
+                "token": settings.secret_server_token,
+                "domain": settings.secret_server_domain,
                 # ca_bundle_path: (optional) Path to trusted certificates file.
-                #     This must be set as environment variable.
+                #     It is passed to every Secret Server request, the environment is not changed.
                 #     see: https://docs.python-requests.org/en/master/user/advanced/
-                "ca_bundle_path": os.getenv("REQUESTS_CA_BUNDLE", ""),
+                "ca_bundle_path": settings.requests_ca_bundle,
+                # token_refresh_margin: (optional) Seconds before expiry at which the OAuth token is renewed.
+                "token_refresh_margin": settings.secret_server_token_refresh_margin,
+                # circuit_*: (optional) Consecutive failures after which the requests are suspended, and for how long.
+                "circuit_failures": settings.secret_server_circuit_failures,
+                "circuit_reset": settings.secret_server_circuit_reset,
+                "circuit_max_reset": settings.secret_server_circuit_max_reset,
             }
         }
+        self.path_index: Optional[SecretPathIndex] = None
+        if settings.secret_server_path_index:
+            self.path_index = SecretPathIndex(
+                settings.secret_server_path_index_file or None,
+                base_url=(
+                    settings.secret_server_tenant
+                    if settings.secret_server_is_cloud_based
+                    else str(settings.secret_server_base_url)
+                ),
+            )
+        # Maximum number of fields of a secret read with one request per field instead of the whole secret
+        self.field_fetch_max = settings.secret_server_field_fetch_max
 
     @property
     def config(self) -> Dict[str, Any]:
         """Returns the configuration dictionary."""
         return self.CONFIG["thycotic"]
 
+    @property
+    def _secret(self) -> Optional[ServerSecret]:
+        return getattr(self._last, "secret", None)
+
+    @property
+    def _param_secret_id(self) -> Optional[str]:
+        return getattr(self._last, "secret_id", None)
+
+    @property
+    def _param_secret_path(self) -> Optional[str]:
+        return getattr(self._last, "secret_path", None)
+
+    def _set_last(
+        self, secret: Optional[ServerSecret], secret_id: Optional[str] = None, secret_path: Optional[str] = None
+    ) -> None:
+        """Remember the last secret of the thread."""
+        self._last.secret = secret
+        self._last.secret_id = secret_id
+        self._last.secret_path = secret_path
+
     @property
     def secret_id(self) -> Optional[str]:
         """Get the secret_id."""
@@ -90,6 +557,185 @@ class ThycoticSecretServerSecretsReader:
         except KeyError as err:
             raise KeyError(f"Secret field '{field_name}' not found in secret '{self._secret.name}'.") from err
 
+    @staticmethod
+    def cache_key(secret_id=None, secret_path=None, field_name: Optional[str] = None) -> Tuple[str, ...]:
+        """Returns the cache key of a secret, or of one field of the secret.
+
+        Args:
+            secret_id (str): The secret ID.
+            secret_path (str): The secret path (used if secret_id is None).
+            field_name (str): (optional) The field slug.
+        """
+        if secret_id is not None:
+            key: Tuple[str, ...] = ("thycotic-tss-id", str(secret_id))
+        else:
+            key = ("thycotic-tss-path", normalize_secret_path(secret_path))
+        return key if field_name is None else key + (field_name,)
+
+    def get_secret_fields(self, secret_id=None, secret_path=None) -> Dict[str, Any]:
+        """Returns the field values of a secret, using the cache.
+
+        Args:
+            secret_id (str): The secret ID.
+            secret_path (str): The secret path (used if secret_id is None).
+
+        Returns:
+            Dict[str, Any]: The field values by field slug. If Secret Server is unavailable, the values of
+                a secret that expired less than `stale_ttl` seconds ago are returned as `StaleValue`s.
+
+        raises:
+            ValueError: If the secret can not be read from Secret Server.
+        """
+        key = self.cache_key(secret_id=secret_id, secret_path=secret_path)
+        try:
+            return self.cache.get_or_load(key, lambda: self._load_fields(secret_id=secret_id, secret_path=secret_path))
+        except BackendUnavailableError:
+            stale = self.cache.get_stale(key)
+            if stale is None:
+                raise
+            logger.warning(f"Thycotic Secret Server is unavailable, using the expired secret {key}.")
+            return stale
+
+    def _load_fields(self, secret_id=None, secret_path=None) -> Dict[str, Any]:
+        """Reads the field values of a secret, with the content of its file attachments."""
+        secret = self._fetch_secret(secret_id=secret_id, secret_path=secret_path)
+        return {slug: field.value for slug, field in secret.fields.items()}
+
+    def get_secret_field_values(self, field_names: List[str], secret_id=None, secret_path=None) -> Dict[str, Any]:
+        """Returns the values of some fields of a secret, using the cache.
+
+        The fields that are not cached are read with one request per field (`/secrets/{id}/fields/{slug}`)
+        if the secret is configured by id and at most `field_fetch_max` fields are missing, else with one
+        request for the whole secret. File attachments are only downloaded if they are requested.
+
+        Args:
+            field_names (List[str]): The field slugs.
+            secret_id (str): The secret ID.
+            secret_path (str): The secret path (used if secret_id is None).
+
+        Returns:
+            Dict[str, Any]: The field values by field slug. Fields the secret does not have are left out.
+                If Secret Server is unavailable, the values that expired less than `stale_ttl` seconds ago
+                are returned as `StaleValue`s.
+
+        raises:
+            ValueError: If the secret can not be read from Secret Server.
+        """
+        try:
+            return self._get_field_values(field_names, secret_id=secret_id, secret_path=secret_path)
+        except BackendUnavailableError:
+            stale = self._stale_field_values(field_names, secret_id=secret_id, secret_path=secret_path)
+            if stale is None:
+                raise
+            logger.warning(
+                "Thycotic Secret Server is unavailable, using the expired secret "
+                f"{self.cache_key(secret_id=secret_id, secret_path=secret_path)}."
+            )
+            return stale
+
+    def _get_field_values(self, field_names: List[str], secret_id=None, secret_path=None) -> Dict[str, Any]:
+        """Returns the values of some fields of a secret from the cache or Secret Server."""
+        cached = self.cache.get(self.cache_key(secret_id=secret_id, secret_path=secret_path), count=False)
+        if cached is not None:
+            self.cache.count_lookup(True)
+            return {name: cached[name] for name in field_names if name in cached}
+        values: Dict[str, Any] = {}
+        missing: List[str] = []
+        for name in dict.fromkeys(field_names):
+            key = self.cache_key(secret_id=secret_id, secret_path=secret_path, field_name=name)
+            value = self.cache.get(key, count=False)
+            if value is None:
+                missing.append(name)
+            else:
+                values[name] = value
+        if not missing:
+            self.cache.count_lookup(True)
+            return values
+        if secret_id is not None and len(missing) <= self.field_fetch_max:
+            try:
+                for name in missing:
+                    values[name] = self.cache.get_or_load(
+                        self.cache_key(secret_id=secret_id, field_name=name),
+                        lambda name=name: self._fetch_field(secret_id, name),
+                    )
+                return values
+            except SecretNotFoundError:
+                pass  # The secret or the field does not exist, the whole secret tells which
+        else:
+            self.cache.count_lookup(False)
+        values.update(self._fetch_fields(missing, secret_id=secret_id, secret_path=secret_path))
+        return values
+
+    def _stale_field_values(self, field_names: List[str], secret_id=None, secret_path=None) -> Optional[Dict[str, Any]]:
+        """Returns the cached values of the fields, expired or not, None if a field is not cached at all."""
+        key = self.cache_key(secret_id=secret_id, secret_path=secret_path)
+        whole = self.cache.get_stale(key)
+        if whole is not None:
+            return {name: whole[name] for name in field_names if name in whole}
+        values: Dict[str, Any] = {}
+        for name in field_names:
+            value = self.cache.get_stale(key + (name,))
+            if value is None:
+                return None
+            values[name] = value
+        return values
+
+    def _fetch_field(self, secret_id, field_name: str) -> Any:
+        """Reads one field of a secret from Secret Server.
+
+        raises:
+            SecretNotFoundError: If the secret or the field does not exist.
+            ValueError: If the Secret Server is not configured or returns another error.
+        """
+        delinea = self._client()
+        metrics.count("secret_server_field_reads")
+        try:
+            return delinea.get_secret_field(secret_id, field_name)
+        except SecretNotFoundError:
+            raise
+        except SecretServerError as err:
+            raise ValueError(f"Thycotic Secret Server error: {err.message}") from err
+
+    def _fetch_fields(self, field_names: List[str], secret_id=None, secret_path=None) -> Dict[str, Any]:
+        """Reads the whole secret without downloading its file attachments, returns the requested fields.
+
+        A secret without file attachments is cached whole. Otherwise the requested fields are cached one
+        by one, and the requested file attachments are downloaded field by field.
+
+        raises:
+            ValueError: If the secret can not be read from Secret Server.
+        """
+        key = self.cache_key(secret_id=secret_id, secret_path=secret_path)
+
+        def load() -> ServerSecret:
+            secret = self._fetch_secret(secret_id=secret_id, secret_path=secret_path, fetch_file_attachments=False)
+            if not any(field.file_attachment_id for field in secret.fields.values()):
+                self.cache.set(
+                    key,
+                    {slug: field.value for slug, field in secret.fields.items()},
+                    loader=lambda: self._load_fields(secret_id=secret_id, secret_path=secret_path),
+                )
+            return secret
+
+        secret = self.cache.coalesce((key, "secret"), load)
+        values: Dict[str, Any] = {}
+        for name in field_names:
+            field = secret.fields.get(name)
+            if field is None:
+                continue
+            if field.file_attachment_id:
+                try:
+                    values[name] = self._fetch_field(secret.id, name)
+                except SecretNotFoundError as err:
+                    raise ValueError(f"Thycotic Secret Server error: {err.message}") from err
+            else:
+                values[name] = field.value
+            if key not in self.cache:
+                # Secrets configured by path are not refreshed by id, the secret may have been moved
+                loader = (lambda name=name: self._fetch_field(secret_id, name)) if secret_id is not None else None
+                self.cache.set(key + (name,), values[name], loader=loader)
+        return values
+
     def query_thycotic_secret_server(self, secret_id=None, secret_path=None):
         """Query Thycotic Secret Server.
 
@@ -100,12 +746,49 @@ class ThycoticSecretServerSecretsReader:
         Returns:
             ServerSecret: The secret.
         """
-        if self._secret and self._param_secret_id == secret_id and self._param_secret_path == secret_path:
-            return self._secret
-        base_url = self.config["base_url"]
+        try:
+            secret = self._fetch_secret(secret_id=secret_id, secret_path=secret_path)
+        except ValueError:
+            self._set_last(None)
+            raise
+        if secret_id is not None:
+            self._set_last(secret, secret_id=str(secret_id))
+        else:
+            self._set_last(secret, secret_path=str(secret_path))
+        return secret
+
+    def _fetch_secret(self, secret_id=None, secret_path=None, fetch_file_attachments: bool = True) -> ServerSecret:
+        """Reads a secret from Secret Server, without using or changing the last secret of `get()`.
+
+        Args:
+            secret_id (str): The secret ID.
+            secret_path (str): The secret path (used if secret_id is None).
+            fetch_file_attachments (bool): Download the content of the file attachment fields.
+
+        Returns:
+            ServerSecret: The secret.
+
+        raises:
+            ValueError: If the Secret Server is not configured or returns an error.
+        """
+        delinea = self._client()
+
+        # Attempt to retrieve the secret.
+        try:
+            if secret_id is not None:
+                return ServerSecret(**delinea.get_secret(secret_id, fetch_file_attachments=fetch_file_attachments))
+            return ServerSecret(**self._get_secret_by_path(delinea, secret_path, fetch_file_attachments))
+        except SecretServerError as err:
+            raise ValueError(f"Thycotic Secret Server error: {err.message}") from err
+
+    def _client(self) -> SessionSecretServer:
+        """Returns the shared Secret Server client.
+
+        raises:
+            ValueError: If the Secret Server is not configured.
+        """
         ca_bundle_path = self.config["ca_bundle_path"]
         cloud_based = self.config["cloud_based"]
-        domain = self.config["domain"]
         password = self.config["password"]
         tenant = self.config["tenant"]
         token = self.config["token"]
@@ -119,66 +802,166 @@ class ThycoticSecretServerSecretsReader:
                 See section 'Configuration' in `README.md'.
                 """
             )
-        # Setup authorizer
-        must_restore_env = False
-        original_env = os.getenv("REQUESTS_CA_BUNDLE", "")
+        # Ensure cerificates file exists if ca_bundle_path is defined
+        if ca_bundle_path is not None and not Path(str(ca_bundle_path)).exists():
+            raise ValueError(
+                (
+                    "Thycotic Secret Server is not configured properly! "
+                    "Trusted certificates file not found: "
+                    "Environment variable 'REQUESTS_CA_BUNDLE': "
+                    f"{ca_bundle_path}."
+                )
+            )
+        # Get the shared client.
+        return get_secret_server_client(self.config)
+
+    def _get_secret_by_path(
+        self, delinea: SessionSecretServer, secret_path: str, fetch_file_attachments: bool = True
+    ) -> Dict[str, Any]:
+        """Reads a secret by path: by id if the path is indexed, else by path, indexing its id.
+
+        raises:
+            SecretServerError: If Secret Server returns an error.
+        """
+        index = self.path_index
+        if index is None:
+            return delinea.get_secret_by_path(secret_path, fetch_file_attachments)
+        entry = index.get(secret_path)
+        if entry is not None:
+            try:
+                secret = delinea.get_secret(entry.secret_id, fetch_file_attachments)
+            except SecretNotFoundError:
+                secret = None  # Deleted, or the id is not visible to the user anymore
+            if secret is not None and entry.matches(secret):
+                metrics.count("path_index_hits")
+                return secret
+            index.invalidate(secret_path)
+            metrics.count("path_index_invalidations")
+            logger.info(f"Secret {entry.secret_id} is not at {secret_path} anymore, resolving the path again.")
+        metrics.count("path_index_misses")
+        secret = delinea.get_secret_by_path(secret_path, fetch_file_attachments)
+        index.set(secret_path, PathIndexEntry.of(secret))
+        return secret
+
+    def index_folder(self, folder_path: str) -> int:
+        """Index the paths of all secrets of a folder and its subfolders, with one request per page of secrets.
+
+        The following reads of these secrets by path are answered by id.
+
+        Args:
+            folder_path (str): The folder, e.g. `\\Network\\Switches`.
+
+        Returns:
+            int: The number of indexed secrets.
+
+        raises:
+            ValueError: If the path index is disabled or Secret Server returns an error.
+        """
+        if self.path_index is None:
+            raise ValueError("The secret path index is disabled (SECRET_SERVER_PATH_INDEX).")
+        delinea = get_secret_server_client(self.config)
         try:
-            if ca_bundle_path is not None:
-                # Ensure cerificates file exists if ca_bundle_path is defined
-                if not Path(str(ca_bundle_path)).exists():
-                    raise ValueError(
-                        (
-                            "Thycotic Secret Server is not configured properly! "
-                            "Trusted certificates file not found: "
-                            "Environment variable 'REQUESTS_CA_BUNDLE': "
-                            f"{ca_bundle_path}."
-                        )
-                    )
-                # Set the trusted certificates file path to environment variable.
-                if original_env != ca_bundle_path:
-                    os.environ["REQUESTS_CA_BUNDLE"] = str(ca_bundle_path)
-                    must_restore_env = True
-            # Setup thycotic authorizer
-            # Username | Password | Token | Domain | Authorizer
-            #   def    |   def    |   *   |   -    | PasswordGrantAuthorizer
-            #   def    |   def    |   *   |  def   | DomainPasswordGrantAuthorizer
-            #    -     |    -     |  def  |   *    | AccessTokenAuthorizer
-            #   def    |    -     |  def  |   *    | AccessTokenAuthorizer
-            #    -     |   def    |  def  |   *    | AccessTokenAuthorizer
-            if all([username, password]):
-                if domain is not None:
-                    thy_authorizer = DomainPasswordGrantAuthorizer(
-                        base_url=base_url, domain=domain, username=username, password=password
-                    )
-                else:
-                    thy_authorizer = PasswordGrantAuthorizer(base_url=base_url, username=username, password=password)
-            else:
-                thy_authorizer = AccessTokenAuthorizer(token)
+            folder = delinea.get_folder_by_path(folder_path, get_all_children=True)
+            folder_paths = {item["id"]: item["folderPath"] for item in _folder_tree(folder)}
+            entries = {}
+            skip = 0
+            while True:
+                params = {
+                    "filter.folderId": folder["id"],
+                    "filter.includeSubFolders": "true",
+                    "take": FOLDER_LISTING_PAGE_SIZE,
+                    "skip": skip,
+                }
+                with metrics.timed("secret_server.list_secrets"):
+                    page = json.loads(delinea.search_secrets(query_params=params))
+                for summary in page["records"]:
+                    if summary.get("folderId") in folder_paths:
+                        secret_path = f"{folder_paths[summary['folderId']]}\\{summary['name']}"
+                        entries[secret_path] = PathIndexEntry.of(summary)
+                if not page.get("hasNext") or not page["records"]:
+                    break
+                skip = page.get("nextSkip") or skip + len(page["records"])
+        except SecretServerError as err:
+            raise ValueError(f"Thycotic Secret Server error: {err.message}") from err
+        except (json.JSONDecodeError, KeyError) as err:
+            raise ValueError(f"Thycotic Secret Server error: unexpected folder listing: {err!r}") from err
+        self.path_index.update(entries)
+        return len(entries)
 
-            # Get the client.
-            if cloud_based:
-                delinea = SecretServerCloud(tenant=tenant, authorizer=thy_authorizer)
-            else:
-                delinea = SecretServer(base_url=base_url, authorizer=thy_authorizer)
 
-            # Attempt to retrieve the secret.
+def _folder_tree(folder: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yields a folder as returned by the REST API (`getAllChildren=true`) and its subfolders."""
+    yield folder
+    for child in folder.get("childFolders") or []:
+        yield from _folder_tree(child)
+
+
+class ThycoticSecretServerSecretsProvider(SecretsProvider):
+    """Secrets provider for the Nautobot secrets providers `thycotic-tss-id` and `thycotic-tss-path`.
+
+    Associations that point at the same secret id or path are answered from one Secret Server request.
+    """
+
+    slugs = ("thycotic-tss-id", "thycotic-tss-path")
+
+    def __init__(self, cache: SecretCache) -> None:
+        super().__init__(cache)
+        self._tss: Optional[ThycoticSecretServerSecretsReader] = None
+
+    @property
+    def tss(self) -> ThycoticSecretServerSecretsReader:
+        """Returns the Thycotic/Delinea Secret Server reader (created on first use)."""
+        if self._tss is None:
+            self._tss = ThycoticSecretServerSecretsReader(cache=self.cache)
+        return self._tss
+
+    @staticmethod
+    def _secret_location(parameters: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        """Returns the secret id and path of the secret parameters."""
+        secret_id = parameters.get("secret_id")
+        if secret_id is not None:
+            return secret_id, None
+        return None, parameters["secret_path"]
+
+    def source_key(self, parameters: Dict[str, Any]) -> Hashable:
+        secret_id, secret_path = self._secret_location(parameters)
+        return ThycoticSecretServerSecretsReader.cache_key(secret_id=secret_id, secret_path=secret_path)
+
+    def fetch_many(self, parameters_list: List[Dict[str, Any]]) -> List[Any]:
+        # The fields needed of every secret, so that the secret is read field by field or whole
+        locations: Dict[Hashable, Tuple[Optional[str], Optional[str]]] = {}
+        field_names: Dict[Hashable, List[str]] = {}
+        for parameters in parameters_list:
             try:
-                if secret_id is not None:
-                    secret = ServerSecret(**delinea.get_secret(secret_id))
-                    self._secret = secret
-                    self._param_secret_id = str(secret_id)
-                    self._param_secret_path = None
-                else:
-                    secret = ServerSecret(**delinea.get_secret_by_path(secret_path))
-                    self._secret = secret
-                    self._param_secret_id = None
-                    self._param_secret_path = str(secret_path)
-            except SecretServerError as err:
-                self._secret = None
-                self._param_secret_id = None
-                self._param_secret_path = None
-                raise ValueError(f"Thycotic Secret Server error: {err.message}") from err
-            return secret
-        finally:
-            if must_restore_env:
-                os.environ["REQUESTS_CA_BUNDLE"] = original_env
+                secret_id, secret_path = self._secret_location(parameters)
+                field_name = parameters["secret_selected_value"]
+            except KeyError:
+                continue
+            key = ThycoticSecretServerSecretsReader.cache_key(secret_id=secret_id, secret_path=secret_path)
+            locations[key] = (secret_id, secret_path)
+            field_names.setdefault(key, []).append(field_name)
+        fields_by_key: Dict[Hashable, Any] = {}
+        for key, (secret_id, secret_path) in locations.items():
+            try:
+                fields_by_key[key] = self.tss.get_secret_field_values(
+                    field_names[key], secret_id=secret_id, secret_path=secret_path
+                )
+            except Exception as err:  # pylint: disable=broad-except
+                fields_by_key[key] = err
+        result: List[Any] = []
+        for parameters in parameters_list:
+            try:
+                secret_id, secret_path = self._secret_location(parameters)
+                field_name = parameters["secret_selected_value"]
+            except KeyError as err:
+                result.append(ValueError(f"Thycotic secret parameter {err} is missing."))
+                continue
+            key = ThycoticSecretServerSecretsReader.cache_key(secret_id=secret_id, secret_path=secret_path)
+            fields = fields_by_key[key]
+            if isinstance(fields, Exception):
+                result.append(fields)
+            elif field_name not in fields:
+                result.append(KeyError(f"Secret field '{field_name}' not found in secret '{key[1]}'."))
+            else:
+                result.append(fields[field_name])
+        return result
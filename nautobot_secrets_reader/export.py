@@ -0,0 +1,170 @@
+"""Stream the credentials of many devices to JSON Lines, Nornir or Ansible inventory files."""
+import json
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from typing import IO, Any, Callable, Dict, Iterable, Optional
+
+from .credentials import CredentialSet
+from .secread import CredentialFilter, DeviceCredentials, SecretsReader
+
+logger = logging.getLogger(__name__)
+
+# Bytes of the spooled Ansible host list kept in memory before it is written to a temporary file
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+@dataclass
+class ExportResult:
+    """Result of `export_credentials()`.
+
+    Attributes:
+        devices (int): Number of devices written.
+        errors (Dict[str, str]): The error message by device name, for the devices whose credentials
+            could not be read. The `jsonl` format writes these devices with their error, the inventory
+            formats leave them out.
+    """
+
+    devices: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+def login(credentials: CredentialSet) -> Dict[str, Any]:
+    """Returns the username and password of the credentials (the first of secret type USERNAME and PASSWORD).
+
+    Select the access type with the `access_type` filter of the query, e.g. 'SSH'.
+    """
+    result: Dict[str, Any] = {}
+    for secret_type in ("username", "password"):
+        found = credentials.by_secret_type(secret_type)
+        if found:
+            result[secret_type] = found[0]["value"]
+    return result
+
+
+def write_jsonl(records: Iterable[DeviceCredentials], fp: IO[str]) -> ExportResult:
+    """Write one JSON object per device and line: `{"device": ..., "credentials": [...], "error": ...}`."""
+    result = ExportResult()
+    for record in records:
+        fp.write(json.dumps(dict(device=record.device, credentials=record.credentials.to_dicts(), error=record.error)))
+        fp.write("\n")
+        result.devices += 1
+        if record.error is not None:
+            result.errors[record.device] = record.error
+    return result
+
+
+def write_nornir_hosts(records: Iterable[DeviceCredentials], fp: IO[str]) -> ExportResult:
+    """Write the hosts file of the Nornir `SimpleInventory`.
+
+    Every host is written as one line (YAML flow style), with `username`, `password` and the credentials
+    in `data.credentials`.
+    """
+    result = ExportResult()
+    empty = True
+    for record in _without_errors(records, result):
+        host = dict(
+            hostname=record.device, **login(record.credentials), data=dict(credentials=record.credentials.to_dicts())
+        )
+        fp.write(f"{json.dumps(record.device)}: {json.dumps(host)}\n")
+        empty = False
+    if empty:
+        fp.write("{}\n")
+    return result
+
+
+def write_ansible_inventory(records: Iterable[DeviceCredentials], fp: IO[str]) -> ExportResult:
+    """Write the JSON of an Ansible dynamic inventory (`--list`).
+
+    The hosts are members of the group `all` and have the variables `ansible_user`, `ansible_password`
+    and `nautobot_credentials`. The host variables are written as the devices are read, the host list is
+    spooled and appended at the end.
+    """
+    result = ExportResult()
+    fp.write('{"_meta": {"hostvars": {')
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode="w+") as hosts:
+        separator = ""
+        for record in _without_errors(records, result):
+            credentials = login(record.credentials)
+            hostvars: Dict[str, Any] = {}
+            if "username" in credentials:
+                hostvars["ansible_user"] = credentials["username"]
+            if "password" in credentials:
+                hostvars["ansible_password"] = credentials["password"]
+            hostvars["nautobot_credentials"] = record.credentials.to_dicts()
+            name = json.dumps(record.device)
+            fp.write(f"{separator}\n{name}: {json.dumps(hostvars)}")
+            hosts.write(f"{separator}{name}")
+            separator = ", "
+        fp.write('\n}}, "all": {"hosts": [')
+        hosts.seek(0)
+        while True:
+            chunk = hosts.read(65536)
+            if not chunk:
+                break
+            fp.write(chunk)
+    fp.write("]}}\n")
+    return result
+
+
+def _without_errors(records: Iterable[DeviceCredentials], result: ExportResult) -> Iterable[DeviceCredentials]:
+    """Yields the records whose credentials were read, counting them in `result` and logging the errors."""
+    for record in records:
+        if record.error is not None:
+            logger.error(f"ERROR Reading the credentials of {record.device}: {record.error}")
+            result.errors[record.device] = record.error
+            continue
+        result.devices += 1
+        yield record
+
+
+# Writer by export format
+WRITERS: Dict[str, Callable[[Iterable[DeviceCredentials], IO[str]], ExportResult]] = {
+    "jsonl": write_jsonl,
+    "nornir": write_nornir_hosts,
+    "ansible": write_ansible_inventory,
+}
+
+
+def export_credentials(
+    reader: SecretsReader,
+    fp: IO[str],
+    export_format: str = "jsonl",
+    device_filter: Optional[Dict[str, Any]] = None,
+    device_names: Optional[Iterable[str]] = None,
+    access_type: CredentialFilter = None,
+    secret_type: CredentialFilter = None,
+    order: str = "input",
+    max_in_flight: Optional[int] = None,
+    page_size: Optional[int] = None,
+) -> ExportResult:
+    """Write the credentials of the devices to a file, each device as soon as its credentials are read.
+
+    See `SecretsReader.iter_credentials_for_devices()` for the selection of the devices, the order and
+    the concurrency. The memory used does not depend on the number of devices.
+
+    Args:
+        reader (SecretsReader): Reads the credentials.
+        fp (IO[str]): The output file.
+        export_format (str): 'jsonl', 'nornir' (hosts file of the `SimpleInventory`) or 'ansible'
+            (dynamic inventory JSON).
+
+    Returns:
+        ExportResult: The number of devices written and the errors by device name.
+
+    raises:
+        ValueError: If the format, the order or the filter is invalid or Nautobot can not be queried.
+    """
+    writer = WRITERS.get(export_format)
+    if writer is None:
+        raise ValueError(f"Invalid export format {export_format!r}, expected one of {', '.join(WRITERS)}")
+    records = reader.iter_credentials_for_devices(
+        device_filter,
+        device_names,
+        access_type=access_type,
+        secret_type=secret_type,
+        order=order,
+        max_in_flight=max_in_flight,
+        page_size=page_size,
+    )
+    return writer(records, fp)
@@ -1,6 +1,7 @@
 """Common helper functions."""
 
-from distutils.util import strtobool
+_TRUE_VALUES = ("y", "yes", "t", "true", "on", "1")
+_FALSE_VALUES = ("n", "no", "f", "false", "off", "0")
 
 
 def is_truthy(arg):
@@ -15,4 +16,9 @@ def is_truthy(arg):
     """
     if isinstance(arg, bool):
         return arg
-    return bool(strtobool(arg))
+    value = str(arg).lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ValueError(f"invalid truth value {arg!r}")
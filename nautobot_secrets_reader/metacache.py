@@ -0,0 +1,233 @@
+"""Cache of Nautobot secrets-group metadata, invalidated from the Nautobot change log."""
+import logging
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from . import metrics
+from .settings import DEFAULT_CHANGELOG_POLL_INTERVAL, DEFAULT_METADATA_FILE_MAX_AGE  # noqa: F401
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .metastore import MetadataStore
+
+logger = logging.getLogger(__name__)
+
+
+class _DeviceEntry:
+    """The secrets group of a device."""
+
+    __slots__ = ("device_id", "source_id", "group_id")
+
+    def __init__(self, device_id: Optional[str], source_id: Optional[str], group_id: Optional[str]) -> None:
+        self.device_id = device_id  # The device, None if the device does not exist
+        self.source_id = source_id  # The device the secrets group is assigned to (e.g. virtual chassis master)
+        self.group_id = group_id  # The secrets group, None if the device has no secrets group
+
+
+class MetadataCache:
+    """Thread-safe cache of the secrets groups (with associations and secrets) and the device to group mapping.
+
+    The cache does not expire. Instead, the Nautobot object changes of the `WATCHED_OBJECT_TYPES` are
+    polled (see `SecretGroupinfo`) every `poll_interval` seconds and the affected entries are dropped
+    with `apply_change()`.
+
+    With a `store`, the entries and the change log position are also kept in an encrypted file (see
+    `MetadataStore`), so that a new process starts from the entries of the previous ones: they are
+    validated against the change log position of the file. If the change log was checked less than
+    `poll_interval` seconds ago, the entries are used without querying Nautobot.
+
+    Args:
+        poll_interval (float): Interval (seconds) at which the change log is checked.
+        store (MetadataStore): The metadata file, None to keep the entries in memory only.
+    """
+
+    WATCHED_OBJECT_TYPES = (
+        "extras.secret",
+        "extras.secretsgroup",
+        "extras.secretsgroupassociation",
+        "dcim.device",
+        "dcim.virtualchassis",
+    )
+
+    def __init__(
+        self, poll_interval: float = DEFAULT_CHANGELOG_POLL_INTERVAL, store: Optional["MetadataStore"] = None
+    ) -> None:
+        self.poll_interval = poll_interval
+        self.store = store
+        self.marker: Optional[str] = None  # Time of the last change seen in the Nautobot change log
+        self._marker_ids: Set[Any] = set()  # Ids of the changes seen at the marker time
+        self.last_poll: Optional[float] = None
+        self.invalidations = 0
+        self._groups: Dict[str, Dict[str, Any]] = {}
+        self._devices: Dict[str, _DeviceEntry] = {}
+        self._lock = threading.Lock()
+        # Held while the change log is polled, so that concurrent callers wait for the result.
+        self.poll_lock = threading.Lock()
+        state = self._store_call("load_state")
+        if state:
+            self.marker, marker_ids, checked = state
+            self._marker_ids = set(marker_ids)
+            age = time.time() - checked
+            if 0 <= age < poll_interval:
+                self.last_poll = time.monotonic() - age
+
+    def poll_due(self) -> bool:
+        """Returns True if the change log must be checked before the cache is used."""
+        return self.last_poll is None or time.monotonic() - self.last_poll >= self.poll_interval
+
+    def polled(self, marker: Optional[str], changes: Iterable[Dict[str, Any]] = ()) -> None:
+        """Record a check of the change log.
+
+        Args:
+            marker (str): Time of the latest change seen in the change log.
+            changes (Iterable[Dict[str, Any]]): The changes seen.
+        """
+        if marker is not None and (self.marker is None or marker > self.marker):
+            self.marker = marker
+            self._marker_ids = set()
+        # The change log is read from the marker time on: remember the changes already applied at that time
+        self._marker_ids.update(change.get("id") for change in changes if change.get("time") == self.marker)
+        self.last_poll = time.monotonic()
+        if self.marker is not None:
+            self._store_call("save_state", self.marker, self._marker_ids)
+
+    def is_new(self, change: Dict[str, Any]) -> bool:
+        """Returns False if the change was already applied."""
+        return change.get("time") != self.marker or change.get("id") not in self._marker_ids
+
+    def get_group(self, group_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the cached secrets group information or None."""
+        with self._lock:
+            info = self._groups.get(group_id)
+        if info is None and self.store is not None:
+            info = self._store_call("get_group", group_id)
+            if info is not None:
+                with self._lock:
+                    info = self._groups.setdefault(group_id, info)
+        return info
+
+    def set_group(self, group_id: str, secrets_group_info: Dict[str, Any]) -> None:
+        """Store the secrets group information, as returned by `SecretGroupinfo`."""
+        with self._lock:
+            self._groups[group_id] = secrets_group_info
+        self._store_call("set_group", group_id, secrets_group_info)
+
+    def get_device(self, device_name: str) -> Tuple[bool, Optional[str]]:
+        """Returns whether the device is cached and the id of its secrets group."""
+        with self._lock:
+            entry = self._devices.get(device_name)
+        if entry is None and self.store is not None:
+            stored = self._store_call("get_device", device_name)
+            if stored is not None:
+                with self._lock:
+                    entry = self._devices.setdefault(device_name, _DeviceEntry(*stored))
+        if entry is None or (entry.group_id is not None and self.get_group(entry.group_id) is None):
+            return False, None
+        return True, entry.group_id
+
+    def set_device(
+        self, device_name: str, device_id: Optional[str], source_id: Optional[str], group_id: Optional[str]
+    ) -> None:
+        """Store the secrets group of a device.
+
+        Args:
+            device_name (str): The device name.
+            device_id (str): The device id, None if the device does not exist.
+            source_id (str): The id of the device the secrets group is assigned to.
+            group_id (str): The secrets group id, None if the device has no secrets group.
+        """
+        with self._lock:
+            self._devices[device_name] = _DeviceEntry(device_id, source_id, group_id)
+        self._store_call("set_device", device_name, device_id, source_id, group_id)
+
+    def clear(self) -> None:
+        """Remove all entries and forget the change log position."""
+        with self._lock:
+            self._groups.clear()
+            self._devices.clear()
+            self.marker = None
+            self._marker_ids = set()
+            self.last_poll = None
+        self._store_call("clear")
+
+    def apply_change(self, change: Dict[str, Any]) -> None:
+        """Drop the entries affected by a Nautobot object change.
+
+        Args:
+            change (Dict[str, Any]): The object change, as returned by the REST API `extras/object-changes`.
+        """
+        object_type = change.get("changed_object_type")
+        object_id = str(change.get("changed_object_id"))
+        object_data = change.get("object_data") or {}
+        with self._lock:
+            if object_type == "extras.secretsgroup":
+                self._drop_groups({object_id})
+                self._store_call("drop_groups", [object_id])
+            elif object_type == "extras.secretsgroupassociation":
+                group = object_data.get("group")
+                group_id = group.get("id") if isinstance(group, dict) else group
+                self._drop_groups({str(group_id)} if group_id else set(self._groups))
+                self._store_call("drop_groups", [str(group_id)] if group_id else None)
+            elif object_type == "extras.secret":
+                self._drop_groups(
+                    {
+                        group_id
+                        for group_id, info in self._groups.items()
+                        if any(
+                            str(association["secret"]["id"]) == object_id
+                            for association in info["secrets_group"]["secretsgroupassociation_set"]
+                        )
+                    }
+                )
+                self._store_call("drop_groups", secret_id=object_id)
+            elif object_type == "dcim.device":
+                self._drop_devices(
+                    name
+                    for name, entry in self._devices.items()
+                    if object_id in (entry.device_id, entry.source_id) or name == change.get("object_repr")
+                )
+                self._store_call("drop_devices", object_id, change.get("object_repr"))
+            elif object_type == "dcim.virtualchassis":
+                # The master has changed: all devices without own secrets group may be affected
+                self._drop_devices(
+                    name
+                    for name, entry in self._devices.items()
+                    if entry.group_id is None or entry.source_id != entry.device_id
+                )
+                self._store_call("drop_devices")
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the cache statistics."""
+        return dict(
+            groups=len(self._groups),
+            devices=len(self._devices),
+            invalidations=self.invalidations,
+            marker=self.marker,
+        )
+
+    def _store_call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """Call a method of the store. If the file fails, it is no longer used and None is returned."""
+        store = self.store
+        if store is None:
+            return None
+        call: Callable[..., Any] = getattr(store, method)
+        try:
+            return call(*args, **kwargs)
+        except (OSError, sqlite3.Error) as err:
+            logger.warning(f"The metadata file {store.path} failed, it is no longer used: {err!r}")
+            metrics.count_error("metadata_file", err)
+            self.store = None
+            return None
+
+    def _drop_groups(self, group_ids: Set[str]) -> None:
+        """Remove secrets groups. The lock must be held by the caller."""
+        for group_id in group_ids:
+            if self._groups.pop(group_id, None) is not None:
+                self.invalidations += 1
+
+    def _drop_devices(self, device_names) -> None:
+        """Remove devices. The lock must be held by the caller."""
+        for name in list(device_names):
+            del self._devices[name]
+            self.invalidations += 1
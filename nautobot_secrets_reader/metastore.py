@@ -0,0 +1,296 @@
+"""Encrypted file keeping the Nautobot secrets-group metadata of the `MetadataCache` across processes.
+
+Requires the optional dependency `cryptography` (`pip install nautobot-secrets-reader[metadata-file]`).
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # pragma: no cover
+    Fernet = None  # type: ignore
+
+from . import metrics
+from .settings import DEFAULT_METADATA_FILE_MAX_AGE, Settings
+
+logger = logging.getLogger(__name__)
+
+# Layout of the file, files of another version are emptied
+STORE_VERSION = "1"
+# Bytes of the file SQLite maps into memory for reading
+MMAP_SIZE = 64 * 1024 * 1024
+# Decrypted value of the `check` row, which tells if the key material of the file is the same
+_CHECK = b"nautobot-secrets-reader-metadata"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS secrets_groups (group_key TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS group_secrets (
+    secret_key TEXT NOT NULL, group_key TEXT NOT NULL, PRIMARY KEY (secret_key, group_key)
+);
+CREATE INDEX IF NOT EXISTS group_secrets_group ON group_secrets (group_key);
+CREATE TABLE IF NOT EXISTS devices (
+    name_key TEXT PRIMARY KEY, device_key TEXT, source_key TEXT, inherited INTEGER NOT NULL, data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS devices_device ON devices (device_key);
+CREATE INDEX IF NOT EXISTS devices_source ON devices (source_key);
+"""
+_TABLES = ("secrets_groups", "group_secrets", "devices")
+
+
+class MetadataStore:
+    """SQLite file with the secrets groups and the device to secrets group mapping of a `MetadataCache`.
+
+    The entries are looked up by key, so that a new process resolves the cached devices and secrets groups
+    without reading the whole file or querying Nautobot. They are valid as long as the change log position
+    stored with them (see `load_state()`): the cache applies the changes seen since then.
+
+    The entries are encrypted with Fernet, with a key derived from `key_material` and a random salt of
+    the file; the lookup keys (ids and device names) are stored as HMACs. The file contains the Nautobot
+    metadata only, never secret values. A file of another version or written with other key material is
+    emptied.
+
+    Args:
+        path (str): The file, created readable by the owner only.
+        key_material (str): Secret the encryption key is derived from, e.g. the Nautobot URL and token.
+        max_age (float): Maximum age (seconds) of the change log position, the change log may have been pruned
+            since. Older entries are not used.
+
+    raises:
+        ImportError: If `cryptography` is not installed.
+        OSError, sqlite3.Error: If the file can not be opened.
+    """
+
+    def __init__(self, path: str, key_material: str, max_age: float = DEFAULT_METADATA_FILE_MAX_AGE) -> None:
+        if Fernet is None:
+            raise ImportError(
+                "The metadata file requires cryptography: pip install nautobot-secrets-reader[metadata-file]"
+            )
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        # Create the file readable by the owner only, SQLite creates its journal files with the same mode
+        os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+        self._db = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        self._db.executescript(_SCHEMA)
+        self._open(key_material.encode())
+
+    def _open(self, key_material: bytes) -> None:
+        """Derive the keys from the salt of the file, or empty the file if the keys do not match it."""
+        with self._transaction():
+            meta = dict(self._db.execute("SELECT name, value FROM meta"))
+            if meta.get("version") == STORE_VERSION and "salt" in meta:
+                self._derive_keys(key_material, bytes.fromhex(meta["salt"]))
+                if self._decrypt(meta.get("check", "")) == _CHECK:
+                    return
+                logger.info(f"The metadata file {self.path} was written with another key, it is emptied.")
+            salt = os.urandom(16)
+            self._derive_keys(key_material, salt)
+            for table in _TABLES + ("meta",):
+                self._db.execute(f"DELETE FROM {table}")  # nosec - constant table names
+            self._db.executemany(
+                "INSERT INTO meta (name, value) VALUES (?, ?)",
+                [("version", STORE_VERSION), ("salt", salt.hex()), ("check", self._fernet.encrypt(_CHECK).decode())],
+            )
+
+    def _derive_keys(self, key_material: bytes, salt: bytes) -> None:
+        """Derive the encryption key and the lookup key (HKDF with SHA-256)."""
+        prk = hmac.new(salt, key_material, hashlib.sha256).digest()
+        self._fernet = Fernet(base64.urlsafe_b64encode(hmac.new(prk, b"encryption\x01", hashlib.sha256).digest()))
+        self._lookup_key = hmac.new(prk, b"lookup\x01", hashlib.sha256).digest()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Run the statements within the context as one write transaction."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _key(self, kind: str, value: Optional[str]) -> Optional[str]:
+        """Returns the lookup key of an id or name, None for None."""
+        if value is None:
+            return None
+        return hmac.new(self._lookup_key, f"{kind}:{value}".encode(), hashlib.sha256).hexdigest()
+
+    def _encrypt(self, value: Any) -> bytes:
+        return self._fernet.encrypt(json.dumps(value, separators=(",", ":")).encode())
+
+    def _decrypt(self, token: Any) -> Any:
+        """Returns the decrypted bytes of a token, None if it is not valid."""
+        try:
+            return self._fernet.decrypt(token)
+        except (InvalidToken, TypeError, ValueError):
+            return None
+
+    def _load(self, token: Any) -> Any:
+        data = self._decrypt(token)
+        return None if data is None else json.loads(data)
+
+    def load_state(self) -> Optional[Tuple[str, List[Any], float]]:
+        """Returns the change log position of the entries, None if it is unknown or older than `max_age`.
+
+        Returns:
+            Tuple[str, List[Any], float]: The time of the last change seen, the ids of the changes seen at
+                that time and the time (`time.time()`) the change log was last checked.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'state'").fetchone()
+        state = self._load(row[0]) if row is not None else None
+        if not state or state["marker"] is None or time.time() - state["checked"] > self.max_age:
+            return None
+        return state["marker"], state["ids"], state["checked"]
+
+    def save_state(self, marker: Optional[str], marker_ids: Iterable[Any]) -> None:
+        """Store the change log position, checked now."""
+        state = self._encrypt(dict(marker=marker, ids=list(marker_ids), checked=time.time())).decode()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('state', ?)", (state,))
+
+    def get_group(self, group_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the secrets group information, None if it is not stored."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM secrets_groups WHERE group_key = ?", (self._key("group", group_id),)
+            ).fetchone()
+        return self._load(row[0]) if row is not None else None
+
+    def set_group(self, group_id: str, secrets_group_info: Dict[str, Any]) -> None:
+        """Store the secrets group information and the ids of its secrets."""
+        group_key = self._key("group", group_id)
+        secret_keys = {
+            self._key("secret", str(association["secret"]["id"]))
+            for association in secrets_group_info["secrets_group"]["secretsgroupassociation_set"]
+        }
+        data = self._encrypt(secrets_group_info)
+        with self._lock, self._transaction():
+            self._db.execute("INSERT OR REPLACE INTO secrets_groups (group_key, data) VALUES (?, ?)", (group_key, data))
+            self._db.execute("DELETE FROM group_secrets WHERE group_key = ?", (group_key,))
+            self._db.executemany(
+                "INSERT INTO group_secrets (secret_key, group_key) VALUES (?, ?)",
+                [(secret_key, group_key) for secret_key in secret_keys],
+            )
+
+    def drop_groups(self, group_ids: Optional[Iterable[str]] = None, secret_id: Optional[str] = None) -> None:
+        """Remove secrets groups: the groups of `group_ids`, the groups using the secret or all groups.
+
+        Args:
+            group_ids (Iterable[str]): The secrets group ids.
+            secret_id (str): The secret id, if `group_ids` is None.
+        """
+        with self._lock, self._transaction():
+            if group_ids is not None:
+                group_keys = [(self._key("group", group_id),) for group_id in group_ids]
+            elif secret_id is not None:
+                group_keys = self._db.execute(
+                    "SELECT group_key FROM group_secrets WHERE secret_key = ?", (self._key("secret", secret_id),)
+                ).fetchall()
+            else:
+                self._db.execute("DELETE FROM secrets_groups")
+                self._db.execute("DELETE FROM group_secrets")
+                return
+            self._db.executemany("DELETE FROM secrets_groups WHERE group_key = ?", group_keys)
+            self._db.executemany("DELETE FROM group_secrets WHERE group_key = ?", group_keys)
+
+    def get_device(self, device_name: str) -> Optional[Tuple[Optional[str], Optional[str], Optional[str]]]:
+        """Returns the device id, the id of the device the secrets group is assigned to and the secrets group id.
+
+        None if the device is not stored.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM devices WHERE name_key = ?", (self._key("device-name", device_name),)
+            ).fetchone()
+        entry = self._load(row[0]) if row is not None else None
+        return tuple(entry) if entry is not None else None  # type: ignore
+
+    def set_device(
+        self, device_name: str, device_id: Optional[str], source_id: Optional[str], group_id: Optional[str]
+    ) -> None:
+        """Store the secrets group of a device (see `MetadataCache.set_device()`)."""
+        inherited = group_id is None or source_id != device_id
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO devices (name_key, device_key, source_key, inherited, data)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    self._key("device-name", device_name),
+                    self._key("device", device_id),
+                    self._key("device", source_id),
+                    int(inherited),
+                    self._encrypt([device_id, source_id, group_id]),
+                ),
+            )
+
+    def drop_devices(self, device_id: Optional[str] = None, device_name: Optional[str] = None) -> None:
+        """Remove the devices with the id or name and the devices using the secrets group of the device,
+        or, without id and name, the devices without own secrets group (e.g. after a virtual chassis change).
+        """
+        with self._lock:
+            if device_id is None and device_name is None:
+                self._db.execute("DELETE FROM devices WHERE inherited = 1")
+                return
+            device_key = self._key("device", device_id)
+            self._db.execute(
+                "DELETE FROM devices WHERE device_key = ? OR source_key = ? OR name_key = ?",
+                (device_key, device_key, self._key("device-name", device_name)),
+            )
+
+    def clear(self) -> None:
+        """Remove all entries and the change log position."""
+        with self._lock, self._transaction():
+            for table in _TABLES:
+                self._db.execute(f"DELETE FROM {table}")  # nosec - constant table names
+            self._db.execute("DELETE FROM meta WHERE name = 'state'")
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of stored secrets groups and devices."""
+        with self._lock:
+            groups = self._db.execute("SELECT COUNT(*) FROM secrets_groups").fetchone()[0]
+            devices = self._db.execute("SELECT COUNT(*) FROM devices").fetchone()[0]
+        return dict(groups=groups, devices=devices)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def open_metadata_store(settings: Settings) -> Optional[MetadataStore]:
+    """Returns the store of the metadata file of the settings (`NAUTOBOT_METADATA_CACHE_FILE`).
+
+    Returns:
+        Optional[MetadataStore]: The store, None if no file is configured or it can not be used.
+    """
+    path = settings.nautobot_metadata_cache_file
+    if not path:
+        return None
+    key_material = settings.nautobot_metadata_cache_key or (
+        f"{settings.nautobot_api_endpoint}\n{settings.nautobot_token}" if settings.nautobot_token else ""
+    )
+    if not key_material:
+        logger.warning(f"The metadata file {path} is not used: no NAUTOBOT_TOKEN or NAUTOBOT_METADATA_CACHE_KEY.")
+        return None
+    try:
+        return MetadataStore(path, key_material, max_age=settings.nautobot_metadata_cache_max_age)
+    except ImportError as err:
+        logger.warning(f"The metadata file {path} is not used: {err}")
+    except (OSError, sqlite3.Error) as err:
+        logger.warning(f"The metadata file {path} can not be opened, it is not used: {err!r}")
+        metrics.count_error("metadata_file", err)
+    return None
@@ -0,0 +1,297 @@
+"""Metrics and tracing hooks for the backend calls, caches and errors.
+
+The readers report to the installed hooks:
+
+* `timed(operation)` around every backend call: `nautobot.graphql`, `nautobot.rest`, `nautobot.connect`,
+  `secret_server.oauth_grant` and `secret_server.get`.
+* `count(event)` for cache events (`cache_hits`, `cache_misses`, `cache_evictions`,
+  `metadata_invalidations`) and errors (`errors` with the attributes `operation` and `error`).
+
+Without installed hooks, `timed()` returns a shared no-op context manager and `count()` returns
+immediately, so the instrumentation costs one tuple truth test per call.
+
+    recorder = MetricsRecorder()
+    install_hook(recorder)
+    ...
+    print(recorder.prometheus_text())
+"""
+import contextlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the exported metric names.
+METRIC_PREFIX = "nautobot_secrets_reader"
+# Default upper bounds (seconds) of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsHook:
+    """Base class of the metrics hooks. The methods do nothing; override the ones needed."""
+
+    def observe(
+        self,
+        operation: str,
+        start_time: float,
+        duration: float,
+        error: Optional[BaseException],
+        attributes: Dict[str, Any],
+    ) -> None:
+        """Record a finished backend call.
+
+        Args:
+            operation (str): The call, e.g. `secret_server.get`.
+            start_time (float): Start of the call (seconds since the epoch).
+            duration (float): Duration (seconds) of the call.
+            error (BaseException): The exception raised by the call, None if it succeeded.
+            attributes (Dict[str, Any]): Additional information, e.g. the endpoint.
+        """
+
+    def count(self, event: str, value: int, attributes: Dict[str, Any]) -> None:
+        """Record an event, e.g. a cache hit.
+
+        Args:
+            event (str): The event name, e.g. `cache_hits`.
+            value (int): The number of events.
+            attributes (Dict[str, Any]): Additional information, e.g. the cache name.
+        """
+
+
+_hooks: Tuple[MetricsHook, ...] = ()  # Replaced (not mutated) when hooks are installed or removed
+_hooks_lock = threading.Lock()
+
+
+def install_hook(hook: MetricsHook) -> MetricsHook:
+    """Install a metrics hook for all readers of the process.
+
+    Returns:
+        MetricsHook: The installed hook.
+    """
+    global _hooks  # pylint: disable=global-statement
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+    return hook
+
+
+def uninstall_hook(hook: MetricsHook) -> None:
+    """Remove an installed metrics hook."""
+    global _hooks  # pylint: disable=global-statement
+    with _hooks_lock:
+        _hooks = tuple(installed for installed in _hooks if installed is not hook)
+
+
+def installed_hooks() -> Tuple[MetricsHook, ...]:
+    """Returns the installed metrics hooks."""
+    return _hooks
+
+
+class _Timer:
+    """Context manager reporting the duration of a backend call to the installed hooks."""
+
+    __slots__ = ("operation", "attributes", "start_time", "started")
+
+    def __init__(self, operation: str, attributes: Dict[str, Any]) -> None:
+        self.operation = operation
+        self.attributes = attributes
+        self.start_time = 0.0
+        self.started = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        duration = time.perf_counter() - self.started
+        for hook in _hooks:
+            try:
+                hook.observe(self.operation, self.start_time, duration, exc, self.attributes)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Metrics hook {hook!r} failed")
+        return False
+
+
+_NO_TIMER = contextlib.nullcontext()
+
+
+def timed(operation: str, **attributes: Any) -> Any:
+    """Returns a context manager that reports the duration of a backend call to the installed hooks.
+
+    Args:
+        operation (str): The call, e.g. `secret_server.get`.
+        attributes: Additional information passed to the hooks.
+    """
+    if not _hooks:
+        return _NO_TIMER
+    return _Timer(operation, attributes)
+
+
+def count(event: str, value: int = 1, **attributes: Any) -> None:
+    """Report an event to the installed hooks.
+
+    Args:
+        event (str): The event name, e.g. `cache_hits`.
+        value (int): The number of events.
+        attributes: Additional information passed to the hooks.
+    """
+    if not _hooks:
+        return
+    for hook in _hooks:
+        try:
+            hook.count(event, value, attributes)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception(f"Metrics hook {hook!r} failed")
+
+
+def count_error(operation: str, error: BaseException) -> None:
+    """Report an error of an operation by its type."""
+    if _hooks:
+        count("errors", operation=operation, error=type(error).__name__)
+
+
+def _labels(attributes: Iterable[Tuple[str, Any]]) -> str:
+    """Returns the Prometheus label set of the attributes."""
+    items = []
+    for name, value in attributes:
+        text = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        items.append(f'{name}="{text}"')
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+def _metric_name(name: str) -> str:
+    """Returns a valid Prometheus metric name."""
+    return "".join(char if char.isalnum() or char == "_" else "_" for char in name)
+
+
+class MetricsRecorder(MetricsHook):
+    """Thread-safe in-memory metrics: latency histograms per operation and event counters.
+
+    Errors of the timed calls are counted as event `errors` with the attributes `operation` and `error`.
+
+    Args:
+        buckets (Tuple[float, ...]): Upper bounds (seconds) of the latency histogram buckets.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        # operation -> [count per bucket (not cumulative) + overflow, sum, count]
+        self._histograms: Dict[str, List[Any]] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, operation, start_time, duration, error, attributes) -> None:
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if duration <= bound:
+                index = position
+                break
+        with self._lock:
+            histogram = self._histograms.get(operation)
+            if histogram is None:
+                histogram = self._histograms[operation] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += duration
+            histogram[2] += 1
+        if error is not None:
+            self.count("errors", 1, dict(operation=operation, error=type(error).__name__))
+
+    def count(self, event, value, attributes) -> None:
+        key = (event, tuple(sorted(attributes.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self) -> None:
+        """Remove all recorded values."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the recorded values.
+
+        Returns:
+            Dict[str, Any]: `calls`: count, sum (seconds) and bucket counts by operation;
+                `events`: the event counts by event name and attributes.
+        """
+        with self._lock:
+            calls = {
+                operation: dict(count=count_, sum=total, buckets=list(counts))
+                for operation, (counts, total, count_) in self._histograms.items()
+            }
+            events: Dict[str, Dict[Tuple[Tuple[str, Any], ...], int]] = {}
+            for (event, attributes), value in self._counters.items():
+                events.setdefault(event, {})[attributes] = value
+        return dict(calls=calls, events=events)
+
+    def prometheus_text(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        name = f"{METRIC_PREFIX}_call_duration_seconds"
+        lines.append(f"# HELP {name} Duration of the Nautobot and Secret Server calls.")
+        lines.append(f"# TYPE {name} histogram")
+        for operation, histogram in sorted(snapshot["calls"].items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), histogram["buckets"]):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels([('operation', operation), ('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels([('operation', operation)])} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels([('operation', operation)])} {histogram['count']}")
+        for event, values in sorted(snapshot["events"].items()):
+            name = f"{METRIC_PREFIX}_{_metric_name(event)}_total"
+            lines.append(f"# TYPE {name} counter")
+            for attributes, value in sorted(values.items(), key=lambda item: str(item[0])):
+                lines.append(f"{name}{_labels(attributes)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """A finished backend call, passed to the callback of `SpanHook`.
+
+    Attribute names follow OpenTelemetry: `name`, `start_time` / `end_time` (nanoseconds since the
+    epoch), `attributes` and `status` (`OK` or `ERROR`).
+    """
+
+    __slots__ = ("name", "start_time", "end_time", "attributes", "status", "exception")
+
+    def __init__(
+        self,
+        name: str,
+        start_time: int,
+        end_time: int,
+        attributes: Dict[str, Any],
+        exception: Optional[BaseException] = None,
+    ) -> None:
+        self.name = name
+        self.start_time = start_time
+        self.end_time = end_time
+        self.attributes = attributes
+        self.exception = exception
+        self.status = "OK" if exception is None else "ERROR"
+
+    @property
+    def duration(self) -> float:
+        """Returns the duration in seconds."""
+        return (self.end_time - self.start_time) / 1e9
+
+    def __repr__(self) -> str:
+        return f"Span({self.name!r}, duration={self.duration:.6f}, status={self.status!r})"
+
+
+class SpanHook(MetricsHook):
+    """Pass every finished backend call as `Span` to a callback, e.g. to create OpenTelemetry spans.
+
+    Args:
+        callback (Callable[[Span], None]): Called with the span of every finished call.
+    """
+
+    def __init__(self, callback: Callable[[Span], None]) -> None:
+        self.callback = callback
+
+    def observe(self, operation, start_time, duration, error, attributes) -> None:
+        start = int(start_time * 1e9)
+        self.callback(Span(operation, start, start + int(duration * 1e9), dict(attributes), error))
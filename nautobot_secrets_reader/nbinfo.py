@@ -1,15 +1,27 @@
 """Read the secret group information from Nautobot"""
 
-from asyncio.log import logger
 import json
-import os
-from typing import Any, Dict, Optional
-from dotenv import load_dotenv
-import pynautobot
+import re
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 import logging
 
+from . import metrics
+from .metacache import MetadataCache
+from .settings import DEFAULT_GRAPHQL_PAGE_SIZE, Settings, get_settings  # noqa: F401
+
 logger = logging.getLogger(__name__)
 
+# GraphQL argument names
+_ARGUMENT_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _pynautobot():
+    """Returns the pynautobot module, imported on first use."""
+    import pynautobot  # pylint: disable=import-outside-toplevel
+
+    return pynautobot
+
 
 class SecretGroupinfo:
     """Read the secret group information from Nautobot"""
@@ -36,24 +48,100 @@ class SecretGroupinfo:
     }
     """
 
-    def __init__(self):
-        """Initialize the class"""
-        load_dotenv()
+    DEVICES_GRAPHQL_QUERY = """
+    query ($device_names: [String]) {
+        devices(name: $device_names) {
+            id
+            name
+            secrets_group {
+                ...SecretsGroupFields
+            }
+            virtual_chassis {
+                master {
+                    id
+                    secrets_group {
+                        ...SecretsGroupFields
+                    }
+                }
+            }
+        }
+    }
+
+    fragment SecretsGroupFields on SecretsGroupType {
+        id
+        name
+        slug
+        secretsgroupassociation_set {
+            access_type
+            secret_type
+            secret {
+                id
+                provider
+                name
+                slug
+                parameters
+                description
+            }
+        }
+    }
+    """
+
+    def __init__(
+        self,
+        page_size: Optional[int] = None,
+        metadata_cache: Optional[MetadataCache] = None,
+        settings: Optional[Settings] = None,
+    ):
+        """Initialize the class
+
+        Args:
+            page_size (int): Number of devices resolved per GraphQL request.
+                Default: environment variable `NAUTOBOT_GRAPHQL_PAGE_SIZE` or 100.
+            metadata_cache (MetadataCache): Cache for the secrets groups and the device to secrets group
+                mapping. Default: a new cache, if environment variable `NAUTOBOT_METADATA_CACHE` is true (default),
+                polling the change log every `NAUTOBOT_CHANGELOG_POLL_INTERVAL` seconds (default 5), and kept in
+                the encrypted file `NAUTOBOT_METADATA_CACHE_FILE` if set.
+            settings (Settings): The configuration. Default: `get_settings()`.
+        """
+        if settings is None:
+            settings = get_settings()
         # Get Nautobot server account information
-        self.nautobot_api_endpoint = os.getenv("NAUTOBOT_API_ENDPOINT")
-        self.nautobot_token = os.getenv("NAUTOBOT_TOKEN")
-        self.nautobot_api_version = os.getenv("NAUTOBOT_API_VERSION")
+        self.nautobot_api_endpoint = settings.nautobot_api_endpoint
+        self.nautobot_token = settings.nautobot_token
+        self.nautobot_api_version = settings.nautobot_api_version
+        if page_size is None:
+            page_size = settings.nautobot_graphql_page_size
+        self.page_size = page_size
+        if metadata_cache is None and settings.nautobot_metadata_cache:
+            store = None
+            if settings.nautobot_metadata_cache_file:
+                from .metastore import open_metadata_store  # pylint: disable=import-outside-toplevel
+
+                store = open_metadata_store(settings)
+            metadata_cache = MetadataCache(poll_interval=settings.nautobot_changelog_poll_interval, store=store)
+        self.metadata_cache = metadata_cache
         self.nautobot = None
+        self._connection_lock = threading.Lock()
 
     @property
     def nb_connection(self):
         """Returns the connected pynautobot.api object."""
-        if self.nautobot is None:
-            try:
-                self.nautobot = pynautobot.api(url=self.nautobot_api_endpoint, token=self.nautobot_token)
-            except Exception as e:
-                print(repr(e))
-                return None
+        with self._connection_lock:
+            if self.nautobot is None:
+                try:
+                    from .sessions import get_session  # pylint: disable=import-outside-toplevel
+
+                    with metrics.timed("nautobot.connect"):
+                        nautobot = _pynautobot().api(url=self.nautobot_api_endpoint, token=self.nautobot_token)
+                    # Use the pooled session (keep-alive, timeouts, retries) shared by all readers
+                    session = get_session("NAUTOBOT")
+                    session.headers.update(nautobot.http_session.headers)
+                    nautobot.http_session.close()
+                    nautobot.http_session = session
+                    self.nautobot = nautobot
+                except Exception as e:
+                    logger.error(f"Error connecting to Nautobot: {e!r}")
+                    return None
         return self.nautobot
 
     def get_secrets_group_info_by_id(self, secrets_group_id: str) -> Optional[Dict[str, Any]]:
@@ -65,35 +153,255 @@ class SecretGroupinfo:
         Returns:
             Dict[str, Any]: The Nautobot secrets-group information.
         """
+        cache = self._synced_metadata_cache()
+        if cache is not None:
+            cached = cache.get_group(secrets_group_id)
+            if cached is not None:
+                return cached
         # Get the secret group information from Nautobot
         variables = {"secrets_group_id": secrets_group_id}
         try:
-            secret_group_info = self.nb_connection.graphql.query(  # type: ignore
-                query=self.GRAPHQL_QUERY, variables=variables
-            )
-        except pynautobot.core.graphql.GraphQLException as e:  # type: ignore
+            with metrics.timed("nautobot.graphql", query="secrets_group"):
+                secret_group_info = self.nb_connection.graphql.query(  # type: ignore
+                    query=self.GRAPHQL_QUERY, variables=variables
+                )
+        except _pynautobot().core.graphql.GraphQLException as e:
             logger.error(f"Error querying Nautobot: {e}")
             return None
-        return dict(secret_group_info.json["data"])
+        result = dict(secret_group_info.json["data"])
+        if cache is not None and result.get("secrets_group") is not None:
+            cache.set_group(secrets_group_id, result)
+        return result
+
+    def _object_changes(self, params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Yields the Nautobot object changes matching the REST API filter `params`."""
+        nautobot = self.nb_connection
+        url: Optional[str] = f"{nautobot.base_url}/extras/object-changes/"  # type: ignore
+        while url:
+            with metrics.timed("nautobot.rest", endpoint="extras/object-changes"):
+                response = nautobot.http_session.get(url, params=params, headers=nautobot.headers)  # type: ignore
+                response.raise_for_status()
+            data = response.json()
+            yield from data["results"]
+            url = data.get("next")
+            params = {}  # The next url contains the filter
+
+    def sync_metadata_cache(self) -> None:
+        """Drop the metadata cache entries changed in Nautobot since the last check of the change log.
+
+        On the first call, only the position in the change log is recorded. If the change log can not be
+        read, the cache is cleared and not used until the next successful check.
+        """
+        cache = self.metadata_cache
+        if cache is None:
+            return
+        with cache.poll_lock:
+            if not cache.poll_due():
+                return
+            try:
+                if cache.marker is None:
+                    cache.clear()
+                    latest = next(self._object_changes({"limit": 1}), None)
+                    cache.polled(latest["time"] if latest is not None else "", [latest] if latest else [])
+                    return
+                changes = []
+                for object_type in cache.WATCHED_OBJECT_TYPES:
+                    params = {"changed_object_type": object_type}
+                    if cache.marker:
+                        params["time_after"] = cache.marker
+                    changes.extend(change for change in self._object_changes(params) if cache.is_new(change))
+                invalidations = cache.invalidations
+                for change in changes:
+                    cache.apply_change(change)
+                metrics.count("metadata_invalidations", cache.invalidations - invalidations)
+                cache.polled(max((change["time"] for change in changes), default=None), changes)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error(f"Error reading the Nautobot change log, metadata cache disabled: {e!r}")
+                metrics.count_error("nautobot.changelog", e)
+                cache.clear()
+                cache.polled(None)
+
+    def _synced_metadata_cache(self) -> Optional[MetadataCache]:
+        """Returns the metadata cache after checking the change log if due, or None if it can not be used."""
+        cache = self.metadata_cache
+        if cache is None:
+            return None
+        if cache.poll_due():
+            self.sync_metadata_cache()
+        # Without a position in the change log, changes can not be detected
+        return cache if cache.marker is not None else None
+
+    @staticmethod
+    def _device_secrets_group(device: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Returns the secrets group of a device from the devices query.
+
+        If the device has no secrets-group, the secrets-group of the virtual chassis master is used.
+
+        Returns:
+            Tuple[str, Optional[Dict[str, Any]]]: The id of the device the secrets group is assigned to
+                and the secrets group.
+        """
+        source_id = device.get("id")
+        secrets_group = device.get("secrets_group")
+        if secrets_group is None:
+            # Get the master device of current virtual chassis if exists
+            master = (device.get("virtual_chassis") or {}).get("master")
+            if master is not None:
+                source_id = master.get("id")
+                secrets_group = master.get("secrets_group")
+        return source_id, secrets_group
+
+    def get_secrets_group_info_from_device_names(
+        self, device_names: Iterable[str], page_size: Optional[int] = None
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Get the secret group information of many Nautobot devices.
+
+        The devices, the secrets groups of their virtual chassis masters and the secrets of the groups are
+        resolved with one GraphQL request per `page_size` devices.
+
+        Args:
+            device_names (Iterable[str]): The Nautobot device-names.
+            page_size (int): Number of devices per GraphQL request. Default: `page_size` of the instance.
+
+        Returns:
+            Dict[str, Optional[Dict[str, Any]]]: The Nautobot secrets-group information by device-name.
+                None if the device does not exist or has no secrets-group. Devices that could not be
+                resolved, because the request failed or the name is not unique, are not included.
+        """
+        names = list(dict.fromkeys(device_names))
+        page_size = page_size or self.page_size
+        result: Dict[str, Optional[Dict[str, Any]]] = {}
+        cache = self._synced_metadata_cache()
+        if cache is not None:
+            uncached = []
+            for name in names:
+                found, group_id = cache.get_device(name)
+                if not found:
+                    uncached.append(name)
+                else:
+                    result[name] = cache.get_group(group_id) if group_id is not None else None
+            names = uncached
+        for start in range(0, len(names), page_size):
+            page = names[start : start + page_size]
+            variables = {"device_names": page}
+            try:
+                with metrics.timed("nautobot.graphql", query="devices"):
+                    response = self.nb_connection.graphql.query(  # type: ignore
+                        query=self.DEVICES_GRAPHQL_QUERY, variables=variables
+                    )
+            except _pynautobot().core.graphql.GraphQLException as e:
+                logger.error(f"Error querying Nautobot: {e}")
+                continue
+            devices: Dict[str, List[Dict[str, Any]]] = {}
+            for device in response.json["data"]["devices"]:
+                devices.setdefault(device["name"], []).append(device)
+            for name in page:
+                found = devices.get(name, [])
+                if len(found) > 1:
+                    logger.error(f"Error querying Nautobot: device name '{name}' is not unique.")
+                    continue
+                source_id, secrets_group = self._device_secrets_group(found[0]) if found else (None, None)
+                result[name] = {"secrets_group": secrets_group} if secrets_group is not None else None
+                if cache is not None:
+                    group_id = secrets_group["id"] if secrets_group is not None else None
+                    if result[name] is not None:
+                        cache.set_group(group_id, result[name])  # type: ignore
+                    cache.set_device(name, found[0]["id"] if found else None, source_id, group_id)
+        return result
+
+    @staticmethod
+    def _graphql_type(value: Any) -> str:
+        """Returns the GraphQL type of a device filter value."""
+        if isinstance(value, bool):
+            return "Boolean"
+        if isinstance(value, int):
+            return "Int"
+        return "[String]"
+
+    def iter_device_names(self, device_filter: Dict[str, Any], page_size: Optional[int] = None) -> Iterator[List[str]]:
+        """Yields the names of the Nautobot devices matching a filter, one GraphQL request per page.
+
+        Args:
+            device_filter (Dict[str, Any]): The filter arguments of the GraphQL `devices` query and their
+                value or list of values, e.g. `{"site": "vie01", "role": ["leaf", "spine"], "tag": "maintenance"}`.
+                Booleans and integers are passed as `Boolean` and `Int`, other values as `[String]`.
+            page_size (int): Number of devices per request. Default: `page_size` of the instance.
+
+        raises:
+            ValueError: If the filter is invalid or Nautobot can not be queried.
+        """
+        page_size = page_size or self.page_size
+        variables: Dict[str, Any] = {}
+        types: Dict[str, str] = {}
+        for name, value in device_filter.items():
+            if not _ARGUMENT_NAME.match(name) or name in ("limit", "offset"):
+                raise ValueError(f"Invalid device filter {name!r}")
+            types[name] = self._graphql_type(value)
+            if types[name] != "[String]":
+                variables[name] = value
+            elif isinstance(value, (list, tuple, set)):
+                variables[name] = [str(item) for item in value]
+            else:
+                variables[name] = [str(value)]
+        declarations = "".join(f", ${name}: {graphql_type}" for name, graphql_type in types.items())
+        arguments = "".join(f", {name}: ${name}" for name in types)
+        query = (
+            f"query ($limit: Int, $offset: Int{declarations}) "
+            f"{{ devices(limit: $limit, offset: $offset{arguments}) {{ name }} }}"
+        )
+        offset = 0
+        while True:
+            try:
+                with metrics.timed("nautobot.graphql", query="device_names"):
+                    response = self.nb_connection.graphql.query(  # type: ignore
+                        query=query, variables=dict(variables, limit=page_size, offset=offset)
+                    )
+            except _pynautobot().core.graphql.GraphQLException as e:
+                raise ValueError(f"Error querying Nautobot: {e}") from e
+            devices = response.json["data"]["devices"]
+            names = [device["name"] for device in devices if device["name"]]
+            if names:
+                yield names
+            if len(devices) < page_size:
+                return
+            offset += page_size
+
+    def get_device_names(self, device_filter: Dict[str, Any]) -> List[str]:
+        """Returns the names of the Nautobot devices matching a filter (see `iter_device_names()`).
+
+        raises:
+            ValueError: If the filter is invalid or Nautobot can not be queried.
+        """
+        names: Dict[str, None] = {}
+        for page in self.iter_device_names(device_filter):
+            names.update(dict.fromkeys(page))
+        return list(names)
+
+    def get_secrets_group_id_from_device_name(self, device_name: str) -> Optional[str]:
+        """Get the secrets-group ID assigned to a Nautobot device.
+
+        If the device has no secrets-group, the secrets-group of the virtual chassis master is used.
+
+        Args:
+            device_name (str): The Nautobot device-name.
+
+        Returns:
+            str: The Nautobot secrets-group ID or None.
+        """
+        secret_group_info = self.get_secrets_group_info_from_device_name(device_name)
+        if secret_group_info is None:
+            return None
+        return secret_group_info["secrets_group"]["id"]
 
     def get_secrets_group_info_from_device_name(self, device_name: str) -> Optional[Dict[str, Any]]:
         """Get the secret group information from a Nautobot device name.
 
+        The device and its secrets group are resolved with a single GraphQL request.
+
         Args:
             device_name (str): The Nautobot device-name.
 
         Returns:
             Dict[str, Any]: The Nautobot secrets-group information.
         """
-        device = self.nb_connection.dcim.devices.get(name=device_name)  # type: ignore
-        if device is not None and device.secrets_group is None:
-            # Get the master device of current virtual chassis if exists
-            if device.virtual_chassis is not None:
-                virtual_chassis = device.virtual_chassis
-                if virtual_chassis.master is not None:
-                    device = virtual_chassis.master
-        if device is None or device.secrets_group is None:
-            return None
-        secrets_group_id = device.secrets_group.id
-        # Return the secret group information
-        return self.get_secrets_group_info_by_id(secrets_group_id)
+        return self.get_secrets_group_info_from_device_names([device_name]).get(device_name)
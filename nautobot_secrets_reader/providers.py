@@ -0,0 +1,180 @@
+"""Secrets providers: read the secret values of Nautobot secrets from their backend."""
+import importlib
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Type
+
+from .cache import SecretCache
+
+logger = logging.getLogger(__name__)
+
+# Entry point group of the secrets providers installed by other packages.
+ENTRY_POINT_GROUP = "nautobot_secrets_reader.providers"
+
+
+class SecretsProvider(ABC):
+    """Base class of the secrets providers.
+
+    A provider serves the Nautobot secrets whose `provider` is one of its `slugs`. Providers are
+    registered with `register_provider()` or by other packages through the entry point group
+    `nautobot_secrets_reader.providers`, e.g. in `pyproject.toml`:
+
+        [tool.poetry.plugins."nautobot_secrets_reader.providers"]
+        "my-vault" = "my_package.providers:MyVaultSecretsProvider"
+
+    Args:
+        cache (SecretCache): The cache of the `SecretsReader`, for providers with expensive lookups.
+    """
+
+    slugs: Tuple[str, ...] = ()  # The Nautobot secrets provider slugs served by the provider.
+
+    def __init__(self, cache: SecretCache) -> None:
+        self.cache = cache
+
+    def source_key(self, parameters: Dict[str, Any]) -> Hashable:
+        """Returns the key of the backend object read for the secret parameters.
+
+        Secrets with the same source key are read with one `fetch_many()` call, so that providers can
+        answer them from one backend request.
+
+        Args:
+            parameters (Dict[str, Any]): The parameters of the Nautobot secret.
+        """
+        return parameters_key(parameters)
+
+    @abstractmethod
+    def fetch_many(self, parameters_list: List[Dict[str, Any]]) -> List[Any]:
+        """Read the values of many secrets.
+
+        Args:
+            parameters_list (List[Dict[str, Any]]): The parameters of the Nautobot secrets.
+
+        Returns:
+            List[Any]: The secret values, in the order of `parameters_list`. A secret that can not be
+                read is returned as the exception describing the error.
+        """
+
+    def fetch(self, parameters: Dict[str, Any]) -> Any:
+        """Read the value of a secret.
+
+        Args:
+            parameters (Dict[str, Any]): The parameters of the Nautobot secret.
+
+        raises:
+            Exception: The error of the provider, if the secret can not be read.
+        """
+        value = self.fetch_many([parameters])[0]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+class EnvironmentVariableSecretsProvider(SecretsProvider):
+    """Read secrets from environment variables (Nautobot provider `environment-variable`)."""
+
+    slugs = ("environment-variable",)
+
+    def fetch_many(self, parameters_list: List[Dict[str, Any]]) -> List[Any]:
+        result: List[Any] = []
+        for parameters in parameters_list:
+            variable = parameters.get("variable")
+            if variable in os.environ:
+                result.append(os.environ[variable])
+            else:
+                result.append(ValueError(f"Environment variable '{variable}' is not defined."))
+        return result
+
+
+class TextFileSecretsProvider(SecretsProvider):
+    """Read secrets from text files (Nautobot provider `text-file`)."""
+
+    slugs = ("text-file",)
+
+    def fetch_many(self, parameters_list: List[Dict[str, Any]]) -> List[Any]:
+        result: List[Any] = []
+        for parameters in parameters_list:
+            try:
+                result.append(Path(parameters["path"]).read_text().strip())
+            except (KeyError, OSError) as err:
+                result.append(ValueError(f"Secrets file '{parameters.get('path')}' can not be read: {err}"))
+        return result
+
+
+_providers: Dict[str, Type[SecretsProvider]] = {}
+_providers_lock = threading.Lock()
+_entry_points_loaded = False
+
+# Providers of this package, imported when first used: slug -> "module:class"
+_BUILTIN_PROVIDERS = {
+    "thycotic-tss-id": "nautobot_secrets_reader.delinea:ThycoticSecretServerSecretsProvider",
+    "thycotic-tss-path": "nautobot_secrets_reader.delinea:ThycoticSecretServerSecretsProvider",
+}
+
+
+def parameters_key(parameters: Dict[str, Any]) -> str:
+    """Returns a hashable key identifying the secret parameters."""
+    return json.dumps(parameters, sort_keys=True, default=str)
+
+
+def register_provider(provider_class: Type[SecretsProvider]) -> Type[SecretsProvider]:
+    """Register a secrets provider for its slugs. Can be used as class decorator.
+
+    Args:
+        provider_class (Type[SecretsProvider]): The provider class.
+    """
+    with _providers_lock:
+        for slug in provider_class.slugs:
+            _providers[slug] = provider_class
+    return provider_class
+
+
+def _load_entry_points() -> None:
+    """Register the providers of the installed packages (once)."""
+    global _entry_points_loaded  # pylint: disable=global-statement
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    # pylint: disable=import-outside-toplevel
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python 3.7: the backport
+        try:
+            from importlib_metadata import entry_points  # type: ignore
+        except ImportError:
+            logger.warning(
+                "The secrets providers of other packages are not available: install importlib-metadata on Python 3.7."
+            )
+            return
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, "select"):
+        group = all_entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        group = all_entry_points.get(ENTRY_POINT_GROUP, [])
+    for entry_point in group:
+        try:
+            register_provider(entry_point.load())
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Error loading secrets provider '{entry_point.name}': {e!r}")
+
+
+def get_provider_class(slug: str) -> Optional[Type[SecretsProvider]]:
+    """Returns the provider class registered for a Nautobot secrets provider slug or None."""
+    _load_entry_points()
+    if slug not in _providers and slug in _BUILTIN_PROVIDERS:
+        module_name, class_name = _BUILTIN_PROVIDERS[slug].split(":")
+        register_provider(getattr(importlib.import_module(module_name), class_name))
+    return _providers.get(slug)
+
+
+def available_providers() -> List[str]:
+    """Returns the slugs of all registered secrets providers."""
+    _load_entry_points()
+    return sorted(set(_providers) | set(_BUILTIN_PROVIDERS))
+
+
+register_provider(EnvironmentVariableSecretsProvider)
+register_provider(TextFileSecretsProvider)
@@ -0,0 +1,228 @@
+"""Deadlines and circuit breakers bounding the time spent waiting for a slow or failing backend."""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Tuple, Union
+
+from urllib3.util.retry import Retry
+
+from . import metrics
+from .settings import DEFAULT_CIRCUIT_FAILURES, DEFAULT_CIRCUIT_MAX_RESET, DEFAULT_CIRCUIT_RESET
+
+logger = logging.getLogger(__name__)
+
+
+class BackendUnavailableError(ValueError):
+    """The backend did not answer in time, could not be reached or answered with a server error.
+
+    The readers serve the last known value of a secret for these errors, if the policy allows it
+    (see `SECRETS_READER_STALE_TTL`).
+    """
+
+
+class DeadlineExceededError(BackendUnavailableError):
+    """The deadline of the call expired before the backend answered."""
+
+
+class CircuitOpenError(BackendUnavailableError):
+    """The circuit of the backend is open, the request was not sent."""
+
+
+class Deadline:
+    """The time (monotonic clock) by which a call must be finished.
+
+    Args:
+        timeout (float): Time (seconds) from now.
+    """
+
+    __slots__ = ("expires",)
+
+    def __init__(self, timeout: float) -> None:
+        self.expires = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        """Returns the time (seconds) left, 0 if the deadline has expired."""
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def check(self, what: str = "The call") -> None:
+        """Raise DeadlineExceededError if the deadline has expired."""
+        if self.expired:
+            metrics.count("deadline_exceeded")
+            raise DeadlineExceededError(f"{what} did not finish within its deadline.")
+
+
+# Deadline of the calls of the current thread (see deadline())
+_local = threading.local()
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Returns the deadline of the current thread, None if its calls are not bounded."""
+    return getattr(_local, "deadline", None)
+
+
+@contextmanager
+def use_deadline(value: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Bound the calls of the current thread within the context by `value`, e.g. the deadline of a batch."""
+    previous = current_deadline()
+    _local.deadline = value
+    try:
+        yield value
+    finally:
+        _local.deadline = previous
+
+
+@contextmanager
+def deadline(timeout: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """Bound the calls of the current thread within the context to `timeout` seconds.
+
+    The HTTP requests sent within the context wait at most the time left (see `bounded_timeout()`) and
+    are not retried after the deadline. The deadline of an enclosing context is kept if it expires first.
+
+    Args:
+        timeout (float): Time (seconds) from now. `None` or `0`: no further bound.
+    """
+    outer = current_deadline()
+    if not timeout or timeout <= 0:
+        yield outer
+        return
+    value = Deadline(timeout)
+    if outer is not None and outer.expires <= value.expires:
+        value = outer
+    with use_deadline(value):
+        yield value
+
+
+Timeout = Union[None, float, Tuple[Optional[float], Optional[float]]]
+
+
+def bounded_timeout(timeout: Timeout) -> Timeout:
+    """Returns the timeout of a request (seconds or `(connect, read)`), capped at the time left to the deadline.
+
+    raises:
+        DeadlineExceededError: If the deadline of the current thread has expired.
+    """
+    current = current_deadline()
+    if current is None:
+        return timeout
+    current.check("The request")
+    remaining = current.remaining()
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(remaining if part is None else min(part, remaining) for part in timeout)  # type: ignore
+    return min(timeout, remaining)
+
+
+class DeadlineRetry(Retry):
+    """urllib3 `Retry` that does not retry after the deadline of the thread and does not wait beyond it."""
+
+    def increment(self, *args: Any, **kwargs: Any) -> Retry:  # pylint: disable=signature-differs
+        current = current_deadline()
+        if current is not None and current.expired:
+            # No retries left: the last response is returned, or the error raised
+            return Retry.increment(self.new(total=0), *args, **kwargs)
+        return super().increment(*args, **kwargs)
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        current = current_deadline()
+        return backoff if current is None else min(backoff, current.remaining())
+
+    def get_retry_after(self, response: Any) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        current = current_deadline()
+        return retry_after if retry_after is None or current is None else min(retry_after, current.remaining())
+
+
+class CircuitBreaker:
+    """Stops sending requests to a backend that keeps failing, for a time growing exponentially.
+
+    After `failures` consecutive failed requests the circuit opens: requests fail immediately with
+    CircuitOpenError for `reset_timeout` seconds. Then one trial request is sent (half-open). If it
+    succeeds, the circuit closes; if it fails, the circuit opens again for twice the time, at most
+    `max_reset_timeout` seconds.
+
+    Args:
+        name (str): The backend, for the log and the metrics.
+        failures (int): Consecutive failures opening the circuit. `0` disables the breaker.
+        reset_timeout (float): Time (seconds) the circuit stays open the first time.
+        max_reset_timeout (float): Maximum time (seconds) the circuit stays open.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failures: int = DEFAULT_CIRCUIT_FAILURES,
+        reset_timeout: float = DEFAULT_CIRCUIT_RESET,
+        max_reset_timeout: float = DEFAULT_CIRCUIT_MAX_RESET,
+    ) -> None:
+        self.name = name
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.consecutive_failures = 0
+        self.openings = 0  # Consecutive openings, the circuit stays open twice as long every time
+        self.open_until = 0.0
+        self._trial = False  # A trial request of the half-open circuit is running
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Returns 'closed', 'open' or 'half-open' (a trial request may be sent)."""
+        if not self.openings:
+            return "closed"
+        return "open" if self._trial or time.monotonic() < self.open_until else "half-open"
+
+    def before_call(self) -> None:
+        """Call before sending a request.
+
+        raises:
+            CircuitOpenError: If the circuit is open, or a trial request is already running.
+        """
+        if self.failures <= 0:
+            return
+        with self._lock:
+            if not self.openings:
+                return
+            now = time.monotonic()
+            if self._trial or now < self.open_until:
+                metrics.count("circuit_rejections", backend=self.name)
+                raise CircuitOpenError(
+                    f"{self.name} is unavailable, requests are suspended for {max(0.0, self.open_until - now):.1f}s."
+                )
+            self._trial = True
+
+    def record(self, success: Optional[bool]) -> None:
+        """Call with the outcome of a request allowed by `before_call()`.
+
+        Args:
+            success (Optional[bool]): True if the backend answered, False if it failed, None if the outcome
+                tells nothing about the backend, e.g. the deadline of the caller expired.
+        """
+        if self.failures <= 0:
+            return
+        with self._lock:
+            trial, self._trial = self._trial, False
+            if success is None:
+                return
+            if success:
+                if self.openings:
+                    logger.info(f"{self.name} is available again, the circuit is closed.")
+                self.consecutive_failures = 0
+                self.openings = 0
+                return
+            self.consecutive_failures += 1
+            if self.openings and not trial:
+                return  # A request sent before the circuit opened
+            if not self.openings and self.consecutive_failures < self.failures:
+                return
+            self.openings += 1
+            open_time = min(self.reset_timeout * 2 ** min(self.openings - 1, 32), self.max_reset_timeout)
+            self.open_until = time.monotonic() + open_time
+        logger.warning(f"{self.name} is failing, suspending its requests for {open_time:.1f}s.")
+        metrics.count("circuit_opened", backend=self.name)
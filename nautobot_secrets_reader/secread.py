@@ -1,79 +1,358 @@
 """Access secrets provides by Nautobot secrets providers."""
-from typing import Any, Callable, Dict, List, Tuple, Optional, Union
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Set,
+    Tuple,
+    Optional,
+    Union,
+)
 
+from . import metrics
+from .cache import CacheRefresher, SecretCache, is_stale
+from .credentials import Credential, CredentialSet
 from .nbinfo import SecretGroupinfo
-from .delinea import ThycoticSecretServerSecretsReader
+from .providers import SecretsProvider, get_provider_class, parameters_key
+from .resilience import BackendUnavailableError, DeadlineExceededError, current_deadline, deadline, use_deadline
+from .settings import DEFAULT_MAX_WORKERS, get_settings  # noqa: F401
 
 import logging
+import threading
+
+if TYPE_CHECKING:  # The Secret Server SDK is imported when the first Thycotic secret is read
+    from .agent import AgentClient
+    from .delinea import ThycoticSecretServerSecretsReader
 
 logger = logging.getLogger(__name__)
 
-# Initialize logging to console
-logger.setLevel(logging.INFO)
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+
+@dataclass
+class BulkCredentials:
+    """Result of the bulk credential queries.
+
+    Attributes:
+        credentials (Dict[str, CredentialSet]): The credentials by device name or secrets group id.
+            Devices using the same secrets group share one `CredentialSet`.
+        errors (Dict[str, str]): The error message by device name or secrets group id, for the entries
+            whose credentials could not be read.
+    """
+
+    credentials: Dict[str, CredentialSet] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+class LazyCredential(dict):
+    """Credential whose `value` is read from the secrets provider on first access.
+
+    The credential behaves like the dictionaries returned by `read_credentials()`. The key `value` is
+    added when it is accessed the first time (`cred["value"]`, `cred.get("value")` or `cred.value`).
+    """
+
+    def __init__(self, loader: Callable[[], str], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._loader = loader
+        self._lock = threading.Lock()
+
+    def __missing__(self, key: str) -> Any:
+        if key != "value":
+            raise KeyError(key)
+        with self._lock:
+            if not self.loaded:
+                self["value"] = self._loader()
+        return dict.__getitem__(self, "value")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "value":
+            return self["value"]
+        return super().get(key, default)
+
+    @property
+    def loaded(self) -> bool:
+        """Returns True if the value was read from the secrets provider."""
+        return dict.__contains__(self, "value")
+
+    @property
+    def value(self) -> str:
+        """Returns the secret value, reading it from the secrets provider on first access."""
+        return self["value"]
+
+    def to_dict(self, stale: bool = False) -> Dict[str, Any]:
+        """Returns the credential as dictionary, reading the secret value if not yet read.
+
+        Args:
+            stale (bool): Add `"stale": true` if the value is stale (see `Credential.to_dict()`).
+        """
+        result = dict(self, value=self["value"])
+        if stale and is_stale(result["value"]):
+            result["stale"] = True
+        return result
+
+
+@dataclass
+class WarmResult:
+    """Result of `SecretsReader.warm()`.
+
+    Attributes:
+        devices (int): Number of devices whose credentials were read.
+        secrets_groups (int): Number of distinct secrets groups of the devices.
+        secrets (int): Number of distinct secrets read into the cache.
+        errors (Dict[str, str]): The error message by device name, for the devices whose credentials
+            could not be read.
+    """
+
+    devices: int = 0
+    secrets_groups: int = 0
+    secrets: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class DeviceCredentials:
+    """Credentials of a device, as yielded by `SecretsReader.iter_credentials_for_devices()`.
+
+    Attributes:
+        device (str): The device name.
+        credentials (CredentialSet): The credentials. Empty if the device has no secrets group or
+            its credentials could not be read.
+        error (Optional[str]): The error message, if the credentials could not be read.
+    """
+
+    device: str
+    credentials: CredentialSet = field(default_factory=CredentialSet)
+    error: Optional[str] = None
+
+
+# Order of the devices yielded by `SecretsReader.iter_credentials_for_devices()`
+DEVICE_ORDERS = ("input", "completion")
+
+# Filter of the access_type / secret_type of the credentials: a single value or a list of values.
+CredentialFilter = Optional[Union[str, Iterable[str]]]
+
+
+def _filter_values(values: CredentialFilter) -> Optional[Set[str]]:
+    """Returns the lower case filter values or None if not filtered."""
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    return {value.lower() for value in values}
+
+
+def filter_associations(
+    associations: Iterable[Dict[str, Any]], access_type: CredentialFilter = None, secret_type: CredentialFilter = None
+) -> List[Dict[str, Any]]:
+    """Returns the secrets group associations matching the access and secret types (case insensitive).
+
+    Args:
+        associations (Iterable[Dict[str, Any]]): The secrets group associations.
+        access_type (CredentialFilter): The access type(s), e.g. 'SSH'. None selects all.
+        secret_type (CredentialFilter): The secret type(s), e.g. 'PASSWORD'. None selects all.
+    """
+    access_types = _filter_values(access_type)
+    secret_types = _filter_values(secret_type)
+    return [
+        sec_info
+        for sec_info in associations
+        if (access_types is None or sec_info["access_type"].lower() in access_types)
+        and (secret_types is None or sec_info["secret_type"].lower() in secret_types)
+    ]
 
 
 class SecretsReader:
-    """Access secrets provides by Nautobot secrets providers."""
+    """Access secrets provides by Nautobot secrets providers.
+
+    Secret values are cached, so that secrets shared by several associations, groups or devices
+    are read only once from the secrets provider.
 
-    def __init__(self):
+    When the socket of the credential agent (`nautobot-secrets-reader agent`) exists,
+    `get_credentials_for_device()` and `get_credentials_for_secrets_group_id()` are answered by the
+    agent. If the agent can not be reached, the reader falls back to reading the credentials itself.
+
+    Args:
+        cache_ttl (float): Time (seconds) a secret is cached.
+            Default: environment variable `SECRETS_READER_CACHE_TTL` or 300.
+        cache_max_entries (int): Maximum number of cached secrets.
+            Default: environment variable `SECRETS_READER_CACHE_MAX_ENTRIES` or 1024.
+        max_workers (int): Number of concurrent requests of the bulk queries.
+            Default: environment variable `SECRETS_READER_MAX_WORKERS` or 8.
+        use_agent (bool): Send the queries to the credential agent if its socket exists.
+            Default: environment variable `SECRETS_READER_USE_AGENT` or True.
+        timeout (float): Deadline (seconds) of the queries of one device, secrets group or secret.
+            `0`: bounded by the HTTP timeouts only. Default: environment variable `SECRETS_READER_TIMEOUT` or 0.
+        batch_timeout (float): Deadline (seconds) of the bulk queries. `0`: bounded by the HTTP timeouts only.
+            Default: environment variable `SECRETS_READER_BATCH_TIMEOUT` or 0.
+    """
+
+    def __init__(
+        self,
+        cache_ttl: Optional[float] = None,
+        cache_max_entries: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        use_agent: Optional[bool] = None,
+        timeout: Optional[float] = None,
+        batch_timeout: Optional[float] = None,
+    ):
         """Initialize the SecretsReader class."""
+        settings = get_settings()
         # Instantiate Nautobot access object
-        self.nbot = SecretGroupinfo()
-        self.secret_tss_result = None
-        self.secret_id = None
-        self.secret_path = None
+        self.nbot = SecretGroupinfo(settings=settings)
+        if cache_ttl is None:
+            cache_ttl = settings.secrets_reader_cache_ttl
+        if cache_max_entries is None:
+            cache_max_entries = settings.secrets_reader_cache_max_entries
+        # Expired secrets are kept for stale_ttl seconds, to be used while the secrets provider is unavailable
+        self.cache = SecretCache(
+            ttl=cache_ttl, max_entries=cache_max_entries, stale_ttl=settings.secrets_reader_stale_ttl
+        )
+        if max_workers is None:
+            max_workers = settings.secrets_reader_max_workers
+        self.max_workers = max_workers
+        self.timeout = settings.secrets_reader_timeout if timeout is None else timeout
+        self.batch_timeout = settings.secrets_reader_batch_timeout if batch_timeout is None else batch_timeout
+        self._providers: Dict[str, SecretsProvider] = {}
+        self._providers_lock = threading.Lock()
+        self.refresher: Optional[CacheRefresher] = None
+        self.agent: Optional["AgentClient"] = None
+        if use_agent is None:
+            use_agent = settings.secrets_reader_use_agent
+        if use_agent:
+            from .agent import agent_client  # pylint: disable=import-outside-toplevel
+
+            self.agent = agent_client(settings.secrets_reader_agent_socket)
+
+    def _ask_agent(self, method: str, *args: Any, **kwargs: Any) -> Optional[List[Dict[str, Any]]]:
+        """Returns the answer of the credential agent, None if there is no agent or it can not be reached."""
+        agent = self.agent
+        if agent is None:
+            return None
+        from .agent import AgentUnavailableError  # pylint: disable=import-outside-toplevel
 
-    def get_secret_tss(self, parameters: Dict[str, Any]) -> str:
+        try:
+            return getattr(agent, method)(*args, **kwargs)
+        except AgentUnavailableError as err:
+            logger.warning(f"{err}, reading the credentials without the agent.")
+            metrics.count_error("agent", err)
+            self.agent = None
+            return None
+
+    def get_provider(self, provider: str) -> SecretsProvider:
+        """Returns the secrets provider of a Nautobot secrets provider slug (created on first use).
+
+        Args:
+            provider (str): The Nautobot secrets provider, e.g. 'thycotic-tss-id'.
+
+        raises:
+            ValueError: If the secrets provider is not supported.
+        """
+        instance = self._providers.get(provider)
+        if instance is None:
+            provider_class = get_provider_class(provider)
+            if provider_class is None:
+                raise ValueError(f"Secrets Provider ({provider}) is not suppoted!")
+            with self._providers_lock:
+                # Providers serving several slugs share one instance
+                instance = next((p for p in self._providers.values() if type(p) is provider_class), None)
+                if instance is None:
+                    instance = provider_class(cache=self.cache)
+                self._providers[provider] = instance
+        return instance
+
+    @property
+    def tss(self) -> "ThycoticSecretServerSecretsReader":
+        """Returns the Thycotic/Delinea Secret Server reader (created on first use)."""
+        return self.get_provider("thycotic-tss-id").tss  # type: ignore
+
+    def get_secret_tss(self, parameters: Dict[str, Any], timeout: Optional[float] = None) -> str:
         """Returns the secret value from Thycotic/Delinea Secret Server.
 
-        This function cashes the result so that retieving a different field of the
-        same secret, will not trigger a Thycotic/Delinea Secret Server API call.
+        Only the selected field is read from Thycotic/Delinea Secret Server (see
+        `get_secret_field_values()`), and the values read are cached.
 
         Args:
             parameters (Dict[str, Any]): The parameters as returned from Nautobot.
+            timeout (float): Deadline (seconds) of the call. Default: `timeout` of the reader.
         Returns:
-            str: The secret value.
+            str: The secret value. A `StaleValue` if Secret Server is unavailable and the expired value is used.
+
+        raises:
+            ValueError: If the secret can not be read, `BackendUnavailableError` if Secret Server is unavailable.
+            KeyError: If the secret does not have the selected field.
         """
         secret_id = None
         secret_path = None
         try:
-            try:
-                secret_id = parameters["secret_id"]
-            except KeyError:
-                secret_path = parameters["secret_path"]
-            # Check if the secret is already read
-            if self.secret_tss_result is None or self.secret_id != secret_id or self.secret_path != secret_path:
-                # Perform API call to Thycotic/Delinea Secret Server
-                connection = ThycoticSecretServerSecretsReader()
-                self.secret_tss_result = connection.query_thycotic_secret_server(
-                    secret_id=secret_id, secret_path=secret_path
+            with deadline(self.timeout if timeout is None else timeout):
+                try:
+                    secret_id = parameters["secret_id"]
+                except KeyError:
+                    secret_path = parameters["secret_path"]
+                # Read the secret fields from cache or Thycotic/Delinea Secret Server
+                fields = self.tss.get_secret_field_values(
+                    [parameters["secret_selected_value"]], secret_id=secret_id, secret_path=secret_path
                 )
-                self.secret_id = secret_id
-                self.secret_path = secret_path
             # Return the secret value
-            return self.secret_tss_result.fields[parameters["secret_selected_value"]].value  # type: ignore
-        except ValueError:
+            return fields[parameters["secret_selected_value"]]
+        except ValueError as err:
+            metrics.count_error("read_secret", err)
             msg = (
                 f"ERROR Reading the Thycotic secret Id:{str(secret_id) if secret_id is not None else 'None'}, "
-                f"Path: {str(secret_path) if secret_path is not None else 'None'}!"
+                f"Path: {str(secret_path) if secret_path is not None else 'None'}: {err}"
             )
             logger.error(msg)
-            print(msg)
-        return ""
+            raise
+
+    def invalidate_secret(self, provider: str, secret_id_or_path: str) -> bool:
+        """Remove a secret from the cache, e.g. after its value was changed.
+
+        Args:
+            provider (str): The Nautobot secrets provider, e.g. 'thycotic-tss-id'.
+            secret_id_or_path (str): The secret id or path, as configured in the Nautobot secret parameters.
+
+        Returns:
+            bool: True if the secret was cached.
+        """
+        # The fields of the secret read one by one are cached with the field slug appended to the key
+        return self.cache.invalidate_prefix((provider, str(secret_id_or_path))) > 0
+
+    def clear_cache(self) -> None:
+        """Remove all secrets from the cache."""
+        self.cache.clear()
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Returns the cache statistics (entries, max_entries, hits, misses and evictions)."""
+        return self.cache.stats()
 
-    def read_credentials(self, secrets_group_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def read_credentials(
+        self,
+        secrets_group_data: Dict[str, Any],
+        access_type: CredentialFilter = None,
+        secret_type: CredentialFilter = None,
+        lazy: bool = False,
+    ) -> CredentialSet:
         """Read and Parse secrets_group_data and return a list of all credentials in secrets group.
 
+        Only the secrets of the associations matching `access_type` and `secret_type` are read
+        from the secrets provider.
+
         Args:
             secrets_group_id (secrets_group_data: Dict[str, Any]): The secrets group id.
+            access_type (CredentialFilter): Only return credentials of this access type(s), e.g. 'SSH'.
+            secret_type (CredentialFilter): Only return credentials of this secret type(s), e.g. 'PASSWORD'.
+            lazy (bool): Return `LazyCredential`s, which read the secret value on first access.
 
         Returns:
-            List[Dict[str, Any]]: The list of all credentials in secrets group.
+            CredentialSet: All credentials in secrets group. `to_dicts()` returns them as list of dictionaries.
 
             example: [ {'access_type': 'GENERIC',
                         'secret_description': 'Cisco Switches ATBRKHKP',
@@ -88,44 +367,557 @@ class SecretsReader:
             ValueError: If the secrets provider is not supported.
         """
         if secrets_group_data is None:
-            return []
+            return CredentialSet()
         if not "secrets_group" in secrets_group_data:
-            return []
+            return CredentialSet()
 
-        result: List[Dict[str, Any]] = []
-        for sec_info in secrets_group_data["secrets_group"]["secretsgroupassociation_set"]:
+        associations = filter_associations(
+            self._associations(secrets_group_data), access_type=access_type, secret_type=secret_type
+        )
+        # Group the associations by provider, so that each provider reads its secrets with one call
+        by_provider: Dict[str, List[int]] = {}
+        for index, sec_info in enumerate(associations):
             provider = sec_info["secret"]["provider"]
+            self.get_provider(provider)
+            by_provider.setdefault(provider, []).append(index)
 
-            secrets_info = dict(
-                access_type=sec_info["access_type"],  #           e.g.: 'SSH'
-                secret_type=sec_info["secret_type"],  #                 'PASSWORD'
-                secret_name=sec_info["secret"]["name"],  #              'Checkpoint FWDC - USR'
-                secret_slug=sec_info["secret"]["slug"],  #              'checkpoint_fwdc-usr'
-                secret_id=sec_info["secret"]["id"],  #                  '7d195c23-2e2c-4ced-b496-b7e524205a62'
-                secret_provider=sec_info["secret"]["provider"],  #      'thycotic-tss-id'
-                secret_description=sec_info["secret"]["description"],  # 'Datacenter Firewall Cluster'
-                value="",  # The empty secret
+        if lazy:
+            lazy_credentials = []
+            for sec_info in associations:
+                secrets_info = self._secrets_info(sec_info)
+                del secrets_info["value"]
+                lazy_credentials.append(
+                    LazyCredential(lambda sec_info=sec_info: self._read_secret(sec_info), **secrets_info)
+                )
+            return CredentialSet(lazy_credentials)
+        values: List[Any] = [""] * len(associations)
+        for provider, indexes in by_provider.items():
+            provider_values = self.get_provider(provider).fetch_many(
+                [associations[index]["secret"]["parameters"] for index in indexes]
             )
-            func: Callable[[Dict[Any, str]], str] = None  # type: ignore
-            if provider in ["thycotic-tss-id", "thycotic-tss-path"]:
-                func = self.get_secret_tss
-            # elif provider in ...
+            for index, value in zip(indexes, provider_values):
+                values[index] = self._secret_value(associations[index], value)
+        return CredentialSet(
+            Credential.from_association(sec_info, value) for sec_info, value in zip(associations, values)
+        )
+
+    def _read_secret(self, sec_info: Dict[str, Any]) -> Any:
+        """Read the secret value of a secrets group association from its provider."""
+        provider = self.get_provider(sec_info["secret"]["provider"])
+        return self._secret_value(sec_info, provider.fetch_many([sec_info["secret"]["parameters"]])[0])
+
+    @staticmethod
+    def _secret_value(sec_info: Dict[str, Any], value: Any) -> Any:
+        """Returns the secret value read by a provider for a secrets group association.
+
+        Secrets that can not be read (ValueError) are logged and returned as empty string, unless the
+        secrets provider is unavailable (BackendUnavailableError, e.g. the deadline expired): that is raised.
+        """
+        if isinstance(value, BackendUnavailableError):
+            metrics.count_error("read_secret", value)
+            raise value
+        if isinstance(value, ValueError):
+            secret = sec_info["secret"]
+            msg = f"ERROR Reading the secret {secret['name']} ({secret['provider']}): {value}"
+            logger.error(msg)
+            metrics.count_error("read_secret", value)
+            return ""
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    @staticmethod
+    def _secrets_info(sec_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the credential of a secrets group association, without the secret value."""
+        return dict(
+            access_type=sec_info["access_type"],  #           e.g.: 'SSH'
+            secret_type=sec_info["secret_type"],  #                 'PASSWORD'
+            secret_name=sec_info["secret"]["name"],  #              'Checkpoint FWDC - USR'
+            secret_slug=sec_info["secret"]["slug"],  #              'checkpoint_fwdc-usr'
+            secret_id=sec_info["secret"]["id"],  #                  '7d195c23-2e2c-4ced-b496-b7e524205a62'
+            secret_provider=sec_info["secret"]["provider"],  #      'thycotic-tss-id'
+            secret_description=sec_info["secret"]["description"],  # 'Datacenter Firewall Cluster'
+            value="",  # The empty secret
+        )
+
+    def _run_concurrently(
+        self, func: Callable[[Any], Any], items: List[Any], max_workers: Optional[int] = None
+    ) -> Tuple[Dict[Any, Any], Dict[Any, Exception]]:
+        """Call `func` for every item on a bounded thread pool.
+
+        The calls run within the deadline of the calling thread. The items whose call has not finished when
+        the deadline expires get a DeadlineExceededError; their threads are not waited for.
+
+        Returns:
+            Tuple[Dict[Any, Any], Dict[Any, Exception]]: The results and the raised exceptions by item.
+        """
+        results: Dict[Any, Any] = {}
+        errors: Dict[Any, Exception] = {}
+        if not items:
+            return results, errors
+        workers = min(max_workers or self.max_workers, len(items))
+        if workers == 1:  # No thread pool, e.g. in the tasks of iter_credentials_for_devices()
+            for item in items:
+                try:
+                    results[item] = func(item)
+                except Exception as err:  # pylint: disable=broad-except
+                    errors[item] = err
+            return results, errors
+        current = current_deadline()
+
+        def call(item: Any) -> Any:
+            with use_deadline(current):
+                return func(item)
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = {executor.submit(call, item): item for item in items}
+        try:
+            for future in as_completed(futures, timeout=None if current is None else current.remaining()):
+                item = futures[future]
+                try:
+                    results[item] = future.result()
+                except Exception as err:  # pylint: disable=broad-except
+                    errors[item] = err
+        except FuturesTimeoutError:
+            for future, item in futures.items():
+                if item in results or item in errors:
+                    continue
+                if future.cancel() or not future.done():
+                    metrics.count("deadline_exceeded")
+                    errors[item] = DeadlineExceededError(f"Reading {item} did not finish within the deadline.")
+                elif future.exception() is not None:
+                    errors[item] = future.exception()  # type: ignore
+                else:
+                    results[item] = future.result()
+        finally:
+            # Calls still running end within the deadline, the results are not waited for
+            executor.shutdown(wait=current is None)
+        return results, errors
+
+    def _read_bulk_credentials(
+        self,
+        group_ids: Dict[str, Optional[str]],
+        result: BulkCredentials,
+        max_workers: Optional[int],
+        groups: Optional[Dict[str, Optional[Dict[str, Any]]]] = None,
+        access_type: CredentialFilter = None,
+        secret_type: CredentialFilter = None,
+    ) -> None:
+        """Read the credentials of many secrets groups, fetching every group and every secret once.
+
+        Args:
+            group_ids (Dict[str, Optional[str]]): The secrets group id by result key.
+            result (BulkCredentials): Receives the credentials and errors by result key.
+            max_workers (int): Number of concurrent requests.
+            groups (Dict[str, Optional[Dict[str, Any]]]): The secrets group information by secrets group id,
+                if already known. Missing groups are read from Nautobot.
+            access_type (CredentialFilter): Only read credentials of this access type(s).
+            secret_type (CredentialFilter): Only read credentials of this secret type(s).
+        """
+        # Read every distinct secrets group once
+        groups = dict(groups or {})
+        distinct_group_ids = list(
+            {group_id for group_id in group_ids.values() if group_id is not None and group_id not in groups}
+        )
+        read_groups, group_errors = self._run_concurrently(
+            self.nbot.get_secrets_group_info_by_id, distinct_group_ids, max_workers
+        )
+        groups.update(read_groups)
+        # Collect the distinct secrets of all groups, by provider and source
+        sources: Dict[Tuple[str, Hashable], Dict[str, Dict[str, Any]]] = {}
+        for group_id, group in groups.items():
+            if group is None:
+                group_errors[group_id] = ValueError(f"Error querying Nautobot for secrets group {group_id}.")
+                continue
+            try:
+                for sec_info in filter_associations(self._associations(group), access_type, secret_type):
+                    provider_name = sec_info["secret"]["provider"]
+                    parameters = sec_info["secret"]["parameters"]
+                    source = (provider_name, self.get_provider(provider_name).source_key(parameters))
+                    sources.setdefault(source, {})[parameters_key(parameters)] = parameters
+            except (KeyError, ValueError) as err:
+                group_errors[group_id] = err
+
+        # Read every distinct secret once, with one provider call per source
+        def fetch_source(source: Tuple[str, Hashable]) -> Dict[str, Any]:
+            keys = list(sources[source])
+            values = self.get_provider(source[0]).fetch_many([sources[source][key] for key in keys])
+            return dict(zip(keys, values))
+
+        fetched, source_errors = self._run_concurrently(fetch_source, list(sources), max_workers)
+        values: Dict[Tuple[str, str], Any] = {}
+        for source in sources:
+            for key in sources[source]:
+                values[(source[0], key)] = source_errors[source] if source in source_errors else fetched[source][key]
+
+        # The credentials of a secrets group are built once and shared by the devices using the group
+        group_credentials: Dict[Optional[str], Union[CredentialSet, Exception]] = {None: CredentialSet()}
+        for name, group_id in group_ids.items():
+            if name in result.errors:
+                continue
+            credentials = group_credentials.get(group_id)
+            if credentials is None:
+                credentials = group_errors.get(group_id) or self._group_credentials(
+                    groups[group_id], values, access_type, secret_type  # type: ignore
+                )
+                group_credentials[group_id] = credentials
+            if isinstance(credentials, Exception):
+                metrics.count_error("read_credentials", credentials)
+                result.errors[name] = str(credentials) or repr(credentials)
+                logger.error(f"ERROR Reading the credentials of {name}: {result.errors[name]}")
             else:
-                raise ValueError(f"Secrets Provider ({provider}) is not suppoted!")
+                result.credentials[name] = credentials
+
+    def _group_credentials(
+        self,
+        group: Dict[str, Any],
+        values: Dict[Tuple[str, str], Any],
+        access_type: CredentialFilter,
+        secret_type: CredentialFilter,
+    ) -> Union[CredentialSet, Exception]:
+        """Returns the credentials of a secrets group from the secret values read by `_read_bulk_credentials()`.
+
+        Returns:
+            Union[CredentialSet, Exception]: The credentials or the error of the first secret that was not read.
+        """
+        credentials = []
+        for sec_info in filter_associations(self._associations(group), access_type, secret_type):
+            value = values[(sec_info["secret"]["provider"], parameters_key(sec_info["secret"]["parameters"]))]
+            if isinstance(value, Exception):
+                return value
+            credentials.append(Credential.from_association(sec_info, value))
+        return CredentialSet(credentials)
+
+    @staticmethod
+    def _associations(secrets_group_data: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Returns the secrets group associations of a secrets group query result."""
+        if not secrets_group_data or not secrets_group_data.get("secrets_group"):
+            return []
+        return secrets_group_data["secrets_group"]["secretsgroupassociation_set"]
+
+    def get_credentials_for_devices(
+        self,
+        device_names: Iterable[str],
+        max_workers: Optional[int] = None,
+        access_type: CredentialFilter = None,
+        secret_type: CredentialFilter = None,
+        timeout: Optional[float] = None,
+    ) -> BulkCredentials:
+        """Get the credentials for many devices.
+
+        The devices are resolved with batched GraphQL requests and every distinct secret is read only
+        once. The secrets are read concurrently on a bounded thread pool. A device whose credentials can
+        not be read is reported in `errors` and does not stop the other devices.
+
+        Args:
+            device_names (Iterable[str]): The Nautobot device names.
+            max_workers (int): Number of concurrent requests. Default: `max_workers` of the reader.
+            access_type (CredentialFilter): Only read credentials of this access type(s), e.g. 'SSH'.
+            secret_type (CredentialFilter): Only read credentials of this secret type(s), e.g. 'PASSWORD'.
+            timeout (float): Deadline (seconds) of the whole query. The devices whose credentials are not
+                read in time are reported in `errors`. Default: `batch_timeout` of the reader.
+
+        Returns:
+            BulkCredentials: The credentials and errors by device name.
+                Devices without secrets group get an empty list of credentials.
+        """
+        names = list(dict.fromkeys(device_names))
+        result = BulkCredentials()
+        with deadline(self.batch_timeout if timeout is None else timeout):
+            group_ids, groups = self._resolve_devices(names, result)
+            self._read_bulk_credentials(
+                group_ids, result, max_workers, groups=groups, access_type=access_type, secret_type=secret_type
+            )
+        return result
+
+    def _resolve_devices(
+        self, names: List[str], result: BulkCredentials
+    ) -> Tuple[Dict[str, Optional[str]], Dict[str, Optional[Dict[str, Any]]]]:
+        """Resolve the devices and their secrets groups with batched GraphQL requests.
+
+        Devices that can not be resolved are reported in `result.errors`.
+
+        Returns:
+            Tuple[Dict[str, Optional[str]], Dict[str, Optional[Dict[str, Any]]]]: The secrets group id by
+                device name and the secrets group information by secrets group id.
+        """
+        device_groups = self.nbot.get_secrets_group_info_from_device_names(names)
+        group_ids: Dict[str, Optional[str]] = {}
+        groups: Dict[str, Optional[Dict[str, Any]]] = {}
+        for name in names:
+            if name not in device_groups:
+                result.errors[name] = f"Error querying Nautobot for the secrets group of device {name}."
+                logger.error(result.errors[name])
+                continue
+            group_info = device_groups[name]
+            group_ids[name] = group_info["secrets_group"]["id"] if group_info is not None else None
+            if group_info is not None:
+                groups[group_info["secrets_group"]["id"]] = group_info
+        return group_ids, groups
+
+    def iter_credentials_for_devices(
+        self,
+        device_filter: Optional[Dict[str, Any]] = None,
+        device_names: Optional[Iterable[str]] = None,
+        access_type: CredentialFilter = None,
+        secret_type: CredentialFilter = None,
+        order: str = "input",
+        max_in_flight: Optional[int] = None,
+        page_size: Optional[int] = None,
+    ) -> Iterator[DeviceCredentials]:
+        """Yields the credentials of the devices, one device as soon as its credentials are read.
+
+        The devices are listed and resolved page by page, and at most `max_in_flight` devices are read
+        concurrently, so that the memory used does not grow with the number of devices. Secrets shared by
+        several devices are read once while they are cached.
+
+        Args:
+            device_filter (Dict[str, Any]): The filter arguments of the GraphQL `devices` query,
+                e.g. `{"site": "vie01", "role": ["leaf", "spine"]}`.
+            device_names (Iterable[str]): Further devices by name, yielded before the filtered devices.
+            access_type (CredentialFilter): Only read credentials of this access type(s), e.g. 'SSH'.
+            secret_type (CredentialFilter): Only read credentials of this secret type(s), e.g. 'PASSWORD'.
+            order (str): 'input' yields the devices in the order they are listed, 'completion' as soon as
+                they are read.
+            max_in_flight (int): Number of devices read concurrently. Default: `max_workers` of the reader.
+            page_size (int): Number of devices listed and resolved per GraphQL request.
+                Default: `page_size` of the Nautobot reader.
+
+        raises:
+            ValueError: If the order or the filter is invalid or Nautobot can not be queried.
+        """
+        if order not in DEVICE_ORDERS:  # Raised by the call, not by the first next()
+            raise ValueError(f"Invalid order {order!r}, expected one of {', '.join(DEVICE_ORDERS)}")
+        return self._iter_credentials_for_devices(
+            self._device_pages(device_filter, device_names, page_size or self.nbot.page_size),
+            access_type,
+            secret_type,
+            order,
+            max(1, max_in_flight or self.max_workers),
+        )
+
+    def _iter_credentials_for_devices(
+        self,
+        pages: Iterator[List[str]],
+        access_type: CredentialFilter,
+        secret_type: CredentialFilter,
+        order: str,
+        max_in_flight: int,
+    ) -> Iterator[DeviceCredentials]:
+        """Yields the credentials of the devices of `pages` (see `iter_credentials_for_devices()`)."""
+        pending: Deque["Future[DeviceCredentials]"] = deque()
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        try:
+            for page in pages:
+                result = BulkCredentials()
+                group_ids, groups = self._resolve_devices(page, result)
+                for name in page:
+                    if name in result.errors:
+                        future: "Future[DeviceCredentials]" = Future()
+                        future.set_result(DeviceCredentials(name, error=result.errors[name]))
+                    else:
+                        group_id = group_ids[name]
+                        group = {group_id: groups[group_id]} if group_id is not None else {}
+                        future = executor.submit(
+                            self._read_device_credentials, name, group_id, group, access_type, secret_type
+                        )
+                    pending.append(future)
+                    yield from self._completed(pending, order, block=len(pending) >= max_in_flight)
+            while pending:
+                yield from self._completed(pending, order, block=True)
+        finally:
+            for future in pending:  # The consumer stopped early
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _device_pages(
+        self, device_filter: Optional[Dict[str, Any]], device_names: Optional[Iterable[str]], page_size: int
+    ) -> Iterator[List[str]]:
+        """Yields the device names in pages of at most `page_size` names, every device once."""
+        names = list(dict.fromkeys(device_names or []))
+        for start in range(0, len(names), page_size):
+            yield names[start : start + page_size]
+        if device_filter is not None:
+            listed = set(names)
+            for page in self.nbot.iter_device_names(device_filter, page_size=page_size):
+                page = [name for name in page if name not in listed]
+                if page:
+                    yield page
+
+    @staticmethod
+    def _completed(pending: Deque["Future[DeviceCredentials]"], order: str, block: bool) -> Iterator[DeviceCredentials]:
+        """Removes the completed reads from `pending` and yields their results.
+
+        Args:
+            pending (Deque[Future[DeviceCredentials]]): The reads in input order.
+            order (str): 'input' yields the completed reads at the head of `pending` only.
+            block (bool): Wait until at least one read is completed.
+        """
+        if order == "input":
+            if block:
+                pending[0].result()
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+            return
+        done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in [future for future in pending if future in done]:
+            pending.remove(future)
+            yield future.result()
+
+    def _read_device_credentials(
+        self,
+        name: str,
+        group_id: Optional[str],
+        groups: Dict[str, Optional[Dict[str, Any]]],
+        access_type: CredentialFilter,
+        secret_type: CredentialFilter,
+    ) -> DeviceCredentials:
+        """Read the credentials of a resolved device (a task of `iter_credentials_for_devices()`)."""
+        result = BulkCredentials()
+        self._read_bulk_credentials(
+            {name: group_id}, result, 1, groups=groups, access_type=access_type, secret_type=secret_type
+        )
+        return DeviceCredentials(name, result.credentials.get(name, CredentialSet()), result.errors.get(name))
+
+    def warm(
+        self,
+        device_filter: Optional[Dict[str, Any]] = None,
+        device_names: Optional[Iterable[str]] = None,
+        access_type: CredentialFilter = None,
+        secret_type: CredentialFilter = None,
+        max_workers: Optional[int] = None,
+    ) -> WarmResult:
+        """Read the credentials of the devices matching a Nautobot filter into the caches.
+
+        The devices and their secrets groups are stored in the metadata cache and every distinct secret
+        in the secrets cache, so that the following queries for these devices do not wait for Nautobot
+        or the secrets providers. The secrets are kept warm by the refresher (see `start_refresher()`),
+        even if they are not read before they expire.
+        If the credential agent is running, the agent's caches are warmed.
+
+        Args:
+            device_filter (Dict[str, Any]): The filter arguments of the GraphQL `devices` query,
+                e.g. `{"site": "vie01", "role": ["leaf", "spine"], "tag": "maintenance"}`.
+            device_names (Iterable[str]): Further devices by name.
+            access_type (CredentialFilter): Only read credentials of this access type(s), e.g. 'SSH'.
+            secret_type (CredentialFilter): Only read credentials of this secret type(s), e.g. 'PASSWORD'.
+            max_workers (int): Number of concurrent requests. Default: `max_workers` of the reader.
+
+        raises:
+            ValueError: If the filter is invalid or Nautobot can not be queried.
+            AgentTimeoutError: If the credential agent did not finish warming in time.
+        """
+        names = list(device_names or [])
+        agent = self.agent
+        if agent is not None:
+            # pylint: disable=import-outside-toplevel
+            from .agent import AgentTimeoutError, AgentUnavailableError
+
+            try:
+                return WarmResult(**agent.warm(device_filter, names, access_type=access_type, secret_type=secret_type))
+            except AgentTimeoutError:
+                raise  # The agent is still warming, warming this process too is of no use
+            except AgentUnavailableError as err:
+                logger.warning(f"{err}, warming the caches without the agent.")
+                self.agent = None
+        if device_filter is not None:
+            names.extend(self.nbot.get_device_names(device_filter))
+        result = BulkCredentials()
+        group_ids, groups = self._resolve_devices(list(dict.fromkeys(names)), result)
+        with self.cache.keep_warm():
+            self._read_bulk_credentials(
+                group_ids, result, max_workers, groups=groups, access_type=access_type, secret_type=secret_type
+            )
+        # Distinct secrets by provider and backend object, as read by _read_bulk_credentials()
+        secrets = set()
+        for group_info in groups.values():
+            for sec_info in filter_associations(self._associations(group_info), access_type, secret_type):
+                provider_name = sec_info["secret"]["provider"]
+                provider = self.get_provider(provider_name)
+                secrets.add((provider_name, provider.source_key(sec_info["secret"]["parameters"])))
+        return WarmResult(
+            devices=len(result.credentials), secrets_groups=len(groups), secrets=len(secrets), errors=result.errors
+        )
 
-            secret_value = func(parameters=sec_info["secret"]["parameters"])
-            secrets_info.update(dict(value=secret_value))
-            result.append(secrets_info)
+    def start_refresher(self, margin: Optional[float] = None, interval: Optional[float] = None) -> CacheRefresher:
+        """Start a background thread reading the used secrets again shortly before they expire from the cache.
+
+        Args:
+            margin (float): Time (seconds) before the expiry. Default: environment variable
+                `SECRETS_READER_REFRESH_AHEAD` or 60.
+            interval (float): Time (seconds) between the checks. Default: `margin / 2`, at most 30 seconds.
+
+        Returns:
+            CacheRefresher: The running refresher.
+        """
+        if self.refresher is None:
+            if margin is None:
+                margin = get_settings().secrets_reader_refresh_ahead
+            self.refresher = CacheRefresher(self.cache, margin=margin, interval=interval)
+        return self.refresher.start()
+
+    def stop_refresher(self) -> None:
+        """Stop the background refresher thread."""
+        if self.refresher is not None:
+            self.refresher.stop()
+            self.refresher = None
+
+    def get_credentials_for_secrets_group_ids(
+        self,
+        secrets_group_ids: Iterable[str],
+        max_workers: Optional[int] = None,
+        access_type: CredentialFilter = None,
+        secret_type: CredentialFilter = None,
+        timeout: Optional[float] = None,
+    ) -> BulkCredentials:
+        """Get the credentials for many secrets groups.
+
+        Args:
+            secrets_group_ids (Iterable[str]): The secrets group ids.
+            max_workers (int): Number of concurrent requests. Default: `max_workers` of the reader.
+            access_type (CredentialFilter): Only read credentials of this access type(s), e.g. 'SSH'.
+            secret_type (CredentialFilter): Only read credentials of this secret type(s), e.g. 'PASSWORD'.
+            timeout (float): Deadline (seconds) of the whole query. The secrets groups whose credentials are
+                not read in time are reported in `errors`. Default: `batch_timeout` of the reader.
+
+        Returns:
+            BulkCredentials: The credentials and errors by secrets group id.
+        """
+        group_ids = list(dict.fromkeys(secrets_group_ids))
+        result = BulkCredentials()
+        # Connect to Nautobot once, before the threads start
+        _ = self.nbot.nb_connection
+        with deadline(self.batch_timeout if timeout is None else timeout):
+            self._read_bulk_credentials(
+                {group_id: group_id for group_id in group_ids},
+                result,
+                max_workers,
+                access_type=access_type,
+                secret_type=secret_type,
+            )
         return result
 
-    def get_credentials_for_device(self, device_name: str) -> List[Dict[str, Any]]:
+    def get_credentials_for_device(
+        self,
+        device_name: str,
+        access_type: CredentialFilter = None,
+        secret_type: CredentialFilter = None,
+        lazy: bool = False,
+        timeout: Optional[float] = None,
+    ) -> CredentialSet:
         """Get credentials for device.
 
         Args:
             device_name (str): The Nautobot device name.
+            access_type (CredentialFilter): Only return credentials of this access type(s), e.g. 'SSH'.
+                The secrets of other access types are not read from the secrets provider.
+            secret_type (CredentialFilter): Only return credentials of this secret type(s), e.g. 'PASSWORD'.
+            lazy (bool): Return `LazyCredential`s, which read the secret value on first access.
+            timeout (float): Deadline (seconds) of the query, the values of lazy credentials are read later.
+                Default: `timeout` of the reader.
 
         Returns:
-            List[Dict[str, Any]]: The list of all credentials in secrets group.
+            CredentialSet: All credentials in secrets group. `to_dicts()` returns them as list of dictionaries.
 
             example: [ {'access_type': 'GENERIC',
                         'secret_description': 'Cisco Switches ATBRKHKP',
@@ -138,21 +930,46 @@ class SecretsReader:
                     ]
         raises:
             ValueError: If the secrets provider is not supported.
+            BackendUnavailableError: If a secrets provider is unavailable and no stale value is cached.
         """
-        # Get the secret group info from the device name
-        secret_group_info = self.nbot.get_secrets_group_info_from_device_name(device_name)
-        if secret_group_info is None:
-            return []
-        return self.read_credentials(secret_group_info)
+        if not lazy:
+            credentials = self._ask_agent(
+                "get_credentials_for_device",
+                device_name,
+                access_type=access_type,
+                secret_type=secret_type,
+                timeout=self.timeout if timeout is None else timeout,
+            )
+            if credentials is not None:
+                return CredentialSet.from_dicts(credentials)
+        with deadline(self.timeout if timeout is None else timeout):
+            # Get the secret group info from the device name
+            secret_group_info = self.nbot.get_secrets_group_info_from_device_name(device_name)
+            if secret_group_info is None:
+                return CredentialSet()
+            return self.read_credentials(secret_group_info, access_type=access_type, secret_type=secret_type, lazy=lazy)
 
-    def get_credentials_for_secrets_group_id(self, secrets_group_id: str) -> List[Dict[str, Any]]:
+    def get_credentials_for_secrets_group_id(
+        self,
+        secrets_group_id: str,
+        access_type: CredentialFilter = None,
+        secret_type: CredentialFilter = None,
+        lazy: bool = False,
+        timeout: Optional[float] = None,
+    ) -> CredentialSet:
         """Get credentials for secrets group id.
 
         Args:
             secrets_group_id (str): The secrets group id.
+            access_type (CredentialFilter): Only return credentials of this access type(s), e.g. 'SSH'.
+                The secrets of other access types are not read from the secrets provider.
+            secret_type (CredentialFilter): Only return credentials of this secret type(s), e.g. 'PASSWORD'.
+            lazy (bool): Return `LazyCredential`s, which read the secret value on first access.
+            timeout (float): Deadline (seconds) of the query, the values of lazy credentials are read later.
+                Default: `timeout` of the reader.
 
         Returns:
-            List[Dict[str, Any]]: The list of all credentials in secrets group.
+            CredentialSet: All credentials in secrets group. `to_dicts()` returns them as list of dictionaries.
 
             example: [ {'access_type': 'GENERIC',
                         'secret_description': 'Cisco Switches ATBRKHKP',
@@ -165,19 +982,36 @@ class SecretsReader:
                     ]
         raises:
             ValueError: If the secrets provider is not supported.
+            BackendUnavailableError: If a secrets provider is unavailable and no stale value is cached.
         """
-        # Get the secret group info from the secrets group id
-        secret_group_info = self.nbot.get_secrets_group_info_by_id(secrets_group_id)
-        if secret_group_info is None:
-            return []
-        # Return the credentials
-        return self.read_credentials(secret_group_info)
+        if not lazy:
+            credentials = self._ask_agent(
+                "get_credentials_for_secrets_group_id",
+                secrets_group_id,
+                access_type=access_type,
+                secret_type=secret_type,
+                timeout=self.timeout if timeout is None else timeout,
+            )
+            if credentials is not None:
+                return CredentialSet.from_dicts(credentials)
+        with deadline(self.timeout if timeout is None else timeout):
+            # Get the secret group info from the secrets group id
+            secret_group_info = self.nbot.get_secrets_group_info_by_id(secrets_group_id)
+            if secret_group_info is None:
+                return CredentialSet()
+            # Return the credentials
+            return self.read_credentials(secret_group_info, access_type=access_type, secret_type=secret_type, lazy=lazy)
 
-    def filter_access_type(self, credentials: List[Dict[str, Any]], access_type: str) -> Dict[str, Any]:
+    def filter_access_type(
+        self, credentials: Union[CredentialSet, Iterable[Dict[str, Any]]], access_type: str
+    ) -> Dict[str, Any]:
         """Filter credentials by access type.
 
+        If several credentials of the access type have the same secret type, the last is returned and
+        a warning is logged (see `CredentialSet.filter_access_type()`).
+
         Args:
-            credentials (List[Dict[str, Any]]): The secrets_group_info as returned by
+            credentials (Union[CredentialSet, Iterable[Dict[str, Any]]]): The credentials as returned by
                     get_credentials_for_secrets_group_id() or
                     get_credentials_for_device().
             access_type (str): The access type.
@@ -186,10 +1020,6 @@ class SecretsReader:
                         https://github.com/nautobot/nautobot/blob/develop/nautobot/extras/choices.py
 
         Returns:
-            List[Dict[str, Any]]: The filtered credentials.
+            Dict[str, Any]: The secret values by secret type (lower case).
         """
-        result = {}
-        for cred in credentials:
-            if cred["access_type"].lower() == access_type.lower():
-                result.update({cred["secret_type"].lower(): cred["value"]})
-        return result
+        return CredentialSet.of(credentials).filter_access_type(access_type)
@@ -0,0 +1,101 @@
+"""Pooled HTTP sessions for the Nautobot and Secret Server backends."""
+import dataclasses
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .resilience import DeadlineRetry, bounded_timeout
+from .settings import (  # noqa: F401
+    DEFAULT_HTTP_BACKOFF_FACTOR,
+    DEFAULT_HTTP_CONNECT_TIMEOUT,
+    DEFAULT_HTTP_POOL_SIZE,
+    DEFAULT_HTTP_READ_TIMEOUT,
+    DEFAULT_HTTP_RETRIES,
+    get_settings,
+)
+
+# Response status codes for which a request is retried.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class PooledSession(requests.Session):
+    """`requests.Session` with a connection pool, default timeouts and retries with backoff.
+
+    Connections are kept alive and reused by all requests (and threads) using the session.
+
+    Args:
+        pool_size (int): Maximum number of kept-alive connections per host.
+        connect_timeout (float): Time (seconds) to wait for the connection to the server.
+        read_timeout (float): Time (seconds) to wait for the response of the server.
+        retries (int): Number of retries of requests failing with a connection error or status 429/5xx.
+        backoff_factor (float): The retries wait `backoff_factor * 2 ** (retry - 1)` seconds.
+            A `Retry-After` header of the server is respected.
+
+    Within a `resilience.deadline()` the timeouts and the waits between the retries are capped at the
+    time left, and the requests are not retried once the deadline has expired.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_HTTP_POOL_SIZE,
+        connect_timeout: float = DEFAULT_HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_HTTP_READ_TIMEOUT,
+        retries: int = DEFAULT_HTTP_RETRIES,
+        backoff_factor: float = DEFAULT_HTTP_BACKOFF_FACTOR,
+    ) -> None:
+        super().__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        retry = DeadlineRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=None,  # The GraphQL queries and OAuth grants are POST requests
+            raise_on_status=False,  # The last response is returned to the caller
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, *args, **kwargs):  # pylint: disable=arguments-differ
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        kwargs["timeout"] = bounded_timeout(kwargs["timeout"])
+        return super().request(method, url, *args, **kwargs)
+
+
+def session_settings(prefix: str) -> Dict[str, Any]:
+    """Returns the session settings of a backend (see `Settings.http()`).
+
+    Args:
+        prefix (str): The prefix of the environment variables, e.g. `NAUTOBOT` for `NAUTOBOT_HTTP_POOL_SIZE`.
+    """
+    return dataclasses.asdict(get_settings().http(prefix))
+
+
+# Process-wide sessions, keyed by the environment variable prefix of the backend.
+_sessions: Dict[str, PooledSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(prefix: str) -> PooledSession:
+    """Returns the shared pooled session of a backend, created on first use.
+
+    Args:
+        prefix (str): The prefix of the environment variables of the backend: `NAUTOBOT` or `SECRET_SERVER`.
+    """
+    with _sessions_lock:
+        session = _sessions.get(prefix)
+        if session is None:
+            session = _sessions[prefix] = PooledSession(**session_settings(prefix))
+        return session
+
+
+def reset_sessions(prefix: Optional[str] = None) -> None:
+    """Close the shared sessions (all, or the one of a backend), e.g. after the settings have changed."""
+    with _sessions_lock:
+        for key in [prefix] if prefix is not None else list(_sessions):
+            session = _sessions.pop(key, None)
+            if session is not None:
+                session.close()
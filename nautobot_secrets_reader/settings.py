@@ -0,0 +1,232 @@
+"""Configuration of the secrets reader, parsed once from the environment variables (and `.env` file)."""
+import os
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import Mapping, Optional
+
+from .helpers import is_truthy
+
+# Default number of devices resolved per GraphQL request.
+DEFAULT_GRAPHQL_PAGE_SIZE = 100
+# Seconds before the OAuth access token expires, after which a new token is requested.
+DEFAULT_TOKEN_REFRESH_MARGIN = 60
+# Default maximum number of fields of a secret read field by field instead of reading the whole secret.
+DEFAULT_FIELD_FETCH_MAX = 1
+# Default number of concurrent requests of the bulk queries.
+DEFAULT_MAX_WORKERS = 8
+# Default number of kept-alive connections per host.
+DEFAULT_HTTP_POOL_SIZE = 10
+# Default time (seconds) to wait for the connection to the server.
+DEFAULT_HTTP_CONNECT_TIMEOUT = 5.0
+# Default time (seconds) to wait for the response of the server.
+DEFAULT_HTTP_READ_TIMEOUT = 60.0
+# Default number of retries of requests failing with a connection error or status 429/5xx.
+DEFAULT_HTTP_RETRIES = 3
+# Default backoff factor: the retries wait backoff_factor * 2 ** (retry - 1) seconds.
+DEFAULT_HTTP_BACKOFF_FACTOR = 0.5
+# Default deadline (seconds) of a credential query and of a bulk query. `0`: bounded by the HTTP timeouts only.
+DEFAULT_TIMEOUT = 0.0
+# Default time (seconds) a secret is kept in the cache.
+DEFAULT_CACHE_TTL = 300.0
+# Default maximum number of secrets kept in the cache.
+DEFAULT_CACHE_MAX_ENTRIES = 1024
+# Default time (seconds) before a used cache entry expires, after which the refresher reads it again.
+DEFAULT_REFRESH_AHEAD = 60.0
+# Default time (seconds) an expired secret is kept, to be served if it can not be read again. `0`: not kept.
+DEFAULT_STALE_TTL = 0.0
+# Default interval (seconds) at which the Nautobot change log is checked for changes.
+DEFAULT_CHANGELOG_POLL_INTERVAL = 5.0
+# Default maximum age (seconds) of the change log position of the metadata file, older entries are not used.
+DEFAULT_METADATA_FILE_MAX_AGE = 86400.0
+# Default number of consecutive failed requests after which the circuit of a backend opens. `0` disables it.
+DEFAULT_CIRCUIT_FAILURES = 5
+# Default time (seconds) the circuit stays open before a trial request is sent, doubled after every failed trial.
+DEFAULT_CIRCUIT_RESET = 5.0
+# Default maximum time (seconds) the circuit stays open.
+DEFAULT_CIRCUIT_MAX_RESET = 300.0
+
+
+def default_agent_socket(environ: Mapping[str, str]) -> str:
+    """Returns the default path of the agent socket, in a directory private to the user.
+
+    `$XDG_RUNTIME_DIR/nautobot-secrets-reader/agent.sock` or `<tmp>/nautobot-secrets-reader-<uid>/agent.sock`.
+    """
+    runtime_dir = environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "nautobot-secrets-reader", "agent.sock")
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"nautobot-secrets-reader-{uid}", "agent.sock")
+
+
+@dataclass(frozen=True)
+class HttpSettings:
+    """Settings of the pooled HTTP session of a backend (environment variables `<PREFIX>_HTTP_*`)."""
+
+    pool_size: int = DEFAULT_HTTP_POOL_SIZE
+    connect_timeout: float = DEFAULT_HTTP_CONNECT_TIMEOUT
+    read_timeout: float = DEFAULT_HTTP_READ_TIMEOUT
+    retries: int = DEFAULT_HTTP_RETRIES
+    backoff_factor: float = DEFAULT_HTTP_BACKOFF_FACTOR
+
+    @classmethod
+    def from_environ(cls, environ: Mapping[str, str], prefix: str) -> "HttpSettings":
+        """Returns the settings of the backend with the environment variable prefix, e.g. `NAUTOBOT`."""
+        return cls(
+            pool_size=int(environ.get(f"{prefix}_HTTP_POOL_SIZE", DEFAULT_HTTP_POOL_SIZE)),
+            connect_timeout=float(environ.get(f"{prefix}_HTTP_CONNECT_TIMEOUT", DEFAULT_HTTP_CONNECT_TIMEOUT)),
+            read_timeout=float(environ.get(f"{prefix}_HTTP_READ_TIMEOUT", DEFAULT_HTTP_READ_TIMEOUT)),
+            retries=int(environ.get(f"{prefix}_HTTP_RETRIES", DEFAULT_HTTP_RETRIES)),
+            backoff_factor=float(environ.get(f"{prefix}_HTTP_BACKOFF_FACTOR", DEFAULT_HTTP_BACKOFF_FACTOR)),
+        )
+
+
+@dataclass(frozen=True)
+class Settings:  # pylint: disable=too-many-instance-attributes
+    """Immutable configuration. See section 'Configuration' in `README.md` for the environment variables."""
+
+    # Nautobot
+    nautobot_api_endpoint: Optional[str] = None
+    nautobot_token: Optional[str] = None
+    nautobot_api_version: Optional[str] = None
+    nautobot_graphql_page_size: int = DEFAULT_GRAPHQL_PAGE_SIZE
+    nautobot_metadata_cache: bool = True
+    nautobot_changelog_poll_interval: float = DEFAULT_CHANGELOG_POLL_INTERVAL
+    nautobot_metadata_cache_file: str = ""
+    nautobot_metadata_cache_key: str = field(default="", repr=False)
+    nautobot_metadata_cache_max_age: float = DEFAULT_METADATA_FILE_MAX_AGE
+    nautobot_http: HttpSettings = field(default_factory=HttpSettings)
+    # Thycotic/Delinea Secret Server
+    secret_server_base_url: Optional[str] = None
+    secret_server_is_cloud_based: bool = False
+    secret_server_tenant: str = ""
+    secret_server_username: str = ""
+    secret_server_password: str = field(default="", repr=False)
+    secret_server_token: str = field(default="", repr=False)
+    secret_server_domain: str = ""
+    secret_server_token_refresh_margin: int = DEFAULT_TOKEN_REFRESH_MARGIN
+    secret_server_path_index: bool = True
+    secret_server_path_index_file: str = ""
+    secret_server_field_fetch_max: int = DEFAULT_FIELD_FETCH_MAX
+    secret_server_circuit_failures: int = DEFAULT_CIRCUIT_FAILURES
+    secret_server_circuit_reset: float = DEFAULT_CIRCUIT_RESET
+    secret_server_circuit_max_reset: float = DEFAULT_CIRCUIT_MAX_RESET
+    secret_server_http: HttpSettings = field(default_factory=HttpSettings)
+    requests_ca_bundle: str = ""
+    # Secrets reader
+    secrets_reader_cache_ttl: float = DEFAULT_CACHE_TTL
+    secrets_reader_cache_max_entries: int = DEFAULT_CACHE_MAX_ENTRIES
+    secrets_reader_max_workers: int = DEFAULT_MAX_WORKERS
+    secrets_reader_refresh_ahead: float = DEFAULT_REFRESH_AHEAD
+    secrets_reader_stale_ttl: float = DEFAULT_STALE_TTL
+    secrets_reader_timeout: float = DEFAULT_TIMEOUT
+    secrets_reader_batch_timeout: float = DEFAULT_TIMEOUT
+    secrets_reader_use_agent: bool = True
+    secrets_reader_agent_socket: str = ""
+
+    @classmethod
+    def from_environ(cls, environ: Mapping[str, str]) -> "Settings":
+        """Parse the settings from the environment variables.
+
+        raises:
+            ValueError: If a value can not be parsed.
+        """
+        return cls(
+            nautobot_api_endpoint=environ.get("NAUTOBOT_API_ENDPOINT"),
+            nautobot_token=environ.get("NAUTOBOT_TOKEN"),
+            nautobot_api_version=environ.get("NAUTOBOT_API_VERSION"),
+            nautobot_graphql_page_size=int(environ.get("NAUTOBOT_GRAPHQL_PAGE_SIZE", DEFAULT_GRAPHQL_PAGE_SIZE)),
+            nautobot_metadata_cache=is_truthy(environ.get("NAUTOBOT_METADATA_CACHE", "True")),
+            nautobot_changelog_poll_interval=float(
+                environ.get("NAUTOBOT_CHANGELOG_POLL_INTERVAL", DEFAULT_CHANGELOG_POLL_INTERVAL)
+            ),
+            nautobot_metadata_cache_file=environ.get("NAUTOBOT_METADATA_CACHE_FILE", ""),
+            nautobot_metadata_cache_key=environ.get("NAUTOBOT_METADATA_CACHE_KEY", ""),
+            nautobot_metadata_cache_max_age=float(
+                environ.get("NAUTOBOT_METADATA_CACHE_MAX_AGE", DEFAULT_METADATA_FILE_MAX_AGE)
+            ),
+            nautobot_http=HttpSettings.from_environ(environ, "NAUTOBOT"),
+            secret_server_base_url=environ.get("SECRET_SERVER_BASE_URL"),
+            secret_server_is_cloud_based=is_truthy(environ.get("SECRET_SERVER_IS_CLOUD_BASED", "False")),
+            secret_server_tenant=environ.get("SECRET_SERVER_TENANT", ""),
+            secret_server_username=environ.get("SECRET_SERVER_USERNAME", ""),
+            secret_server_password=environ.get("SECRET_SERVER_PASSWORD", ""),
+            secret_server_token=environ.get("SECRET_SERVER_TOKEN", ""),
+            secret_server_domain=environ.get("SECRET_SERVER_DOMAIN", ""),
+            secret_server_token_refresh_margin=int(
+                environ.get("SECRET_SERVER_TOKEN_REFRESH_MARGIN", DEFAULT_TOKEN_REFRESH_MARGIN)
+            ),
+            secret_server_path_index=is_truthy(environ.get("SECRET_SERVER_PATH_INDEX", "True")),
+            secret_server_path_index_file=environ.get("SECRET_SERVER_PATH_INDEX_FILE", ""),
+            secret_server_field_fetch_max=int(environ.get("SECRET_SERVER_FIELD_FETCH_MAX", DEFAULT_FIELD_FETCH_MAX)),
+            secret_server_circuit_failures=int(environ.get("SECRET_SERVER_CIRCUIT_FAILURES", DEFAULT_CIRCUIT_FAILURES)),
+            secret_server_circuit_reset=float(environ.get("SECRET_SERVER_CIRCUIT_RESET", DEFAULT_CIRCUIT_RESET)),
+            secret_server_circuit_max_reset=float(
+                environ.get("SECRET_SERVER_CIRCUIT_MAX_RESET", DEFAULT_CIRCUIT_MAX_RESET)
+            ),
+            secret_server_http=HttpSettings.from_environ(environ, "SECRET_SERVER"),
+            requests_ca_bundle=environ.get("REQUESTS_CA_BUNDLE", ""),
+            secrets_reader_cache_ttl=float(environ.get("SECRETS_READER_CACHE_TTL", DEFAULT_CACHE_TTL)),
+            secrets_reader_cache_max_entries=int(
+                environ.get("SECRETS_READER_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES)
+            ),
+            secrets_reader_max_workers=int(environ.get("SECRETS_READER_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+            secrets_reader_refresh_ahead=float(environ.get("SECRETS_READER_REFRESH_AHEAD", DEFAULT_REFRESH_AHEAD)),
+            secrets_reader_stale_ttl=float(environ.get("SECRETS_READER_STALE_TTL", DEFAULT_STALE_TTL)),
+            secrets_reader_timeout=float(environ.get("SECRETS_READER_TIMEOUT", DEFAULT_TIMEOUT)),
+            secrets_reader_batch_timeout=float(environ.get("SECRETS_READER_BATCH_TIMEOUT", DEFAULT_TIMEOUT)),
+            secrets_reader_use_agent=is_truthy(environ.get("SECRETS_READER_USE_AGENT", "True")),
+            secrets_reader_agent_socket=environ.get("SECRETS_READER_AGENT_SOCKET") or default_agent_socket(environ),
+        )
+
+    def http(self, prefix: str) -> HttpSettings:
+        """Returns the HTTP session settings of a backend.
+
+        Args:
+            prefix (str): The environment variable prefix of the backend: `NAUTOBOT` or `SECRET_SERVER`.
+        """
+        if prefix == "NAUTOBOT":
+            return self.nautobot_http
+        if prefix == "SECRET_SERVER":
+            return self.secret_server_http
+        return HttpSettings.from_environ(os.environ, prefix)
+
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """Returns the process-wide settings.
+
+    On first use the `.env` file is loaded (existing environment variables take precedence) and the
+    environment variables are parsed. Call `reset_settings()` to parse them again.
+    """
+    settings = _settings
+    if settings is None:
+        settings = _load_settings()
+    return settings
+
+
+def _load_settings() -> Settings:
+    global _settings  # pylint: disable=global-statement
+    with _settings_lock:
+        if _settings is None:
+            try:
+                from dotenv import load_dotenv  # pylint: disable=import-outside-toplevel
+            except ImportError:  # pragma: no cover
+                pass
+            else:
+                load_dotenv()  # Load environment variables from .env file.
+            _settings = Settings.from_environ(os.environ)
+        return _settings
+
+
+def reset_settings(settings: Optional[Settings] = None) -> None:
+    """Replace the process-wide settings, or forget them so that they are parsed again on next use.
+
+    Readers created before keep the settings they were created with.
+    """
+    global _settings  # pylint: disable=global-statement
+    with _settings_lock:
+        _settings = settings
@@ -0,0 +1,285 @@
+"""Offline benchmark of the SecretsReader against local stand-in Nautobot and Secret Server servers.
+
+Run with:
+
+    python -m nautobot_secrets_reader.tests.benchmark --devices 5000 --groups 200 --secrets 50 \\
+        --latency 0.005 --output benchmark.json
+
+The JSON report contains per scenario the wall time, the p50/p99 latency of the calls, the number of
+HTTP requests per call and the peak memory allocated (tracemalloc), and the time to import the package
+and to create the first reader in a new interpreter.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from nautobot_secrets_reader.agent import AgentClient, CredentialAgent
+from nautobot_secrets_reader.delinea import reset_secret_server_clients
+from nautobot_secrets_reader.secread import SecretsReader
+from nautobot_secrets_reader.sessions import reset_sessions
+from nautobot_secrets_reader.settings import reset_settings
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """Returns the nearest-rank percentile of the values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+@contextmanager
+def fake_environment(nautobot: FakeNautobot, secret_server: FakeSecretServer) -> Iterator[None]:
+    """Point the reader at the stand-in servers, the environment is restored on exit."""
+    settings = dict(
+        NAUTOBOT_API_ENDPOINT=nautobot.url,
+        NAUTOBOT_TOKEN="0123456789abcdef0123456789abcdef01234567",
+        SECRET_SERVER_BASE_URL=f"{secret_server.url}/SecretServer",
+        SECRET_SERVER_IS_CLOUD_BASED="False",
+        SECRET_SERVER_USERNAME=secret_server.username,
+        SECRET_SERVER_PASSWORD=secret_server.password,
+        SECRET_SERVER_TOKEN="",
+        SECRET_SERVER_DOMAIN="",
+        REQUESTS_CA_BUNDLE="",
+        SECRETS_READER_USE_AGENT="False",
+    )
+    original = {name: os.environ.get(name) for name in settings}
+    os.environ.update(settings)
+    reset_settings()
+    try:
+        yield
+    finally:
+        for name, value in original.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        reset_settings()
+        reset_secret_server_clients()
+        reset_sessions()
+
+
+IMPORT_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import nautobot_secrets_reader
+imported = time.perf_counter()
+nautobot_secrets_reader.SecretsReader()
+created = time.perf_counter()
+print(imported - started, created - started, len(sys.modules))
+"""
+
+
+def measure_import(runs: int = 5) -> Dict[str, Any]:
+    """Measure in new interpreters the time to import the package and to create the first `SecretsReader`.
+
+    Returns:
+        Dict[str, Any]: The median times (milliseconds) and the number of modules loaded after the import.
+    """
+    import_times, reader_times, modules = [], [], 0
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT], check=True, capture_output=True, text=True
+        ).stdout.split()
+        import_times.append(float(output[0]))
+        reader_times.append(float(output[1]))
+        modules = int(output[2])
+    return dict(
+        runs=runs,
+        import_ms=round(percentile(import_times, 50) * 1000, 3),
+        first_reader_ms=round(percentile(reader_times, 50) * 1000, 3),
+        modules_loaded=modules,
+    )
+
+
+def run_scenario(
+    name: str,
+    func: Callable[[SecretsReader, Any], Any],
+    items: List[Any],
+    servers: Sequence[Any],
+    trace_memory: bool = True,
+    devices: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Call `func(reader, item)` for every item with a new reader and return the measurements.
+
+    Args:
+        devices (int): Number of devices read by the scenario, to report the HTTP calls per device.
+    """
+    reset_secret_server_clients()
+    reset_sessions()
+    for server in servers:
+        server.reset_counts()
+    if trace_memory:
+        tracemalloc.start()
+    latencies: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+    reader = SecretsReader()
+    for item in items:
+        call_started = time.perf_counter()
+        try:
+            func(reader, item)
+        except Exception:  # pylint: disable=broad-except
+            errors += 1
+        latencies.append(time.perf_counter() - call_started)
+    wall_time = time.perf_counter() - started
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    http_calls = {type(server).__name__: dict(server.requests) for server in servers}
+    total_calls = sum(server.total_requests for server in servers)
+    return dict(
+        scenario=name,
+        calls=len(items),
+        errors=errors,
+        wall_time_s=round(wall_time, 6),
+        latency_ms=dict(
+            p50=round(percentile(latencies, 50) * 1000, 3),
+            p99=round(percentile(latencies, 99) * 1000, 3),
+            max=round(max(latencies, default=0.0) * 1000, 3),
+        ),
+        http_calls=http_calls,
+        http_calls_per_call=round(total_calls / max(len(items), 1), 3),
+        http_calls_per_device=round(total_calls / devices, 3) if devices else None,
+        peak_memory_bytes=peak_memory,
+    )
+
+
+def run_agent_scenario(device_names: List[str], servers: Sequence[Any], trace_memory: bool) -> Dict[str, Any]:
+    """Measure the device queries answered by a warm credential agent."""
+    with tempfile.TemporaryDirectory() as directory:
+        with CredentialAgent(
+            SecretsReader(use_agent=False), socket_path=os.path.join(directory, "agent.sock")
+        ) as agent:
+            client = AgentClient(agent.socket_path)
+            for name in device_names:
+                client.get_credentials_for_device(name)
+            result = run_scenario(
+                "agent_warm_device",
+                lambda reader, name: client.get_credentials_for_device(name),
+                device_names,
+                servers,
+                trace_memory,
+                devices=len(device_names),
+            )
+            client.close()
+    return result
+
+
+def run_benchmark(
+    devices: int = 5000,
+    groups: int = 200,
+    secrets: int = 50,
+    latency: float = 0.0,
+    samples: int = 500,
+    seed: int = 1,
+    trace_memory: bool = True,
+    import_runs: int = 5,
+) -> Dict[str, Any]:
+    """Run all scenarios and return the report.
+
+    Scenarios:
+        get_credentials_for_device: `samples` random devices, one call per device.
+        get_credentials_for_secrets_group_id: `samples` random secrets groups, one call per group.
+        fleet_loop: `get_credentials_for_device()` for every device of the fleet.
+        fleet_bulk: one `get_credentials_for_devices()` call for the whole fleet.
+        agent_warm_device: the `get_credentials_for_device` samples sent to a credential agent whose
+            caches were warmed by a first round of the samples.
+    """
+    fleet = FakeFleet(devices=devices, groups=groups, secrets=secrets)
+    chooser = random.Random(seed)
+    device_names = list(fleet.devices)
+    sample_devices = [chooser.choice(device_names) for _ in range(samples)]
+    sample_groups = [chooser.choice(list(fleet.groups)) for _ in range(samples)]
+    with FakeNautobot(fleet, latency=latency) as nautobot, FakeSecretServer(
+        fleet, latency=latency
+    ) as secret_server, fake_environment(nautobot, secret_server):
+        servers = (nautobot, secret_server)
+        scenarios = [
+            run_scenario(
+                "get_credentials_for_device",
+                lambda reader, name: reader.get_credentials_for_device(name),
+                sample_devices,
+                servers,
+                trace_memory,
+                devices=len(sample_devices),
+            ),
+            run_scenario(
+                "get_credentials_for_secrets_group_id",
+                lambda reader, group_id: reader.get_credentials_for_secrets_group_id(group_id),
+                sample_groups,
+                servers,
+                trace_memory,
+            ),
+            run_scenario(
+                "fleet_loop",
+                lambda reader, name: reader.get_credentials_for_device(name),
+                device_names,
+                servers,
+                trace_memory,
+                devices=len(device_names),
+            ),
+            run_scenario(
+                "fleet_bulk",
+                lambda reader, names: reader.get_credentials_for_devices(names),
+                [device_names],
+                servers,
+                trace_memory,
+                devices=len(device_names),
+            ),
+            run_agent_scenario(sample_devices, servers, trace_memory),
+        ]
+    return dict(
+        config=dict(devices=devices, groups=groups, secrets=secrets, latency_s=latency, samples=samples, seed=seed),
+        environment=dict(python=platform.python_version(), platform=platform.platform()),
+        scenarios={scenario.pop("scenario"): scenario for scenario in scenarios},
+        startup=measure_import(import_runs) if import_runs else None,
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=5000, help="Number of devices (default: 5000)")
+    parser.add_argument("--groups", type=int, default=200, help="Number of secrets groups (default: 200)")
+    parser.add_argument("--secrets", type=int, default=50, help="Number of secrets (default: 50)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Response delay (seconds) of the servers")
+    parser.add_argument("--samples", type=int, default=500, help="Calls of the single device/group scenarios")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random samples")
+    parser.add_argument("--import-runs", type=int, default=5, help="Interpreters started to time the import")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Do not measure the peak memory")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    args = parser.parse_args(argv)
+    report = run_benchmark(
+        devices=args.devices,
+        groups=args.groups,
+        secrets=args.secrets,
+        latency=args.latency,
+        samples=args.samples,
+        seed=args.seed,
+        trace_memory=not args.no_tracemalloc,
+        import_runs=args.import_runs,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+import pytest
+
+from nautobot_secrets_reader.settings import reset_settings
+
+
+@pytest.fixture(autouse=True)
+def fresh_settings():
+    """Parse the settings again in every test, the tests change the environment variables."""
+    reset_settings()
+    yield
+    reset_settings()
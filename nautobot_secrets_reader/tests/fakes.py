@@ -0,0 +1,332 @@
+"""Local stand-in servers for Nautobot and Secret Server, used by the offline tests and benchmarks."""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeFleet:
+    """A generated inventory: devices, secrets groups and Secret Server secrets.
+
+    Device `i` is at site `site-{i % 3}` and uses secrets group `i % groups`. Every 20th device has no own
+    secrets group and uses the group of its virtual chassis master (the previous device). Group `g` has SSH
+    username and password from secret `g % secrets` (by id) and a GENERIC token from secret
+    `(g + 1) % secrets` (by path).
+
+    Args:
+        devices (int): Number of devices.
+        groups (int): Number of secrets groups.
+        secrets (int): Number of Secret Server secrets.
+    """
+
+    def __init__(self, devices: int = 100, groups: int = 10, secrets: int = 5) -> None:
+        self.secrets = {
+            str(index + 1): dict(
+                id=index + 1,
+                name=f"secret-{index + 1}",
+                path=f"\\Network\\secret-{index + 1}",
+                username=f"user-{index + 1}",
+                password=f"pwd-{index + 1}",
+            )
+            for index in range(secrets)
+        }
+        self.groups = {f"group-{index}": self._group(index, secrets) for index in range(groups)}
+        self.devices: Dict[str, Dict[str, Any]] = {}
+        self.sites: Dict[str, str] = {}  # Site by device name
+        for index in range(devices):
+            name = f"device-{index:05d}"
+            self.sites[name] = f"site-{index % 3}"
+            device = dict(id=f"dev-{index}", name=name, secrets_group=None, virtual_chassis=None)
+            if index % 20 == 19:
+                master = self.devices[f"device-{index - 1:05d}"]
+                device["virtual_chassis"] = {"master": {"id": master["id"], "secrets_group": master["secrets_group"]}}
+            else:
+                device["secrets_group"] = self.groups[f"group-{index % groups}"]
+            self.devices[name] = device
+
+    @staticmethod
+    def _association(access_type: str, secret_type: str, provider: str, number: str, **parameters: Any) -> Dict:
+        return dict(
+            access_type=access_type,
+            secret_type=secret_type,
+            secret=dict(
+                id=f"{number}-{secret_type}",
+                provider=provider,
+                name=f"secret-{number} {secret_type}",
+                slug=f"secret-{number}-{secret_type}".lower(),
+                parameters=parameters,
+                description="",
+            ),
+        )
+
+    def _group(self, index: int, secrets: int) -> Dict[str, Any]:
+        first = str(index % secrets + 1)
+        second = str((index + 1) % secrets + 1)
+        return dict(
+            id=f"group-{index}",
+            name=f"Group {index}",
+            slug=f"group-{index}",
+            secretsgroupassociation_set=[
+                self._association(
+                    "SSH", "USERNAME", "thycotic-tss-id", first, secret_id=first, secret_selected_value="username"
+                ),
+                self._association(
+                    "SSH", "PASSWORD", "thycotic-tss-id", first, secret_id=first, secret_selected_value="password"
+                ),
+                self._association(
+                    "GENERIC",
+                    "TOKEN",
+                    "thycotic-tss-path",
+                    second,
+                    secret_path=f"/Network/secret-{second}",
+                    secret_selected_value="password",
+                ),
+            ],
+        )
+
+
+class FakeServer:
+    """Threaded HTTP server on a free local port that counts the requests and delays the responses.
+
+    Args:
+        latency (float): Time (seconds) each response is delayed.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.requests: Counter = Counter()  # Number of requests by endpoint
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # Headers and body are written separately
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                server._handle(self, "GET")
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                server._handle(self, "POST")
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FakeServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.requests.clear()
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        url = urlsplit(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        if self.latency:
+            time.sleep(self.latency)
+        endpoint, status, content, headers = self.respond(method, url.path, parse_qs(url.query), body)
+        with self._lock:
+            self.requests[endpoint] += 1
+        content_type = "application/json"
+        if isinstance(content, bytes):
+            data, content_type = content, "application/octet-stream"
+        else:
+            data = json.dumps(content).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def respond(self, method: str, path: str, query: Dict[str, List[str]], body: bytes):
+        """Returns the endpoint name, status, JSON content (or bytes) and headers of the response."""
+        raise NotImplementedError
+
+
+class FakeNautobot(FakeServer):
+    """Nautobot stand-in: API version, GraphQL (`secrets_group`, `devices`) and an empty change log.
+
+    The `devices` query by filter supports `site`, `limit` and `offset`.
+    """
+
+    def __init__(self, fleet: FakeFleet, latency: float = 0.0) -> None:
+        super().__init__(latency=latency)
+        self.fleet = fleet
+
+    def respond(self, method, path, query, body):
+        if path == "/api/graphql/" and method == "POST":
+            variables = json.loads(body).get("variables") or {}
+            if "device_names" in variables:
+                devices = [self.fleet.devices[name] for name in variables["device_names"] if name in self.fleet.devices]
+                return "graphql", 200, {"data": {"devices": devices}}, {}
+            if "devices" in json.loads(body)["query"]:
+                sites = variables.get("site")
+                names = [name for name, site in self.fleet.sites.items() if sites is None or site in sites]
+                offset = variables.get("offset") or 0
+                names = names[offset : offset + variables["limit"]] if variables.get("limit") else names[offset:]
+                return "graphql", 200, {"data": {"devices": [{"name": name} for name in names]}}, {}
+            group = self.fleet.groups.get(variables.get("secrets_group_id"))
+            return "graphql", 200, {"data": {"secrets_group": group}}, {}
+        if path == "/api/extras/object-changes/":
+            return "object-changes", 200, {"count": 0, "next": None, "previous": None, "results": []}, {}
+        if path == "/api/":
+            return "version", 200, {}, {"API-Version": "1.5"}
+        return "not-found", 404, {"detail": "Not found."}, {}
+
+
+class FakeSecretServer(FakeServer):
+    """Secret Server stand-in: OAuth password grant, `/secrets/{id}`, the lookup by path and the folder listing.
+
+    The folders are those of the secret paths; `/folders/0?folderPath=` returns a folder with all children and
+    `/secrets?filter.folderId=` lists the secrets of a folder tree in pages of `take` secrets.
+    `/secrets/{id}/fields/{slug}` returns one field; the file attachments of a secret are the bytes in its
+    optional `attachments` dictionary (by field slug).
+    """
+
+    def __init__(
+        self, fleet: FakeFleet, latency: float = 0.0, username: str = "pw_user", password: str = "pw_password"
+    ) -> None:
+        super().__init__(latency=latency)
+        self.fleet = fleet
+        self.username = username
+        self.password = password
+        self.token_lifetime = 1200
+
+    def respond(self, method, path, query, body):
+        if path == "/SecretServer/oauth2/token" and method == "POST":
+            grant = parse_qs(body.decode())
+            if grant.get("username") != [self.username] or grant.get("password") != [self.password]:
+                return "oauth", 400, {"error": "invalid_grant"}, {}
+            return (
+                "oauth",
+                200,
+                {"access_token": "fake-token", "token_type": "bearer", "expires_in": self.token_lifetime},
+                {},
+            )
+        if path == "/SecretServer/api/v1/folders/0":
+            folders = self.folders()
+            folder_path = query.get("folderPath", [""])[0]
+            if folder_path not in folders:
+                return "folder-by-path", 404, {"message": "Folder not found."}, {}
+            return "folder-by-path", 200, self.folder_json(folder_path, folders), {}
+        if path == "/SecretServer/api/v1/secrets":
+            folders = self.folders()
+            folder_ids = {folder_id: folder_path for folder_path, folder_id in folders.items()}
+            root = folder_ids.get(int(query.get("filter.folderId", ["0"])[0]), "")
+            records = [
+                dict(id=secret["id"], name=secret["name"], folderId=self.folder_id(secret))
+                for secret in self.fleet.secrets.values()
+                if self.folder_path(secret) == root or self.folder_path(secret).startswith(root + "\\")
+            ]
+            skip = int(query.get("skip", ["0"])[0])
+            take = int(query.get("take", ["10"])[0])
+            page = dict(records=records[skip : skip + take], hasNext=skip + take < len(records), total=len(records))
+            page["nextSkip"] = skip + take
+            return "list-secrets", 200, page, {}
+        if path.startswith("/SecretServer/api/v1/secrets/") and "/fields/" in path:
+            secret_id, slug = path[len("/SecretServer/api/v1/secrets/") :].split("/fields/")
+            secret = self.fleet.secrets.get(secret_id)
+            if secret is None or (slug not in secret.get("attachments", {}) and slug not in ("username", "password")):
+                return "secret-field", 404, {"message": "Secret not found."}, {}
+            if slug in secret.get("attachments", {}):
+                return "secret-field", 200, secret["attachments"][slug], {}
+            return "secret-field", 200, secret[slug], {}
+        if path.startswith("/SecretServer/api/v1/secrets/"):
+            secret_id = path.rsplit("/", 1)[1]
+            secret: Optional[Dict[str, Any]]
+            if secret_id == "0":
+                secret_path = query.get("secretPath", [""])[0]
+                secret = next((item for item in self.fleet.secrets.values() if item["path"] == secret_path), None)
+                endpoint = "secret-by-path"
+            else:
+                secret = self.fleet.secrets.get(secret_id)
+                endpoint = "secret"
+            if secret is None:
+                return endpoint, 404, {"message": "Secret not found."}, {}
+            return endpoint, 200, self.secret_json(secret), {}
+        return "not-found", 404, {"message": "Not found."}, {}
+
+    @staticmethod
+    def folder_path(secret: Dict[str, Any]) -> str:
+        return secret["path"].rsplit("\\", 1)[0]
+
+    def folders(self) -> Dict[str, int]:
+        """Returns the folder ids by folder path."""
+        paths = set()
+        for secret in self.fleet.secrets.values():
+            parts = self.folder_path(secret).split("\\")
+            paths.update("\\".join(parts[:index]) for index in range(2, len(parts) + 1))
+        return {path: index + 1 for index, path in enumerate(sorted(paths))}
+
+    def folder_id(self, secret: Dict[str, Any]) -> int:
+        return self.folders()[self.folder_path(secret)]
+
+    def folder_json(self, folder_path: str, folders: Dict[str, int]) -> Dict[str, Any]:
+        """Returns the REST API representation of a folder with all children."""
+        children = [path for path in folders if path.rsplit("\\", 1)[0] == folder_path and path != folder_path]
+        return dict(
+            id=folders[folder_path],
+            folderName=folder_path.rsplit("\\", 1)[1],
+            folderPath=folder_path,
+            childFolders=[self.folder_json(child, folders) for child in sorted(children)],
+        )
+
+    def secret_json(self, secret: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the REST API representation of a secret."""
+
+        def item(slug: str, value: str, attachment: bool = False) -> Dict[str, Any]:
+            return dict(
+                itemId=hash(slug) % 1000,
+                fileAttachmentId=100 + secret["id"] if attachment else None,
+                filename=f"{slug}.txt" if attachment else None,
+                itemValue="*** Not Valid For Display ***" if attachment else value,
+                fieldId=1,
+                fieldName=slug.title(),
+                slug=slug,
+                fieldDescription="",
+                isFile=False,
+                isNotes=False,
+                isPassword=slug == "password",
+            )
+
+        return dict(
+            id=secret["id"],
+            name=secret["name"],
+            folderId=self.folder_id(secret),
+            secretTemplateId=6003,
+            secretTemplateName="Password",
+            siteId=1,
+            active=True,
+            checkedOut=False,
+            checkOutEnabled=False,
+            lastHeartBeatStatus="Success",
+            lastHeartBeatCheck="2023-01-01T00:00:00",
+            lastPasswordChangeAttempt="2023-01-01T00:00:00",
+            items=[item("username", secret["username"]), item("password", secret["password"])]
+            + [item(slug, "", attachment=True) for slug in secret.get("attachments", {})],
+        )
@@ -0,0 +1,143 @@
+import os
+import socket
+import time
+
+import pytest
+
+from nautobot_secrets_reader.agent import (
+    AgentClient,
+    AgentError,
+    AgentUnavailableError,
+    CredentialAgent,
+    agent_client,
+    receive_message,
+    send_message,
+)
+from nautobot_secrets_reader.resilience import DeadlineExceededError
+from nautobot_secrets_reader.secread import SecretsReader
+from nautobot_secrets_reader.settings import reset_settings
+from nautobot_secrets_reader.tests.benchmark import fake_environment
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+
+class StubReader:
+    def get_credentials_for_device(self, device_name, access_type=None, secret_type=None):
+        if device_name == "bad":
+            raise ValueError("Secrets Provider (unknown) is not suppoted!")
+        return [dict(access_type="SSH", secret_type="PASSWORD", value=f"{device_name}:{access_type}")]
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "agent" / "agent.sock")
+
+
+def test_message_framing():
+    left, right = socket.socketpair()
+    with left, right:
+        send_message(left, {"method": "ping", "params": {"value": "ä" * 10}})
+        assert receive_message(right) == {"method": "ping", "params": {"value": "ä" * 10}}
+        left.close()
+        assert receive_message(right) is None
+
+
+def test_agent_serves_requests(socket_path):
+    with CredentialAgent(StubReader(), socket_path=socket_path) as agent:
+        assert oct(os.stat(socket_path).st_mode & 0o777) == "0o600"
+        client = AgentClient(socket_path)
+        assert client.call("ping")["pid"] == os.getpid()
+        assert client.get_credentials_for_device("dev", access_type={"SSH"}) == [
+            dict(access_type="SSH", secret_type="PASSWORD", value="dev:['SSH']")
+        ]
+        with pytest.raises(ValueError):
+            client.get_credentials_for_device("bad")
+        with pytest.raises(AgentError):
+            client.call("clear_cache")
+        client.close()
+        with pytest.raises(RuntimeError):
+            CredentialAgent(StubReader(), socket_path=agent.socket_path)
+    assert not os.path.exists(socket_path)
+    with pytest.raises(AgentUnavailableError):
+        client.call("ping")
+
+
+def test_agent_refuses_other_users(socket_path):
+    if not hasattr(socket, "SO_PEERCRED"):
+        pytest.skip("Peer credentials not supported")
+    with CredentialAgent(StubReader(), socket_path=socket_path, allowed_uids=[os.getuid() + 1]):
+        with pytest.raises(AgentUnavailableError):
+            AgentClient(socket_path).call("ping")
+
+
+def test_default_socket_must_be_private(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    socket_path = str(tmp_path / "nautobot-secrets-reader" / "agent.sock")
+    assert agent_client(socket_path) is None
+    with CredentialAgent(StubReader(), socket_path=socket_path):
+        client = agent_client(socket_path)
+        assert client.server_uid == os.getuid() and client.call("ping")["pid"] == os.getpid()
+        client.close()
+        # e.g. created by another user: the directory can be listed by others
+        os.chmod(os.path.dirname(socket_path), 0o755)
+        assert agent_client(socket_path) is None
+        # A socket configured explicitly is trusted
+        monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "other"))
+        assert agent_client(socket_path).server_uid is None
+
+
+def test_client_refuses_agent_of_other_user(socket_path):
+    if not hasattr(socket, "SO_PEERCRED"):
+        pytest.skip("Peer credentials not supported")
+    with CredentialAgent(StubReader(), socket_path=socket_path):
+        with pytest.raises(AgentUnavailableError, match="another user"):
+            AgentClient(socket_path, server_uid=os.getuid() + 1).call("ping")
+        assert AgentClient(socket_path, server_uid=os.getuid()).call("ping")["pid"] == os.getpid()
+
+
+def test_reader_uses_agent(socket_path, monkeypatch):
+    fleet = FakeFleet(devices=40, groups=4, secrets=3)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            with CredentialAgent(socket_path=socket_path):
+                monkeypatch.setenv("SECRETS_READER_USE_AGENT", "True")
+                monkeypatch.setenv("SECRETS_READER_AGENT_SOCKET", socket_path)
+                reset_settings()
+                first = SecretsReader().get_credentials_for_device("device-00005")
+                calls = nautobot.total_requests + secret_server.total_requests
+                # A new process (reader) gets the credentials from the warm agent, without HTTP requests
+                reader = SecretsReader()
+                assert reader.agent is not None
+                assert reader.get_credentials_for_device("device-00005", access_type="SSH") == first[:2]
+                assert nautobot.total_requests + secret_server.total_requests == calls
+            # The agent was stopped: the reader reads the credentials itself
+            second = reader.get_credentials_for_device("device-00005")
+            assert reader.agent is None
+    assert [cred["value"] for cred in first] == ["user-2", "pwd-2", "pwd-3"]
+    assert second == first
+
+
+def test_agent_answers_stale_values_and_applies_the_deadline(socket_path, monkeypatch):
+    monkeypatch.setenv("SECRET_SERVER_HTTP_RETRIES", "0")
+    monkeypatch.setenv("SECRET_SERVER_FIELD_FETCH_MAX", "0")
+    fleet = FakeFleet(devices=8, groups=4, secrets=4)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            monkeypatch.setenv("SECRETS_READER_STALE_TTL", "60")
+            reset_settings()
+            agent_reader = SecretsReader(use_agent=False, cache_ttl=0.1)
+            with CredentialAgent(agent_reader, socket_path=socket_path, refresh_ahead=0):
+                monkeypatch.setenv("SECRETS_READER_USE_AGENT", "True")
+                monkeypatch.setenv("SECRETS_READER_AGENT_SOCKET", socket_path)
+                reset_settings()
+                reader = SecretsReader()
+                assert reader.agent is not None
+                assert not reader.get_credentials_for_device("device-00000", access_type="SSH").stale
+                time.sleep(0.15)
+                secret_server.latency = 1.0
+                started = time.monotonic()
+                credentials = reader.get_credentials_for_device("device-00000", access_type="SSH", timeout=0.2)
+                assert credentials.stale and credentials[1].stale and credentials[1].value == "pwd-1"
+                with pytest.raises(DeadlineExceededError):
+                    reader.get_credentials_for_device("device-00001", access_type="SSH", timeout=0.2)
+                assert time.monotonic() - started < 0.9
+                assert reader.agent is not None  # Still used after the deadline expired
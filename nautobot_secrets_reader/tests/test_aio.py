@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from nautobot_secrets_reader.aio import AsyncSecretsReader  # noqa: E402
+
+
+def association(secret_type, **parameters):
+    return dict(
+        access_type="SSH",
+        secret_type=secret_type,
+        secret=dict(
+            id=secret_type,
+            provider="thycotic-tss-id",
+            name=secret_type,
+            slug=secret_type,
+            description="",
+            parameters=parameters,
+        ),
+    )
+
+
+GROUP = {
+    "id": "group-1",
+    "name": "group",
+    "slug": "group",
+    "secretsgroupassociation_set": [
+        association("USERNAME", secret_id=1, secret_selected_value="username"),
+        association("PASSWORD", secret_id=1, secret_selected_value="password"),
+        association("TOKEN", secret_id=2, secret_selected_value="password"),
+    ],
+}
+
+
+@pytest.fixture
+def fake_backends(monkeypatch):
+    """Nautobot and Secret Server on a httpx.MockTransport, returns the requested paths."""
+    monkeypatch.setenv("NAUTOBOT_API_ENDPOINT", "https://nautobot.test")
+    monkeypatch.setenv("NAUTOBOT_TOKEN", "nb-token")
+    monkeypatch.setenv("SECRET_SERVER_BASE_URL", "https://tss.test/SecretServer")
+    monkeypatch.setenv("SECRET_SERVER_IS_CLOUD_BASED", "False")
+    monkeypatch.setenv("SECRET_SERVER_USERNAME", "user")
+    monkeypatch.setenv("SECRET_SERVER_PASSWORD", "pwd")
+    monkeypatch.setenv("REQUESTS_CA_BUNDLE", "")
+    requests = []
+
+    async def handler(request):
+        requests.append(request.url.path)
+        if request.url.path == "/api/graphql/":
+            assert request.headers["Authorization"] == "Token nb-token"
+            variables = json.loads(request.content)["variables"]
+            if "device_names" in variables:
+                device = dict(id="dev-1", name="ATKPTEST", secrets_group=GROUP, virtual_chassis=None)
+                return httpx.Response(200, json={"data": {"devices": [device]}})
+            return httpx.Response(200, json={"data": {"secrets_group": GROUP}})
+        if request.url.path == "/SecretServer/oauth2/token":
+            return httpx.Response(200, json={"access_token": "tss-token", "expires_in": 1200})
+        assert request.headers["Authorization"] == "Bearer tss-token"
+        await asyncio.sleep(0.01)
+        secret_id = request.url.path.rsplit("/", 1)[1]
+        items = [
+            {"slug": "username", "itemValue": f"user-{secret_id}", "fileAttachmentId": None},
+            {"slug": "password", "itemValue": f"pwd-{secret_id}", "fileAttachmentId": None},
+        ]
+        return httpx.Response(200, json={"id": secret_id, "items": items})
+
+    return requests, httpx.MockTransport(handler)
+
+
+def test_async_credentials_for_device(fake_backends):
+    requests, transport = fake_backends
+
+    async def main():
+        async with AsyncSecretsReader(transport=transport) as reader:
+            credentials = await reader.get_credentials_for_device("ATKPTEST")
+            again = await reader.get_credentials_for_secrets_group_id("group-1", secret_type="TOKEN")
+        return credentials, again
+
+    credentials, again = asyncio.run(main())
+    assert [cred["value"] for cred in credentials] == ["user-1", "pwd-1", "pwd-2"]
+    assert [cred["value"] for cred in again] == ["pwd-2"]
+    # One token request, every secret is read once (concurrent requests of secret 1 are coalesced)
+    secret_requests = [path for path in requests if "/secrets/" in path]
+    assert sorted(secret_requests) == ["/SecretServer/api/v1/secrets/1", "/SecretServer/api/v1/secrets/2"]
+    assert requests.count("/SecretServer/oauth2/token") == 1
+
+
+def test_async_concurrent_requests_share_one_fetch(fake_backends):
+    requests, transport = fake_backends
+
+    async def main():
+        async with AsyncSecretsReader(cache_ttl=0, transport=transport) as reader:
+            return await asyncio.gather(*(reader.get_secret_fields(secret_id=7) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert results == [{"username": "user-7", "password": "pwd-7"}] * 5
+    assert requests.count("/SecretServer/api/v1/secrets/7") == 1
+
+
+def test_async_secret_paths_are_normalized_like_the_sdk(fake_backends):
+    _, transport = fake_backends
+    paths = []
+
+    async def handler(request):
+        if request.url.path.endswith("/oauth2/token"):
+            return await transport.handler(request)
+        paths.append(request.url.params["secretPath"])
+        return httpx.Response(200, json={"id": 1, "items": [{"slug": "password", "itemValue": "pwd"}]})
+
+    async def main():
+        async with AsyncSecretsReader(transport=httpx.MockTransport(handler)) as reader:
+            first = await reader.get_secret_fields(secret_path="/Network//Switches/secret-1/")
+            again = await reader.get_secret_fields(secret_path="\\Network\\Switches\\\\secret-1")
+        return first, again
+
+    assert asyncio.run(main()) == ({"password": "pwd"},) * 2
+    # Sent as by the SDK (get_secret_by_path), the second spelling of the path is served from the cache
+    assert paths == ["\\Network\\Switches\\secret-1"]
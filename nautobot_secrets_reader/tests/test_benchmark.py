@@ -0,0 +1,50 @@
+import json
+
+from nautobot_secrets_reader.secread import SecretsReader
+from nautobot_secrets_reader.tests.benchmark import fake_environment, main, percentile
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+
+def test_reader_against_fake_servers():
+    fleet = FakeFleet(devices=40, groups=4, secrets=3)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            reader = SecretsReader()
+            credentials = reader.get_credentials_for_device("device-00005")
+            # Device 19 has no own secrets group and uses the group of its virtual chassis master
+            master = reader.get_credentials_for_device("device-00019")
+            bulk = reader.get_credentials_for_devices(["device-00001", "device-00002", "unknown"])
+    assert [cred["value"] for cred in credentials] == ["user-2", "pwd-2", "pwd-3"]
+    assert [cred["value"] for cred in master] == ["user-3", "pwd-3", "pwd-1"]
+    assert [cred["value"] for cred in bulk.credentials["device-00002"]] == ["user-3", "pwd-3", "pwd-1"]
+    assert bulk.credentials["unknown"] == [] and not bulk.errors
+    assert secret_server.requests["oauth"] == 1
+    # Secrets 2 and 3 by id, 3 and 1 by path; the bulk request is answered from the cache
+    assert secret_server.requests["secret"] + secret_server.requests["secret-by-path"] == 4
+
+
+def test_benchmark_report(tmp_path):
+    output = tmp_path / "report.json"
+    argv = ["--devices", "60", "--groups", "6", "--secrets", "4", "--samples", "10", "--import-runs", "1"]
+    assert main(argv + ["--output", str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert set(report["scenarios"]) == {
+        "get_credentials_for_device",
+        "get_credentials_for_secrets_group_id",
+        "fleet_loop",
+        "fleet_bulk",
+        "agent_warm_device",
+    }
+    fleet_loop = report["scenarios"]["fleet_loop"]
+    assert fleet_loop["calls"] == 60 and fleet_loop["errors"] == 0
+    assert fleet_loop["latency_ms"]["p50"] <= fleet_loop["latency_ms"]["p99"]
+    assert fleet_loop["http_calls_per_device"] > 0
+    assert fleet_loop["peak_memory_bytes"] > 0
+    assert report["scenarios"]["agent_warm_device"]["http_calls_per_call"] == 0
+    assert report["startup"]["import_ms"] <= report["startup"]["first_reader_ms"]
+
+
+def test_percentile():
+    assert percentile([3.0, 1.0, 2.0, 4.0], 50) == 2.0
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([], 50) == 0.0
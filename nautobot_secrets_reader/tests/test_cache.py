@@ -0,0 +1,196 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from nautobot_secrets_reader.cache import CacheRefresher, SecretCache, SingleFlight
+from nautobot_secrets_reader.delinea import ThycoticSecretServerSecretsReader
+from nautobot_secrets_reader.secread import SecretsReader
+
+
+def fake_secret(secret_id=None, secret_path=None):
+    name = secret_id if secret_id is not None else secret_path
+    return SimpleNamespace(
+        name=name,
+        fields={
+            "username": SimpleNamespace(value=f"user-{name}", file_attachment_id=None),
+            "password": SimpleNamespace(value=f"pwd-{name}", file_attachment_id=None),
+        },
+    )
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """Count the Secret Server queries (of whole secrets)."""
+    calls = []
+    monkeypatch.setenv("SECRET_SERVER_FIELD_FETCH_MAX", "0")
+
+    def fake_query(self, secret_id=None, secret_path=None, fetch_file_attachments=True):
+        calls.append(secret_id if secret_id is not None else secret_path)
+        return fake_secret(secret_id=secret_id, secret_path=secret_path)
+
+    monkeypatch.setattr(ThycoticSecretServerSecretsReader, "_fetch_secret", fake_query)
+    return calls
+
+
+def test_cache_lru_eviction_and_stats():
+    cache = SecretCache(ttl=60, max_entries=2)
+    first = {"password": "one"}
+    cache.set(("p", "1"), first)
+    cache.set(("p", "2"), {"password": "two"})
+    assert cache.get(("p", "1")) == {"password": "one"}
+    cache.set(("p", "3"), {"password": "three"})
+    # ("p", "2") is the least recently used entry
+    assert cache.get(("p", "2")) is None
+    assert cache.get(("p", "3")) == {"password": "three"}
+    assert first == {"password": "one"}
+    assert cache.stats() == dict(entries=2, max_entries=2, hits=2, misses=1, evictions=1, coalesced=0, refreshes=0)
+
+
+def test_cache_ttl_and_invalidate(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("nautobot_secrets_reader.cache.time.monotonic", lambda: now[0])
+    cache = SecretCache(ttl=10)
+    cache.set("key", {"password": "secret"})
+    handed_out = cache.get("key")
+    now[0] += 11
+    assert cache.get("key") is None
+    assert handed_out == {"password": "secret"}
+    cache.set("key", {"password": "secret"})
+    assert cache.invalidate("key") is True
+    assert cache.invalidate("key") is False
+    cache.set("key", {"password": "secret"})
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_cache_disabled():
+    cache = SecretCache(ttl=0)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+
+
+def test_secrets_reader_caches_alternating_secrets(queries):
+    reader = SecretsReader(cache_ttl=60, cache_max_entries=10)
+    for _ in range(3):
+        assert reader.get_secret_tss({"secret_id": 1, "secret_selected_value": "username"}) == "user-1"
+        assert reader.get_secret_tss({"secret_path": "/f/2", "secret_selected_value": "password"}) == "pwd-/f/2"
+    assert queries == [1, "/f/2"]
+    assert reader.cache_stats()["hits"] == 4
+    assert reader.invalidate_secret("thycotic-tss-id", "1") is True
+    reader.get_secret_tss({"secret_id": 1, "secret_selected_value": "password"})
+    assert queries == [1, "/f/2", 1]
+
+
+def test_shared_reader_coalesces_concurrent_requests(monkeypatch):
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_query(self, secret_id=None, secret_path=None, fetch_file_attachments=True):
+        calls.append(secret_id)
+        started.set()
+        release.wait(5)
+        return fake_secret(secret_id=secret_id)
+
+    monkeypatch.setenv("SECRET_SERVER_FIELD_FETCH_MAX", "0")
+    monkeypatch.setattr(ThycoticSecretServerSecretsReader, "_fetch_secret", slow_query)
+    reader = SecretsReader(cache_ttl=60)
+    parameters = {"secret_id": 1, "secret_selected_value": "password"}
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(reader.get_secret_tss, parameters) for _ in range(8)]
+        started.wait(5)
+        while reader.cache_stats()["coalesced"] < 7:
+            time.sleep(0.001)
+        release.set()
+        assert [future.result() for future in futures] == ["pwd-1"] * 8
+    assert calls == [1]
+
+
+def test_single_flight_shares_errors():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("vault unavailable")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(flights.do, "key", failing) for _ in range(3)]
+        while flights.coalesced < 2:
+            time.sleep(0.001)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    assert flights.do("key", lambda: "recovered") == "recovered"
+
+
+def test_cache_refresh_ahead(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("nautobot_secrets_reader.cache.time.monotonic", lambda: now[0])
+    loads = []
+
+    def loader():
+        loads.append(now[0])
+        return {"password": f"pwd-{len(loads)}"}
+
+    cache = SecretCache(ttl=100)
+    cache.get_or_load("used", loader)
+    cache.set("stored", {"password": "secret"})  # Without loader, never refreshed
+    assert cache.refresh_ahead(margin=30) == 0
+    now[0] += 80
+    assert cache.refresh_ahead(margin=30) == 1
+    assert cache.get("used", count=False) == {"password": "pwd-2"}
+    # Refreshed again only if read since the last refresh
+    now[0] += 80
+    assert cache.refresh_ahead(margin=30) == 1
+    now[0] += 80
+    assert cache.refresh_ahead(margin=30) == 0
+    now[0] += 30
+    assert cache.get("used") is None and cache.stats()["refreshes"] == 2
+
+
+def test_cache_refresher_thread():
+    cache = SecretCache(ttl=0.3)
+    loads = []
+    cache.get_or_load("key", lambda: loads.append(1) or {"password": "secret"})
+    refresher = CacheRefresher(cache, margin=0.25, interval=0.02).start()
+    try:
+        time.sleep(0.2)
+        assert cache.get("key") == {"password": "secret"}
+    finally:
+        refresher.stop()
+    assert len(loads) >= 2 and not refresher.running
+
+
+def test_cache_keep_warm_and_concurrent_refresh(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("nautobot_secrets_reader.cache.time.monotonic", lambda: now[0])
+    cache = SecretCache(ttl=100)
+    with cache.keep_warm():
+        cache.get_or_load("warm", lambda: {"password": "warm"})
+    cache.get_or_load("used", lambda: {"password": "used"})
+    for _ in range(3):  # Not read, the kept warm entry is refreshed every time
+        now[0] += 80
+        cache.refresh_ahead(margin=30)
+    assert cache.get("warm", count=False) == {"password": "warm"} and cache.get("used", count=False) is None
+    # A reader joining a slow refresh receives the refreshed value
+    started, release = threading.Event(), threading.Event()
+
+    def slow_loader():
+        started.set()
+        release.wait()
+        return {"password": "new"}
+
+    cache._keep_warm["warm"] = slow_loader
+    cache.invalidate("warm")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        refresh = executor.submit(cache.refresh_ahead, 30)
+        started.wait()
+        reader = executor.submit(cache.get_or_load, "warm", lambda: {"password": "reader"})
+        time.sleep(0.05)
+        release.set()
+        assert reader.result() == {"password": "new"} and refresh.result() == 1
@@ -0,0 +1,118 @@
+import json
+import logging
+import pickle
+
+import pytest
+
+from nautobot_secrets_reader.cache import mark_stale
+from nautobot_secrets_reader.credentials import Credential, CredentialSet
+from nautobot_secrets_reader.secread import SecretsReader
+from nautobot_secrets_reader.tests.benchmark import fake_environment
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+
+def association(access_type, secret_type, name):
+    return dict(
+        access_type=access_type,
+        secret_type=secret_type,
+        secret=dict(id=f"id-{name}", provider="environment-variable", name=name, slug=name.lower(), description=""),
+    )
+
+
+def credential_set():
+    return CredentialSet(
+        [
+            Credential.from_association(association("SSH", "USERNAME", "User"), "admin"),
+            Credential.from_association(association("SSH", "PASSWORD", "Password"), "secret"),
+            Credential.from_association(association("HTTP", "TOKEN", "Token"), "token"),
+        ]
+    )
+
+
+def test_credential_reads_like_dictionary():
+    cred = Credential.from_association(association("SSH", "PASSWORD", "Password"), "secret")
+    expected = dict(
+        access_type="SSH",
+        secret_type="PASSWORD",
+        secret_name="Password",
+        secret_slug="password",
+        secret_id="id-Password",
+        secret_provider="environment-variable",
+        secret_description="",
+        value="secret",
+    )
+    assert cred == expected
+    assert dict(cred) == expected == cred.to_dict()
+    assert cred["value"] == cred.value == cred.get("value") == "secret"
+    assert cred.get("unknown", "default") == "default"
+    with pytest.raises(KeyError):
+        cred["unknown"]  # pylint: disable=pointless-statement
+    with pytest.raises(AttributeError):
+        cred.value = "changed"
+    assert "value" not in repr(cred)
+    assert pickle.loads(pickle.dumps(cred)) == cred
+    assert Credential.from_dict(expected) == cred
+
+
+def test_credential_metadata_is_interned():
+    name = "".join(["Shared", " Password"])  # Not a constant, not interned by the compiler
+    first = Credential.from_association(association("SSH", "PASSWORD", name), "one")
+    second = Credential.from_association(association("SSH", "PASSWORD", "".join(["Shared", " Password"])), "two")
+    assert first.secret_name is second.secret_name
+
+
+def test_credential_set_indexes():
+    credentials = credential_set()
+    assert len(credentials) == 3
+    assert [cred["value"] for cred in credentials] == ["admin", "secret", "token"]
+    assert [cred.value for cred in credentials.by_access_type("ssh")] == ["admin", "secret"]
+    assert [cred.value for cred in credentials.by_secret_type("Token")] == ["token"]
+    assert credentials.by_access_type("SNMP") == []
+    assert credentials.find("ssh", "password").value == "secret"
+    assert credentials.find("http", "password") is None
+    assert credentials.filter_access_type("SSH") == dict(username="admin", password="secret")
+    assert credentials == credentials.to_dicts()
+    assert CredentialSet.from_dicts(json.loads(json.dumps(credentials.to_dicts()))) == credentials
+    assert CredentialSet.of(credentials) is credentials
+    assert isinstance(credentials[1:], CredentialSet)
+
+
+def test_filter_access_type_reports_duplicates(caplog):
+    credentials = CredentialSet(
+        [
+            Credential.from_association(association("SSH", "PASSWORD", "Old"), "old"),
+            Credential.from_association(association("SSH", "PASSWORD", "New"), "new"),
+        ]
+    )
+    with caplog.at_level(logging.WARNING):
+        assert credentials.filter_access_type("ssh") == dict(password="new")
+    assert "ignoring secret 'Old'" in caplog.text
+    # Lists of dictionaries are accepted too
+    assert SecretsReader(use_agent=False).filter_access_type(credentials.to_dicts(), "SSH") == dict(password="new")
+
+
+def test_devices_share_the_credentials_of_their_group():
+    fleet = FakeFleet(devices=8, groups=2, secrets=3)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            reader = SecretsReader()
+            result = reader.get_credentials_for_devices(fleet.devices)
+            single = reader.get_credentials_for_device("device-00000")
+    credentials = result.credentials
+    assert isinstance(credentials["device-00000"], CredentialSet)
+    assert credentials["device-00000"] is credentials["device-00002"]
+    assert credentials["device-00000"] == single
+    assert credentials["device-00001"].filter_access_type("ssh") == dict(username="user-2", password="pwd-2")
+
+
+def test_stale_flag_survives_json():
+    credentials = CredentialSet(
+        [
+            Credential.from_association(association("SSH", "USERNAME", "User"), "admin"),
+            Credential.from_association(association("SSH", "PASSWORD", "Password"), mark_stale("secret")),
+        ]
+    )
+    assert "stale" not in credentials.to_dicts()[1]
+    restored = CredentialSet.from_dicts(json.loads(json.dumps(credentials.to_dicts(stale=True))))
+    assert restored == credentials and restored.stale
+    assert not restored[0].stale and restored[1].stale
@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from requests import Response
+
+from nautobot_secrets_reader import delinea
+from nautobot_secrets_reader.delinea import (
+    RefreshingPasswordGrantAuthorizer,
+    ThycoticSecretServerSecretsReader,
+    get_secret_server_client,
+    reset_secret_server_clients,
+)
+from nautobot_secrets_reader.secread import SecretsReader
+from nautobot_secrets_reader.tests.benchmark import fake_environment
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+
+@pytest.fixture
+def grants(monkeypatch):
+    """Count the OAuth password grants instead of calling Secret Server."""
+    calls = []
+
+    def fake_grant(token_url, grant_request):
+        calls.append(grant_request)
+        return {"access_token": f"token-{len(calls)}", "expires_in": 1200}
+
+    monkeypatch.setattr(RefreshingPasswordGrantAuthorizer, "get_access_grant", staticmethod(fake_grant))
+    return calls
+
+
+@pytest.fixture
+def tss_config(monkeypatch):
+    monkeypatch.setenv("SECRET_SERVER_BASE_URL", "https://pw.example.local/SecretServer")
+    monkeypatch.setenv("SECRET_SERVER_USERNAME", "pw_user")
+    monkeypatch.setenv("SECRET_SERVER_PASSWORD", "pw_secret_password")
+    monkeypatch.setenv("SECRET_SERVER_DOMAIN", "")
+    reset_secret_server_clients()
+    yield ThycoticSecretServerSecretsReader().config
+    reset_secret_server_clients()
+
+
+def test_authorizer_reuses_token_until_refresh_margin(grants):
+    auth = RefreshingPasswordGrantAuthorizer("https://pw.example.local", "user", "pass", refresh_margin=60)
+    assert auth.get_access_token() == "token-1"
+    assert auth.get_access_token() == "token-1"
+    assert len(grants) == 1
+    # Token expires within the refresh margin -> a new grant is requested
+    auth.access_grant_refreshed = datetime.now() - timedelta(seconds=1200 - 30)
+    assert auth.get_access_token() == "token-2"
+    assert "domain" not in grants[-1]
+
+
+def test_authorizer_drops_only_the_rejected_token(grants):
+    auth = RefreshingPasswordGrantAuthorizer("https://pw.example.local", "user", "pass")
+    barrier = threading.Barrier(8)
+    tokens = []
+
+    def rejected_request():
+        token = auth.get_access_token()
+        barrier.wait()  # All threads were rejected with the same token
+        auth.invalidate(token)
+        tokens.append(auth.get_access_token())
+
+    threads = [threading.Thread(target=rejected_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tokens == ["token-2"] * 8 and len(grants) == 2
+    auth.invalidate("token-1")  # A late rejection of the old token keeps the new one
+    assert auth.get_access_token() == "token-2"
+    auth.invalidate()
+    assert auth.get_access_token() == "token-3"
+
+
+def test_authorizer_sends_domain(grants):
+    auth = RefreshingPasswordGrantAuthorizer("https://pw.example.local", "user", "pass", domain="CORP")
+    auth.get_access_token()
+    assert grants[0]["domain"] == "CORP"
+
+
+def test_secret_server_client_is_shared(tss_config, grants):
+    client = get_secret_server_client(tss_config)
+    assert get_secret_server_client(dict(tss_config)) is client
+    assert isinstance(client.authorizer, RefreshingPasswordGrantAuthorizer)
+    other = dict(tss_config, username="other_user")
+    assert get_secret_server_client(other) is not client
+    assert len(delinea._clients) == 2
+
+
+def test_ca_bundle_is_passed_per_request(tss_config, grants, monkeypatch, tmp_path):
+    ca_bundle = tmp_path / "ca-bundle.crt"
+    ca_bundle.write_text("")
+    monkeypatch.delenv("REQUESTS_CA_BUNDLE", raising=False)
+    client = get_secret_server_client(dict(tss_config, ca_bundle_path=str(ca_bundle)))
+    requests = []
+
+    def fake_get(url, **kwargs):
+        requests.append(kwargs["verify"])
+        assert "REQUESTS_CA_BUNDLE" not in os.environ
+        response = Response()
+        response.status_code = 200
+        response._content = json.dumps({"id": 1, "name": "secret", "items": []}).encode()
+        return response
+
+    monkeypatch.setattr(client.session, "get", fake_get)
+    assert client.get_secret(1)["name"] == "secret"
+    assert requests == [str(ca_bundle)]
+    assert client.authorizer.verify == str(ca_bundle)
+
+
+def test_rejected_token_is_renewed_once(tss_config, grants, monkeypatch):
+    client = get_secret_server_client(tss_config)
+    tokens = []
+
+    def fake_get(url, headers, **kwargs):
+        tokens.append(headers["Authorization"])
+        response = Response()
+        response.status_code = 401 if len(tokens) == 1 else 200
+        response._content = json.dumps({"id": 1, "name": "secret", "items": []}).encode()
+        return response
+
+    monkeypatch.setattr(client.session, "get", fake_get)
+    assert client.get_secret(1)["name"] == "secret"
+    assert tokens == ["Bearer token-1", "Bearer token-2"]
+    assert len(grants) == 2
+
+
+def test_token_is_renewed_only_once(tss_config, grants, monkeypatch):
+    client = get_secret_server_client(tss_config)
+
+    def fake_get(url, **kwargs):
+        response = Response()
+        response.status_code = 401
+        response._content = b'{"message": "Access denied"}'
+        return response
+
+    monkeypatch.setattr(client.session, "get", fake_get)
+    with pytest.raises(delinea.SecretServerError):
+        client.get_secret(1)
+    assert len(grants) == 2
+
+
+def test_invalidated_secret_is_read_again_after_rotation():
+    fleet = FakeFleet(devices=1, groups=1, secrets=2)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            reader = SecretsReader(cache_ttl=60)
+            parameters = {"secret_id": "1", "secret_selected_value": "password"}
+            assert reader.get_secret_tss(parameters) == "pwd-1"
+            assert reader.tss.query_thycotic_secret_server(secret_id="1").fields["password"].value == "pwd-1"
+            fleet.secrets["1"]["password"] = "rotated-1"
+            assert reader.get_secret_tss(parameters) == "pwd-1"  # Cached
+            assert reader.invalidate_secret("thycotic-tss-id", "1") is True
+            assert reader.get_secret_tss(parameters) == "rotated-1"
+            # The last secret of get() is only replaced by query_thycotic_secret_server()
+            assert reader.tss.get("password") == "pwd-1"
+            reader.tss.query_thycotic_secret_server(secret_id="1")
+            assert reader.tss.get("password") == "rotated-1"
+
+
+def test_secret_path_is_resolved_once_then_read_by_id():
+    fleet = FakeFleet(devices=1, groups=1, secrets=2)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            tss = ThycoticSecretServerSecretsReader()
+            for _ in range(3):
+                assert tss.query_thycotic_secret_server(secret_path="\\Network\\secret-2").fields["password"].value
+            assert secret_server.requests["secret-by-path"] == 1
+            assert secret_server.requests["secret"] == 2
+            assert tss.path_index.get("/Network/secret-2/").secret_id == 2
+
+
+def test_secret_path_index_entry_is_invalidated(monkeypatch):
+    fleet = FakeFleet(devices=1, groups=1, secrets=3)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            tss = ThycoticSecretServerSecretsReader()
+            tss.query_thycotic_secret_server(secret_path="\\Network\\secret-1")
+            # The secret was deleted and another one created at the path
+            fleet.secrets["4"] = dict(fleet.secrets.pop("1"), id=4)
+            secret = tss.query_thycotic_secret_server(secret_path="\\Network\\secret-1")
+            assert secret.id == 4 and tss.path_index.get("\\Network\\secret-1").secret_id == 4
+            # The secret was renamed and another one moved to the path
+            fleet.secrets["4"]["name"] = "renamed"
+            fleet.secrets["2"].update(name="secret-1", path="\\Network\\secret-1")
+            assert tss.query_thycotic_secret_server(secret_path="\\Network\\secret-1").id == 2
+            assert secret_server.requests["secret-by-path"] == 3
+    # Without the index, every read is a lookup by path
+    monkeypatch.setenv("SECRET_SERVER_PATH_INDEX", "False")
+    assert ThycoticSecretServerSecretsReader().path_index is None
+
+
+def test_index_folder_lists_the_secrets_in_pages(monkeypatch):
+    monkeypatch.setattr(delinea, "FOLDER_LISTING_PAGE_SIZE", 2)
+    fleet = FakeFleet(devices=1, groups=1, secrets=5)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            tss = ThycoticSecretServerSecretsReader()
+            assert tss.index_folder("\\Network") == 5
+            assert secret_server.requests["list-secrets"] == 3
+            assert tss.query_thycotic_secret_server(secret_path="\\Network\\secret-5").id == 5
+            assert secret_server.requests["secret-by-path"] == 0
+            with pytest.raises(ValueError, match="Secret Server error"):
+                tss.index_folder("\\Unknown")
+
+
+def test_secret_path_index_file(tmp_path):
+    file = str(tmp_path / "index" / "paths.json")
+    index = delinea.SecretPathIndex(file, base_url="https://pw.example.local/SecretServer")
+    index.set("\\Network\\secret-1", delinea.PathIndexEntry(1, 2, "secret-1"))
+    assert os.stat(file).st_mode & 0o777 == 0o600
+    assert delinea.SecretPathIndex(file, "https://pw.example.local/SecretServer").get("\\Network\\secret-1") == (
+        1,
+        2,
+        "secret-1",
+    )
+    # The index of another Secret Server is not used
+    assert len(delinea.SecretPathIndex(file, base_url="https://other.example.local/SecretServer")) == 0
+    index.invalidate("Network/secret-1")
+    assert len(delinea.SecretPathIndex(file, base_url="https://pw.example.local/SecretServer")) == 0
+
+
+def test_single_field_is_read_field_by_field():
+    fleet = FakeFleet(devices=1, groups=2, secrets=2)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            reader = SecretsReader(cache_ttl=60)
+            parameters = {"secret_id": "1", "secret_selected_value": "password"}
+            assert reader.get_secret_tss(parameters) == "pwd-1"
+            assert reader.get_secret_tss(parameters) == "pwd-1"
+            assert secret_server.requests["secret-field"] == 1 and secret_server.requests["secret"] == 0
+            # Username and password of the secrets group: the whole secret with one request
+            credentials = reader.read_credentials({"secrets_group": fleet.groups["group-1"]}, access_type="SSH")
+            assert credentials.filter_access_type("SSH") == dict(username="user-2", password="pwd-2")
+            assert secret_server.requests["secret"] == 1 and secret_server.requests["secret-field"] == 1
+            # The fields read one by one are invalidated with the secret
+            assert reader.invalidate_secret("thycotic-tss-id", "1") is True
+            assert reader.invalidate_secret("thycotic-tss-id", "1") is False
+            # A field the secret does not have is reported by the whole secret
+            with pytest.raises(KeyError):
+                reader.get_secret_tss({"secret_id": "1", "secret_selected_value": "notes"})
+            assert secret_server.requests["secret"] == 2 and secret_server.requests["secret-field"] == 2
+
+
+def test_file_attachments_are_only_downloaded_if_requested(monkeypatch):
+    monkeypatch.setenv("SECRET_SERVER_FIELD_FETCH_MAX", "0")
+    fleet = FakeFleet(devices=1, groups=1, secrets=1)
+    fleet.secrets["1"]["attachments"] = {"private-key": b"-----BEGIN KEY-----"}
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            tss = ThycoticSecretServerSecretsReader()
+            assert tss.get_secret_field_values(["username", "password"], secret_id="1") == dict(
+                username="user-1", password="pwd-1"
+            )
+            assert secret_server.requests["secret-field"] == 0
+            assert tss.get_secret_field_values(["private-key"], secret_id="1") == {"private-key": "-----BEGIN KEY-----"}
+            assert secret_server.requests["secret-field"] == 1
+            # Answered from the cached fields
+            assert tss.get_secret_field_values(["password", "private-key"], secret_id="1")["password"] == "pwd-1"
+            assert secret_server.requests["secret"] == 2 and secret_server.requests["secret-field"] == 1
@@ -0,0 +1,125 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+import yaml
+
+from nautobot_secrets_reader.cli import main
+from nautobot_secrets_reader.export import export_credentials
+from nautobot_secrets_reader.secread import DeviceCredentials, SecretsReader
+from nautobot_secrets_reader.tests.benchmark import fake_environment
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+
+@pytest.fixture
+def fleet_reader():
+    fleet = FakeFleet(devices=30, groups=4, secrets=3)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            yield fleet, nautobot, secret_server
+
+
+def test_iter_credentials_pages_devices_in_input_order(fleet_reader):
+    fleet, nautobot, secret_server = fleet_reader
+    reader = SecretsReader()
+    records = list(
+        reader.iter_credentials_for_devices(
+            {"site": "site-1"}, ["device-00000", "device-00001", "unknown"], access_type="SSH", page_size=4
+        )
+    )
+    names = [record.device for record in records]
+    assert names[:3] == ["device-00000", "device-00001", "unknown"]
+    # device-00001 is at site-1 too, it is exported once
+    assert names[3:] == [name for name, site in fleet.sites.items() if site == "site-1" and name != "device-00001"]
+    assert records[0].credentials[1]["value"] == "pwd-1"
+    assert records[2] == DeviceCredentials("unknown", [])
+    # Every distinct secret is read once
+    assert secret_server.requests["secret"] == 3
+
+
+def test_iter_credentials_bounds_reads_in_flight(monkeypatch):
+    reader = SecretsReader(use_agent=False)
+    names = [f"device-{index}" for index in range(20)]
+    monkeypatch.setattr(
+        reader, "_resolve_devices", lambda page, result: ({name: "group" for name in page}, {"group": None})
+    )
+    lock = threading.Lock()
+    running = [0, 0]  # current, maximum
+
+    def read(name, group_id, groups, access_type, secret_type):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.002 * (int(name.rsplit("-", 1)[1]) % 3))
+        with lock:
+            running[0] -= 1
+        return DeviceCredentials(name)
+
+    monkeypatch.setattr(reader, "_read_device_credentials", read)
+    records = list(reader.iter_credentials_for_devices(device_names=names, max_in_flight=3, page_size=7))
+    assert [record.device for record in records] == names
+    assert running[1] <= 3
+    records = list(reader.iter_credentials_for_devices(device_names=names, order="completion", max_in_flight=3))
+    assert sorted(record.device for record in records) == sorted(names)
+    assert running[1] <= 3
+    with pytest.raises(ValueError, match="Invalid order"):
+        reader.iter_credentials_for_devices(device_names=names, order="random")
+
+
+def test_export_formats(fleet_reader):
+    reader = SecretsReader()
+    devices = ["device-00000", "device-00019", "unknown"]
+    output = io.StringIO()
+    result = export_credentials(reader, output, "jsonl", device_names=devices, access_type="SSH")
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line["device"] for line in lines] == devices
+    assert lines[1]["credentials"][0]["value"] == "user-3"  # Secrets group of the virtual chassis master
+    assert result.devices == 3 and result.errors == {}
+
+    output = io.StringIO()
+    export_credentials(reader, output, "nornir", device_names=devices, access_type="SSH")
+    hosts = yaml.safe_load(output.getvalue())
+    assert hosts["device-00000"]["username"] == "user-1"
+    assert hosts["device-00000"]["password"] == "pwd-1"
+    assert "username" not in hosts["unknown"]
+
+    output = io.StringIO()
+    export_credentials(reader, output, "ansible", device_names=devices, access_type="SSH")
+    inventory = json.loads(output.getvalue())
+    assert inventory["all"]["hosts"] == devices
+    assert inventory["_meta"]["hostvars"]["device-00019"]["ansible_password"] == "pwd-3"
+
+    output = io.StringIO()
+    export_credentials(reader, output, "ansible", device_names=[])
+    assert json.loads(output.getvalue()) == {"_meta": {"hostvars": {}}, "all": {"hosts": []}}
+    with pytest.raises(ValueError, match="Invalid export format"):
+        export_credentials(reader, output, "csv", device_names=devices)
+
+
+def test_export_records_unreadable_secrets(fleet_reader):
+    fleet, nautobot, secret_server = fleet_reader
+    del fleet.secrets["2"]  # SSH credentials of secrets group 1, e.g. device-00001
+    reader = SecretsReader()
+    devices = ["device-00000", "device-00001", "device-00002"]
+    output = io.StringIO()
+    result = export_credentials(reader, output, "jsonl", device_names=devices, access_type="SSH")
+    assert result.devices == 3 and list(result.errors) == ["device-00001"]
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line["device"] for line in lines] == devices
+    assert lines[1]["credentials"] == [] and lines[1]["error"]
+    assert lines[2]["credentials"][1]["value"] == "pwd-3" and lines[2]["error"] is None
+    for export_format in ("nornir", "ansible"):  # The device is left out of the inventories
+        result = export_credentials(reader, io.StringIO(), export_format, device_names=devices, access_type="SSH")
+        assert result.devices == 2 and list(result.errors) == ["device-00001"]
+
+
+def test_export_command(fleet_reader, tmp_path, capsys):
+    output = tmp_path / "inventory.json"
+    assert main(["export", "--site", "site-2", "--format", "ansible", "--order", "completion", "-o", str(output)]) == 0
+    assert output.stat().st_mode & 0o777 == 0o600
+    assert len(json.loads(output.read_text())["all"]["hosts"]) == 10
+    assert json.loads(capsys.readouterr().err) == dict(devices=10, errors={})
+    with pytest.raises(SystemExit, match="Select the devices"):
+        main(["export"])
@@ -0,0 +1,113 @@
+import os
+import stat
+import time
+
+import pytest
+
+from nautobot_secrets_reader.metacache import MetadataCache
+from nautobot_secrets_reader.nbinfo import SecretGroupinfo
+from nautobot_secrets_reader.tests.benchmark import fake_environment
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+pytest.importorskip("cryptography.fernet")
+
+from nautobot_secrets_reader.metastore import MetadataStore  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def group_info(group_id, *secret_ids):
+    associations = [
+        {"access_type": "SSH", "secret_type": "PASSWORD", "secret": {"id": secret_id, "name": f"secret-{secret_id}"}}
+        for secret_id in secret_ids
+    ]
+    return {"secrets_group": {"id": group_id, "name": f"group-{group_id}", "secretsgroupassociation_set": associations}}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache" / "metadata.db")
+
+
+def test_store_is_encrypted_and_keyed(path):
+    store = MetadataStore(path, "key material")
+    store.set_group("g1", group_info("g1", "s1"))
+    store.set_device("core-switch-1", "d1", "d1", "g1")
+    store.save_state("2022-08-01T10:00:00Z", [7])
+    store.close()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) == 0o700
+    content = b"".join(open(name, "rb").read() for name in (path, f"{path}-wal") if os.path.exists(name))
+    assert b"core-switch-1" not in content and b"group-g1" not in content and b"2022-08-01" not in content
+
+    store = MetadataStore(path, "key material")
+    assert store.get_group("g1") == group_info("g1", "s1")
+    assert store.get_device("core-switch-1") == ("d1", "d1", "g1")
+    assert store.get_device("unknown") is None
+    marker, marker_ids, _ = store.load_state()
+    assert (marker, marker_ids) == ("2022-08-01T10:00:00Z", [7])
+    store.close()
+
+    # Another key can not read the file: it is emptied
+    store = MetadataStore(path, "other key material")
+    assert store.get_group("g1") is None and store.load_state() is None
+    assert store.stats() == dict(groups=0, devices=0)
+    store.close()
+
+
+def test_store_drops_entries(path):
+    store = MetadataStore(path, "key material")
+    store.set_group("g1", group_info("g1", "s1", "s2"))
+    store.set_group("g2", group_info("g2", "s2"))
+    store.set_group("g3", group_info("g3", "s3"))
+    store.drop_groups(secret_id="s2")
+    assert store.get_group("g1") is None and store.get_group("g2") is None and store.get_group("g3") is not None
+    store.drop_groups(["g3"])
+    assert store.stats()["groups"] == 0
+    store.set_device("sw1", "d1", "d1", "g1")
+    store.set_device("member", "d2", "d9", "g2")
+    store.set_device("no-group", "d3", "d3", None)
+    store.set_device("sw2", "d4", "d4", "g1")
+    store.drop_devices("d9", "renamed")  # The master of member
+    assert store.get_device("member") is None and store.get_device("sw1") is not None
+    store.drop_devices(None, "sw1")
+    assert store.get_device("sw1") is None
+    store.drop_devices()  # Virtual chassis change: devices without own secrets group
+    assert store.get_device("no-group") is None and store.get_device("sw2") == ("d4", "d4", "g1")
+    # The change log position expires
+    store.save_state("2022-08-01T10:00:00Z", [])
+    store.max_age = 0
+    time.sleep(0.01)
+    assert store.load_state() is None
+    store.close()
+
+
+def test_metadata_cache_resumes_from_the_file(path):
+    cache = MetadataCache(poll_interval=60, store=MetadataStore(path, "key material"))
+    assert cache.marker is None and cache.poll_due()
+    cache.clear()
+    cache.polled("2022-08-01T10:00:00Z", [{"id": 1, "time": "2022-08-01T10:00:00Z"}])
+    cache.set_group("g1", group_info("g1", "s1"))
+    cache.set_group("g2", group_info("g2", "s2"))
+    cache.set_device("sw1", "d1", "d1", "g1")
+    cache.set_device("sw2", "d2", "d2", "g2")
+    cache.apply_change({"changed_object_type": "extras.secret", "changed_object_id": "s2"})
+
+    fresh = MetadataCache(poll_interval=60, store=MetadataStore(path, "key material"))
+    assert not fresh.poll_due() and fresh.marker == "2022-08-01T10:00:00Z"
+    assert not fresh.is_new({"id": 1, "time": "2022-08-01T10:00:00Z"})
+    assert fresh.get_device("sw1") == (True, "g1") and fresh.get_group("g1") == group_info("g1", "s1")
+    assert fresh.get_device("sw2") == (False, None)  # Its secrets group was dropped
+    # The position is checked again after the poll interval
+    assert MetadataCache(poll_interval=0, store=MetadataStore(path, "key material")).poll_due()
+
+
+def test_fresh_process_resolves_devices_without_nautobot(path, monkeypatch):
+    monkeypatch.setenv("NAUTOBOT_METADATA_CACHE_FILE", path)
+    monkeypatch.setenv("NAUTOBOT_CHANGELOG_POLL_INTERVAL", "60")
+    fleet = FakeFleet(devices=6, groups=3, secrets=2)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            expected = SecretGroupinfo().get_secrets_group_info_from_device_names(fleet.devices)
+            nautobot.reset_counts()
+            result = SecretGroupinfo().get_secrets_group_info_from_device_names(fleet.devices)
+    assert result == expected
+    assert nautobot.total_requests == 0
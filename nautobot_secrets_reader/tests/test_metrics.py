@@ -0,0 +1,61 @@
+import pytest
+
+from nautobot_secrets_reader import metrics
+from nautobot_secrets_reader.metrics import MetricsRecorder, SpanHook, install_hook, uninstall_hook
+from nautobot_secrets_reader.secread import SecretsReader
+from nautobot_secrets_reader.tests.benchmark import fake_environment
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+
+@pytest.fixture
+def recorder():
+    hook = install_hook(MetricsRecorder())
+    yield hook
+    uninstall_hook(hook)
+
+
+def test_no_hooks_no_overhead():
+    assert metrics.installed_hooks() == ()
+    assert metrics.timed("secret_server.get") is metrics.timed("nautobot.graphql")
+    metrics.count("cache_hits", cache="secrets")
+
+
+def test_recorder_and_spans_record_errors(recorder):
+    spans = []
+    span_hook = install_hook(SpanHook(spans.append))
+    try:
+        with metrics.timed("secret_server.get", secret="1"):
+            pass
+        with pytest.raises(ValueError):
+            with metrics.timed("secret_server.get", secret="2"):
+                raise ValueError("not found")
+    finally:
+        uninstall_hook(span_hook)
+    assert [(span.name, span.status, span.attributes["secret"]) for span in spans] == [
+        ("secret_server.get", "OK", "1"),
+        ("secret_server.get", "ERROR", "2"),
+    ]
+    assert spans[0].duration >= 0
+    snapshot = recorder.snapshot()
+    assert snapshot["calls"]["secret_server.get"]["count"] == 2
+    assert snapshot["events"]["errors"] == {(("error", "ValueError"), ("operation", "secret_server.get")): 1}
+
+
+def test_reader_reports_backend_calls_and_cache_events(recorder):
+    fleet = FakeFleet(devices=20, groups=2, secrets=2)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            reader = SecretsReader()
+            reader.get_credentials_for_device("device-00000")
+            reader.get_credentials_for_device("device-00002")
+    snapshot = recorder.snapshot()
+    assert snapshot["calls"]["nautobot.graphql"]["count"] == 2
+    assert snapshot["calls"]["secret_server.oauth_grant"]["count"] == 1
+    assert snapshot["calls"]["secret_server.get"]["count"] == 2
+    assert snapshot["events"]["cache_misses"] == {(("cache", "secrets"),): 2}
+    assert snapshot["events"]["cache_hits"] == {(("cache", "secrets"),): 2}
+    text = recorder.prometheus_text()
+    assert "# TYPE nautobot_secrets_reader_call_duration_seconds histogram" in text
+    assert 'nautobot_secrets_reader_call_duration_seconds_count{operation="secret_server.get"} 2' in text
+    assert 'nautobot_secrets_reader_call_duration_seconds_bucket{operation="nautobot.graphql",le="+Inf"} 2' in text
+    assert 'nautobot_secrets_reader_cache_hits_total{cache="secrets"} 2' in text
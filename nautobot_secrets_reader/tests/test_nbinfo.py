@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import pytest
+
+from nautobot_secrets_reader.metacache import MetadataCache
+from nautobot_secrets_reader.nbinfo import SecretGroupinfo
+
+
+def group(group_id):
+    return {"id": group_id, "name": group_id, "slug": group_id, "secretsgroupassociation_set": []}
+
+
+DEVICES = [
+    {"id": "d1", "name": "sw1", "secrets_group": group("g1"), "virtual_chassis": None},
+    {
+        "id": "d2",
+        "name": "stack-member",
+        "secrets_group": None,
+        "virtual_chassis": {"master": {"id": "d9", "secrets_group": group("g2")}},
+    },
+    {"id": "d3", "name": "no-group", "secrets_group": None, "virtual_chassis": None},
+    {"id": "d4", "name": "twice", "secrets_group": group("g1"), "virtual_chassis": None},
+    {"id": "d5", "name": "twice", "secrets_group": group("g2"), "virtual_chassis": None},
+]
+
+
+class FakeGraphQL:
+    """Answers the devices query from DEVICES."""
+
+    def __init__(self):
+        self.requests = []
+
+    def query(self, query, variables):
+        self.requests.append(variables)
+        devices = [device for device in DEVICES if device["name"] in variables["device_names"]]
+        return SimpleNamespace(json={"data": {"devices": devices}})
+
+
+class FakeSession:
+    """Answers the object-changes requests from `changes`."""
+
+    def __init__(self):
+        self.changes = []
+        self.requests = []
+
+    def get(self, url, params, headers):
+        self.requests.append(params)
+        if "changed_object_type" in params:
+            results = [
+                change
+                for change in self.changes
+                if change["changed_object_type"] == params["changed_object_type"]
+                and change["time"] >= params.get("time_after", "")
+            ]
+        else:
+            results = self.changes[-1:]
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: {"results": results, "next": None})
+
+
+@pytest.fixture
+def nbinfo():
+    nb = SecretGroupinfo(page_size=2, metadata_cache=MetadataCache(poll_interval=0))
+    nb.nautobot = SimpleNamespace(
+        graphql=FakeGraphQL(), http_session=FakeSession(), base_url="https://nautobot/api", headers={}
+    )
+    nb.nautobot.http_session.changes.append(
+        {"id": 1, "time": "2022-08-01T10:00:00Z", "changed_object_type": "dcim.site"}
+    )
+    return nb
+
+
+def test_get_secrets_group_info_from_device_names(nbinfo):
+    result = nbinfo.get_secrets_group_info_from_device_names(["sw1", "stack-member", "no-group", "missing", "twice"])
+    assert [request["device_names"] for request in nbinfo.nautobot.graphql.requests] == [
+        ["sw1", "stack-member"],
+        ["no-group", "missing"],
+        ["twice"],
+    ]
+    assert result["sw1"]["secrets_group"]["id"] == "g1"
+    assert result["stack-member"]["secrets_group"]["id"] == "g2"
+    assert result["no-group"] is None
+    assert result["missing"] is None
+    assert "twice" not in result
+
+
+def test_get_secrets_group_info_from_device_name_single_request(nbinfo):
+    assert nbinfo.get_secrets_group_id_from_device_name("stack-member") == "g2"
+    assert len(nbinfo.nautobot.graphql.requests) == 1
+
+
+def test_metadata_cache_invalidated_by_change_log(nbinfo):
+    graphql = nbinfo.nautobot.graphql
+    session = nbinfo.nautobot.http_session
+    nbinfo.get_secrets_group_info_from_device_names(["sw1", "stack-member", "no-group"])
+    assert len(graphql.requests) == 2
+    nbinfo.get_secrets_group_info_from_device_names(["sw1", "stack-member", "no-group"])
+    assert nbinfo.get_secrets_group_info_by_id("g2")["secrets_group"]["id"] == "g2"
+    assert len(graphql.requests) == 2
+    # The virtual chassis master was changed
+    session.changes.append(
+        {"id": 2, "time": "2022-08-01T11:00:00Z", "changed_object_type": "dcim.device", "changed_object_id": "d9"}
+    )
+    nbinfo.get_secrets_group_info_from_device_names(["sw1", "stack-member", "no-group"])
+    assert graphql.requests[-1] == {"device_names": ["stack-member"]}
+    # An association of group g1 was changed
+    session.changes.append(
+        {
+            "id": 3,
+            "time": "2022-08-01T12:00:00Z",
+            "changed_object_type": "extras.secretsgroupassociation",
+            "changed_object_id": "a1",
+            "object_data": {"group": "g1"},
+        }
+    )
+    nbinfo.get_secrets_group_info_from_device_names(["sw1", "stack-member"])
+    assert graphql.requests[-1] == {"device_names": ["sw1"]}
+    assert nbinfo.metadata_cache.marker == "2022-08-01T12:00:00Z"
+
+
+def test_metadata_cache_disabled_without_change_log(nbinfo):
+    nbinfo.nautobot.http_session = None
+    nbinfo.get_secrets_group_info_from_device_names(["sw1"])
+    nbinfo.get_secrets_group_info_from_device_names(["sw1"])
+    assert len(nbinfo.nautobot.graphql.requests) == 2
@@ -0,0 +1,112 @@
+import logging
+import sys
+
+import pytest
+
+from nautobot_secrets_reader import providers
+from nautobot_secrets_reader.cache import SecretCache
+from nautobot_secrets_reader.delinea import ThycoticSecretServerSecretsProvider, ThycoticSecretServerSecretsReader
+from nautobot_secrets_reader.providers import (
+    SecretsProvider,
+    available_providers,
+    get_provider_class,
+    register_provider,
+)
+from nautobot_secrets_reader.secread import SecretsReader
+
+
+class CountingProvider(SecretsProvider):
+    """Returns the parameter `value` and records the fetch_many() calls."""
+
+    slugs = ("counting",)
+    calls = []
+
+    def fetch_many(self, parameters_list):
+        self.calls.append(parameters_list)
+        return [parameters["value"] for parameters in parameters_list]
+
+
+def association(provider, secret_type, **parameters):
+    return dict(
+        access_type="GENERIC",
+        secret_type=secret_type,
+        secret=dict(
+            id=secret_type, provider=provider, name=secret_type, slug=secret_type, description="", parameters=parameters
+        ),
+    )
+
+
+def test_builtin_providers():
+    assert {"environment-variable", "text-file", "thycotic-tss-id", "thycotic-tss-path"} <= set(available_providers())
+    assert get_provider_class("thycotic-tss-path") is ThycoticSecretServerSecretsProvider
+    assert get_provider_class("unknown") is None
+
+
+def test_missing_entry_points_are_reported(monkeypatch, caplog):
+    # Python 3.7 without the importlib-metadata backport
+    monkeypatch.setitem(sys.modules, "importlib.metadata", None)
+    monkeypatch.setitem(sys.modules, "importlib_metadata", None)
+    monkeypatch.setattr(providers, "_entry_points_loaded", False)
+    with caplog.at_level(logging.WARNING):
+        assert "thycotic-tss-id" in available_providers()
+    assert "install importlib-metadata" in caplog.text
+
+
+def test_environment_and_text_file_providers(monkeypatch, tmp_path):
+    monkeypatch.setenv("DEVICE_PASSWORD", "env-secret")
+    secret_file = tmp_path / "secret.txt"
+    secret_file.write_text("file-secret\n")
+    group = {
+        "secrets_group": {
+            "secretsgroupassociation_set": [
+                association("environment-variable", "PASSWORD", variable="DEVICE_PASSWORD"),
+                association("text-file", "SECRET", path=str(secret_file)),
+                association("environment-variable", "TOKEN", variable="UNDEFINED_VARIABLE"),
+            ]
+        }
+    }
+    credentials = SecretsReader().read_credentials(group)
+    assert [cred["value"] for cred in credentials] == ["env-secret", "file-secret", ""]
+
+
+def test_read_credentials_one_call_per_provider():
+    register_provider(CountingProvider)
+    CountingProvider.calls.clear()
+    group = {
+        "secrets_group": {
+            "secretsgroupassociation_set": [
+                association("counting", "USERNAME", value="user"),
+                association("text-file", "SECRET", path="/nonexistent"),
+                association("counting", "PASSWORD", value="pwd"),
+            ]
+        }
+    }
+    reader = SecretsReader()
+    credentials = reader.read_credentials(group)
+    assert [cred["value"] for cred in credentials] == ["user", "", "pwd"]
+    assert CountingProvider.calls == [[{"value": "user"}, {"value": "pwd"}]]
+    with pytest.raises(ValueError):
+        reader.read_credentials({"secrets_group": {"secretsgroupassociation_set": [association("unknown", "TOKEN")]}})
+
+
+def test_thycotic_provider_collapses_fields_of_one_secret(monkeypatch):
+    queried = []
+
+    def get_secret_field_values(self, field_names, secret_id=None, secret_path=None):
+        queried.append((secret_id or secret_path, field_names))
+        fields = {"username": "user", "password": "pwd"}
+        return {name: fields[name] for name in field_names if name in fields}
+
+    monkeypatch.setattr(ThycoticSecretServerSecretsReader, "get_secret_field_values", get_secret_field_values)
+    provider = ThycoticSecretServerSecretsProvider(cache=SecretCache())
+    values = provider.fetch_many(
+        [
+            dict(secret_id=1, secret_selected_value="username"),
+            dict(secret_id=1, secret_selected_value="password"),
+            dict(secret_path="/a/b", secret_selected_value="password"),
+            dict(secret_id=1, secret_selected_value="notes"),
+        ]
+    )
+    assert values[:3] == ["user", "pwd", "pwd"]
+    assert isinstance(values[3], KeyError)
+    assert queried == [(1, ["username", "password", "notes"]), ("/a/b", ["password"])]
@@ -0,0 +1,183 @@
+import time
+
+import pytest
+import requests
+
+from nautobot_secrets_reader import resilience
+from nautobot_secrets_reader.cache import SecretCache, is_stale
+from nautobot_secrets_reader.resilience import (
+    BackendUnavailableError,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    bounded_timeout,
+    current_deadline,
+    deadline,
+)
+from nautobot_secrets_reader.secread import SecretsReader
+from nautobot_secrets_reader.sessions import PooledSession
+from nautobot_secrets_reader.tests.benchmark import fake_environment
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock of the resilience module, advanced by the test."""
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_deadline_caps_timeouts(clock):
+    assert current_deadline() is None
+    assert bounded_timeout((5.0, 60.0)) == (5.0, 60.0)
+    with deadline(2.0) as outer:
+        assert current_deadline() is outer
+        assert bounded_timeout((5.0, 60.0)) == (2.0, 2.0)
+        assert bounded_timeout(None) == 2.0
+        with deadline(10.0) as inner:
+            assert inner is outer  # The enclosing deadline expires first
+        with deadline(1.0) as inner:
+            assert bounded_timeout(1.5) == 1.0
+        with deadline(0):
+            assert current_deadline() is outer
+        clock[0] += 2.0
+        with pytest.raises(DeadlineExceededError):
+            bounded_timeout((5.0, 60.0))
+    assert current_deadline() is None
+
+
+def test_circuit_breaker_backs_off_exponentially(clock):
+    breaker = CircuitBreaker("backend", failures=2, reset_timeout=1.0, max_reset_timeout=3.0)
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    for open_time in (1.0, 2.0, 3.0, 3.0):  # Doubled after every failed trial, at most max_reset_timeout
+        clock[0] += open_time - 0.1
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        clock[0] += 0.1
+        assert breaker.state == "half-open"
+        breaker.before_call()  # The trial request
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()  # Only one trial at a time
+        breaker.record(False)
+    clock[0] += 3.0
+    breaker.before_call()
+    breaker.record(None)  # e.g. the deadline of the caller expired: the next request is a trial again
+    breaker.before_call()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.openings == 0
+    # Disabled
+    disabled = CircuitBreaker("backend", failures=0)
+    for _ in range(10):
+        disabled.before_call()
+        disabled.record(False)
+    assert disabled.state == "closed"
+
+
+def test_stale_entries_are_kept_for_get_stale():
+    cache = SecretCache(ttl=0.05, stale_ttl=60)
+    cache.set(("p", "1"), {"password": "pwd"})
+    cache.set(("p", "2"), "value")
+    assert cache.get_stale(("p", "1")) == {"password": "pwd"}
+    assert not is_stale(cache.get_stale(("p", "1"))["password"])
+    time.sleep(0.06)
+    assert cache.get(("p", "1")) is None and ("p", "1") not in cache
+    stale = cache.get_stale(("p", "1"))
+    assert stale == {"password": "pwd"} and is_stale(stale["password"])
+    assert is_stale(cache.get_stale(("p", "2")))
+    assert cache.get_stale(("p", "3")) is None
+    # Without stale_ttl, expired entries are dropped
+    cache = SecretCache(ttl=0.01)
+    cache.set(("p", "1"), "value")
+    time.sleep(0.02)
+    assert cache.get(("p", "1")) is None and cache.get_stale(("p", "1")) is None and len(cache) == 0
+
+
+def test_session_requests_are_bounded_by_the_deadline():
+    fleet = FakeFleet(devices=1, groups=1, secrets=1)
+    with FakeSecretServer(fleet, latency=0.5) as secret_server:
+        session = PooledSession(retries=3, backoff_factor=1.0)
+        started = time.monotonic()
+        with deadline(0.1), pytest.raises(requests.RequestException):
+            session.get(f"{secret_server.url}/SecretServer/api/v1/secrets/1")
+        assert time.monotonic() - started < 0.4  # Not retried after the deadline
+        with deadline(0.1):
+            time.sleep(0.1)
+            with pytest.raises(DeadlineExceededError):
+                session.get(f"{secret_server.url}/SecretServer/api/v1/secrets/1")
+        session.close()
+
+
+@pytest.fixture
+def fleet_servers(monkeypatch):
+    monkeypatch.setenv("SECRET_SERVER_HTTP_RETRIES", "0")
+    monkeypatch.setenv("SECRET_SERVER_FIELD_FETCH_MAX", "0")
+    fleet = FakeFleet(devices=8, groups=4, secrets=4)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            yield fleet, secret_server
+
+
+def test_stale_secret_served_when_the_deadline_expires(fleet_servers, monkeypatch):
+    monkeypatch.setenv("SECRETS_READER_STALE_TTL", "60")
+    fleet, secret_server = fleet_servers
+    reader = SecretsReader(cache_ttl=0.1)
+    parameters = {"secret_id": "1", "secret_selected_value": "password"}
+    assert reader.get_secret_tss(parameters) == "pwd-1"
+    credentials = reader.get_credentials_for_device("device-00000", access_type="SSH")
+    assert not credentials.stale
+    time.sleep(0.15)
+    secret_server.latency = 1.0
+    started = time.monotonic()
+    value = reader.get_secret_tss(parameters, timeout=0.2)
+    assert value == "pwd-1" and is_stale(value)
+    credentials = reader.get_credentials_for_device("device-00000", access_type="SSH", timeout=0.2)
+    assert credentials.filter_access_type("SSH") == dict(username="user-1", password="pwd-1")
+    assert credentials.stale and credentials[1].stale
+    assert time.monotonic() - started < 0.9
+    # Secrets never read are not served, the error is raised instead of returning an empty value
+    with pytest.raises(DeadlineExceededError):
+        reader.get_secret_tss({"secret_id": "2", "secret_selected_value": "password"}, timeout=0.2)
+    with pytest.raises(BackendUnavailableError):
+        reader.get_credentials_for_device("device-00001", access_type="SSH", timeout=0.2)
+
+
+def test_circuit_opens_while_secret_server_times_out(fleet_servers, monkeypatch):
+    monkeypatch.setenv("SECRET_SERVER_HTTP_READ_TIMEOUT", "0.1")
+    monkeypatch.setenv("SECRET_SERVER_CIRCUIT_FAILURES", "2")
+    monkeypatch.setenv("SECRET_SERVER_CIRCUIT_RESET", "0.2")
+    fleet, secret_server = fleet_servers
+    reader = SecretsReader(cache_ttl=0)
+    parameters = {"secret_id": "1", "secret_selected_value": "password"}
+    assert reader.get_secret_tss(parameters) == "pwd-1"
+    secret_server.latency = 0.3
+    for _ in range(2):
+        with pytest.raises(BackendUnavailableError, match="unavailable"):
+            reader.get_secret_tss(parameters)
+    secret_server.reset_counts()
+    started = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        reader.get_secret_tss(parameters)
+    assert time.monotonic() - started < 0.05 and secret_server.total_requests == 0
+    secret_server.latency = 0
+    time.sleep(0.25)
+    assert reader.get_secret_tss(parameters) == "pwd-1"  # The trial request closes the circuit
+    assert reader.tss._client().breaker.state == "closed"
+
+
+def test_bulk_deadline_reports_unfinished_devices(fleet_servers):
+    fleet, secret_server = fleet_servers
+    reader = SecretsReader(max_workers=4)
+    secret_server.latency = 0.5
+    started = time.monotonic()
+    result = reader.get_credentials_for_devices(fleet.devices, access_type="SSH", timeout=0.2)
+    assert time.monotonic() - started < 0.45
+    assert sorted(result.errors) == sorted(fleet.devices) and not result.credentials
+    assert all("deadline" in error for error in result.errors.values())
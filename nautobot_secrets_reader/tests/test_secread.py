@@ -1,6 +1,7 @@
 import pytest
 from pprint import pprint
 
+from nautobot_secrets_reader.delinea import ThycoticSecretServerSecretsReader
 from nautobot_secrets_reader.nbinfo import SecretGroupinfo
 from nautobot_secrets_reader.secread import SecretsReader
 
@@ -41,3 +42,118 @@ def test_secrets_reader_get_credentials_for_secrets_group_id(nbconn):
     assert generic is not None
     print("GENERIC", end=": ")
     pprint(generic, width=120)
+
+
+def fake_group(group_id, *secret_ids):
+    """Returns a secrets group query result with a username and password association per secret."""
+    associations = []
+    for secret_id in secret_ids:
+        for secret_type in ("USERNAME", "PASSWORD"):
+            associations.append(
+                dict(
+                    access_type="SSH",
+                    secret_type=secret_type,
+                    secret=dict(
+                        id=f"nb-{secret_id}",
+                        provider="thycotic-tss-id",
+                        name=f"Secret {secret_id}",
+                        slug=f"secret-{secret_id}",
+                        description="",
+                        parameters=dict(secret_id=secret_id, secret_selected_value=secret_type.lower()),
+                    ),
+                )
+            )
+    return {
+        "secrets_group": {
+            "id": group_id,
+            "name": group_id,
+            "slug": group_id,
+            "secretsgroupassociation_set": associations,
+        }
+    }
+
+
+@pytest.fixture
+def offline_reader(monkeypatch):
+    """SecretsReader with stubbed Nautobot and Secret Server, counting the calls."""
+    calls = dict(devices=[], groups=[], secrets=[])
+    device_groups = {"sw1": "g1", "sw2": "g1", "sw3": "g2", "sw4": None, "sw5": "g3"}
+    groups = {"g1": fake_group("g1", 1), "g2": fake_group("g2", 1, 2), "g3": fake_group("g3", 99)}
+
+    def get_device_groups(self, device_names, page_size=None):
+        calls["devices"].append(list(device_names))
+        return {
+            name: groups[device_groups[name]] if device_groups[name] else None
+            for name in device_names
+            if name in device_groups
+        }
+
+    def get_group(self, secrets_group_id):
+        calls["groups"].append(secrets_group_id)
+        return groups[secrets_group_id]
+
+    def get_fields(self, field_names, secret_id=None, secret_path=None):
+        calls["secrets"].append(secret_id)
+        if secret_id == 99:
+            raise ValueError("Thycotic Secret Server error: Access denied")
+        fields = dict(username=f"user-{secret_id}", password=f"pwd-{secret_id}")
+        return {name: fields[name] for name in field_names if name in fields}
+
+    monkeypatch.setattr(SecretGroupinfo, "nb_connection", object())
+    monkeypatch.setattr(SecretGroupinfo, "get_secrets_group_info_from_device_names", get_device_groups)
+    monkeypatch.setattr(SecretGroupinfo, "get_secrets_group_info_by_id", get_group)
+    monkeypatch.setattr(ThycoticSecretServerSecretsReader, "get_secret_field_values", get_fields)
+    return SecretsReader(max_workers=4), calls
+
+
+def test_secrets_reader_get_credentials_for_devices(offline_reader):
+    secreader, calls = offline_reader
+    result = secreader.get_credentials_for_devices(["sw1", "sw2", "sw3", "sw4", "sw5", "missing", "sw1"])
+    assert calls["devices"] == [["sw1", "sw2", "sw3", "sw4", "sw5", "missing"]]
+    assert calls["groups"] == []
+    assert sorted(calls["secrets"]) == [1, 2, 99]
+    assert set(result.credentials) == {"sw1", "sw2", "sw3", "sw4"}
+    assert set(result.errors) == {"sw5", "missing"}
+    assert "Access denied" in result.errors["sw5"]
+    assert result.credentials["sw4"] == []
+    assert secreader.filter_access_type(result.credentials["sw3"], "ssh") == dict(username="user-2", password="pwd-2")
+
+
+def test_secrets_reader_get_credentials_for_secrets_group_ids(offline_reader):
+    secreader, calls = offline_reader
+    result = secreader.get_credentials_for_secrets_group_ids(["g1", "g2"], max_workers=2)
+    assert sorted(calls["secrets"]) == [1, 2]
+    assert [cred["value"] for cred in result.credentials["g1"]] == ["user-1", "pwd-1"]
+    assert len(result.credentials["g2"]) == 4
+    assert result.errors == {}
+
+
+def mixed_group():
+    """Secrets group with SSH and HTTP credentials on different secrets."""
+    group = fake_group("mixed", 1, 2)
+    for association in group["secrets_group"]["secretsgroupassociation_set"][2:]:
+        association["access_type"] = "HTTP"
+    return group
+
+
+def test_secrets_reader_read_credentials_filter_pushdown(offline_reader):
+    secreader, calls = offline_reader
+    credentials = secreader.read_credentials(mixed_group(), access_type="ssh", secret_type=["Password"])
+    assert [(cred["access_type"], cred["secret_type"], cred["value"]) for cred in credentials] == [
+        ("SSH", "PASSWORD", "pwd-1")
+    ]
+    assert calls["secrets"] == [1]
+
+
+def test_secrets_reader_read_credentials_lazy(offline_reader):
+    secreader, calls = offline_reader
+    credentials = secreader.read_credentials(mixed_group(), lazy=True)
+    assert len(credentials) == 4
+    assert calls["secrets"] == []
+    http_password = credentials[3]
+    assert not http_password.loaded
+    assert http_password.value == "pwd-2"
+    assert http_password.get("value") == "pwd-2"
+    assert http_password.loaded
+    assert calls["secrets"] == [2]
+    assert secreader.filter_access_type(credentials, "SSH") == dict(username="user-1", password="pwd-1")
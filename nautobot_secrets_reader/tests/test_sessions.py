@@ -0,0 +1,63 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from nautobot_secrets_reader.sessions import PooledSession, get_session, reset_sessions, session_settings
+
+
+@pytest.fixture
+def flaky_server():
+    """HTTP server answering 503 to the first request of every path, returns the request count."""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            requests.append((self.path, self.client_address[1]))
+            status = 503 if len([path for path, _ in requests if path == self.path]) == 1 else 200
+            body = b"ok" if status == 200 else b"busy"
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_settings_from_environment(monkeypatch):
+    monkeypatch.setenv("SECRET_SERVER_HTTP_POOL_SIZE", "4")
+    monkeypatch.setenv("SECRET_SERVER_HTTP_READ_TIMEOUT", "7.5")
+    monkeypatch.setenv("SECRET_SERVER_HTTP_RETRIES", "2")
+    reset_sessions("SECRET_SERVER")
+    settings = session_settings("SECRET_SERVER")
+    assert settings["pool_size"] == 4 and settings["read_timeout"] == 7.5
+    session = get_session("SECRET_SERVER")
+    assert get_session("SECRET_SERVER") is session
+    assert session.timeout == (5.0, 7.5)
+    adapter = session.get_adapter("https://pw.example.local")
+    assert adapter.max_retries.total == 2
+    assert adapter._pool_maxsize == 4
+    reset_sessions("SECRET_SERVER")
+    assert get_session("SECRET_SERVER") is not session
+    reset_sessions()
+
+
+def test_session_retries_and_keeps_connection_alive(flaky_server):
+    url, requests = flaky_server
+    session = PooledSession(retries=2, backoff_factor=0)
+    assert session.get(f"{url}/secrets/1").text == "ok"
+    assert session.get(f"{url}/secrets/2").text == "ok"
+    assert [path for path, _ in requests] == ["/secrets/1", "/secrets/1", "/secrets/2", "/secrets/2"]
+    # All requests used one kept-alive connection
+    assert len({port for _, port in requests}) == 1
+    session.close()
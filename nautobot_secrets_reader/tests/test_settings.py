@@ -0,0 +1,75 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from nautobot_secrets_reader.helpers import is_truthy
+from nautobot_secrets_reader.settings import HttpSettings, Settings, get_settings, reset_settings
+
+
+def test_is_truthy():
+    assert is_truthy("True") and is_truthy("yes") and is_truthy("1") and is_truthy(True)
+    assert not is_truthy("False") and not is_truthy("off") and not is_truthy("0") and not is_truthy(False)
+    with pytest.raises(ValueError):
+        is_truthy("maybe")
+
+
+def test_settings_from_environ():
+    settings = Settings.from_environ(
+        {
+            "NAUTOBOT_API_ENDPOINT": "https://nautobot.test",
+            "NAUTOBOT_METADATA_CACHE": "off",
+            "SECRET_SERVER_IS_CLOUD_BASED": "yes",
+            "SECRET_SERVER_PASSWORD": "pwd",
+            "SECRET_SERVER_HTTP_RETRIES": "1",
+            "SECRETS_READER_MAX_WORKERS": "3",
+        }
+    )
+    assert settings.nautobot_api_endpoint == "https://nautobot.test"
+    assert settings.nautobot_metadata_cache is False
+    assert settings.secret_server_is_cloud_based is True
+    assert settings.secrets_reader_max_workers == 3
+    assert settings.http("SECRET_SERVER") == HttpSettings(retries=1)
+    assert settings.http("NAUTOBOT") == HttpSettings()
+    assert "pwd" not in repr(settings)
+    with pytest.raises(ValueError):
+        Settings.from_environ({"SECRETS_READER_MAX_WORKERS": "many"})
+
+
+def test_settings_parsed_once(monkeypatch):
+    monkeypatch.setenv("SECRETS_READER_MAX_WORKERS", "5")
+    settings = get_settings()
+    monkeypatch.setenv("SECRETS_READER_MAX_WORKERS", "6")
+    assert get_settings() is settings and settings.secrets_reader_max_workers == 5
+    reset_settings()
+    assert get_settings().secrets_reader_max_workers == 6
+    reset_settings(Settings(secrets_reader_max_workers=2))
+    assert get_settings().secrets_reader_max_workers == 2
+
+
+IMPORT_CHECK = """
+import json, logging, sys
+import nautobot_secrets_reader
+from nautobot_secrets_reader import settings
+after_import = set(sys.modules)
+reader = nautobot_secrets_reader.SecretsReader()
+print(json.dumps(dict(
+    after_import=sorted(
+        name
+        for name in ("pynautobot", "thycotic", "dotenv", "distutils", "requests", "urllib3", "sqlite3")
+        if name in after_import
+    ),
+    after_reader=sorted(name for name in ("pynautobot", "thycotic", "distutils") if name in sys.modules),
+    handlers=len(logging.getLogger("nautobot_secrets_reader.secread").handlers),
+)))
+"""
+
+
+def test_import_has_no_side_effects():
+    """Importing the package loads no backend libraries; creating a reader connects nowhere."""
+    output = subprocess.run([sys.executable, "-c", IMPORT_CHECK], check=True, capture_output=True, text=True)
+    result = json.loads(output.stdout)
+    assert result["after_import"] == []
+    assert result["after_reader"] == []
+    assert result["handlers"] == 0
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from nautobot_secrets_reader.agent import CredentialAgent
+from nautobot_secrets_reader.cli import main
+from nautobot_secrets_reader.secread import SecretsReader, WarmResult
+from nautobot_secrets_reader.settings import reset_settings
+from nautobot_secrets_reader.tests.benchmark import fake_environment
+from nautobot_secrets_reader.tests.fakes import FakeFleet, FakeNautobot, FakeSecretServer
+
+
+def test_warm_reads_filtered_devices_into_cache():
+    fleet = FakeFleet(devices=30, groups=4, secrets=3)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            reader = SecretsReader()
+            reader.nbot.page_size = 5  # Devices by filter in several pages
+            result = reader.warm({"site": "site-1"}, device_names=["device-00000", "unknown"])
+            calls = nautobot.total_requests + secret_server.total_requests
+            credentials = reader.get_credentials_for_device("device-00004")
+            assert nautobot.total_requests + secret_server.total_requests == calls
+    assert result == WarmResult(devices=12, secrets_groups=4, secrets=6, errors={})
+    assert [cred["value"] for cred in credentials] == ["user-1", "pwd-1", "pwd-2"]
+
+
+def test_warm_command_warms_agent(tmp_path, monkeypatch, capsys):
+    socket_path = str(tmp_path / "agent.sock")
+    fleet = FakeFleet(devices=30, groups=4, secrets=3)
+    with FakeNautobot(fleet) as nautobot, FakeSecretServer(fleet) as secret_server:
+        with fake_environment(nautobot, secret_server):
+            with CredentialAgent(socket_path=socket_path, refresh_ahead=0) as agent:
+                monkeypatch.setenv("SECRETS_READER_USE_AGENT", "True")
+                monkeypatch.setenv("SECRETS_READER_AGENT_SOCKET", socket_path)
+                reset_settings()
+                assert main(["warm", "--site", "site-2", "--access-type", "SSH"]) == 0
+                stats = agent.reader.cache_stats()
+    assert json.loads(capsys.readouterr().out) == dict(devices=10, secrets_groups=4, secrets=3, errors={})
+    assert stats["entries"] == 3
+
+
+def test_warm_command_requires_agent_and_devices(tmp_path, monkeypatch):
+    monkeypatch.setenv("SECRETS_READER_AGENT_SOCKET", str(tmp_path / "agent.sock"))
+    with pytest.raises(SystemExit, match="Select the devices"):
+        main(["warm"])
+    with pytest.raises(SystemExit, match="not running"):
+        main(["warm", "--site", "site-1"])